@@ -0,0 +1,340 @@
+# Copyright 2023 Ant Group Co., Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Benchmark of psi on synthetic inputs, e.g.
+
+    python3 -m teeapps.biz.benchmarks.psi_benchmark --rows 1000000 \
+        --memory_budget 2048 0 --join_method hash auto --output psi.json
+
+Every case runs in a fresh process, so that its peak RSS is its own. Results
+are written as json, with phase times, peak RSS and the environment.
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from concurrent import futures
+from typing import NamedTuple
+
+import numpy as np
+import pandas
+
+from teeapps.biz.common import common
+from teeapps.biz.psi import psi
+
+KEY_TYPE_INT = "int"
+KEY_TYPE_STR = "str"
+# an int column and a str column
+KEY_TYPE_COMPOSITE = "composite"
+KEY_TYPES = [KEY_TYPE_INT, KEY_TYPE_STR, KEY_TYPE_COMPOSITE]
+# second key column of composite keys
+COMPOSITE_KEY_BASE = 1000
+
+
+class DataSpec(NamedTuple):
+    """Synthetic inputs of psi.
+
+    Every party has rows rows, of which rows * (1 - dup_rate) have distinct
+    keys and the others repeat them. overlap of the distinct keys are shared
+    by all parties, the others are only in one party.
+    """
+
+    parties: int = 2
+    rows: int = 100000
+    col_num: int = 10
+    key_type: str = KEY_TYPE_INT
+    overlap: float = 0.5
+    dup_rate: float = 0.0
+    sorted_keys: bool = False
+    seed: int = 0
+
+
+class EngineCase(NamedTuple):
+    """psi attrs of a benchmark case."""
+
+    memory_budget: int = psi.DEFAULT_MEMORY_BUDGET_IN_MB
+    worker_num: int = psi.DEFAULT_WORKER_NUM
+    join_method: str = psi.DEFAULT_JOIN_METHOD
+    bloom_filter_fpr: float = psi.DEFAULT_BLOOM_FILTER_FPR
+    key_fingerprint: bool = psi.DEFAULT_KEY_FINGERPRINT
+    join_type: str = psi.DEFAULT_JOIN_TYPE
+
+
+def gen_key_ids(spec: DataSpec, party: int, rng: np.random.Generator) -> np.ndarray:
+    distinct_num = spec.rows - round(spec.rows * spec.dup_rate)
+    shared_num = round(distinct_num * spec.overlap)
+    # private keys of parties are in disjoint ranges
+    private_base = shared_num + party * spec.rows
+    distinct_ids = np.concatenate(
+        [
+            np.arange(shared_num),
+            np.arange(private_base, private_base + distinct_num - shared_num),
+        ]
+    )
+    ids = np.concatenate(
+        [distinct_ids, rng.choice(distinct_ids, spec.rows - distinct_num)]
+    )
+    return np.sort(ids) if spec.sorted_keys else rng.permutation(ids)
+
+
+def gen_key_columns(spec: DataSpec, ids: np.ndarray) -> tuple:
+    """Returns key columns and their types."""
+    if spec.key_type == KEY_TYPE_INT:
+        return {"id": ids}, ["int"]
+    if spec.key_type == KEY_TYPE_STR:
+        # zero padded, so that strings are sorted the same as ids
+        return {"id": np.char.zfill(ids.astype(str), 12)}, ["str"]
+    assert (
+        spec.key_type == KEY_TYPE_COMPOSITE
+    ), f"Key type should be one of {KEY_TYPES}, but got {spec.key_type}"
+    return {
+        "id1": ids // COMPOSITE_KEY_BASE,
+        "id2": np.char.zfill((ids % COMPOSITE_KEY_BASE).astype(str), 3),
+    }, ["int", "str"]
+
+
+def gen_inputs(spec: DataSpec, data_dir: str) -> list:
+    """Write csv files of all parties, and return their task inputs."""
+    inputs = []
+    for party in range(spec.parties):
+        rng = np.random.default_rng([spec.seed, party])
+        key_cols, key_types = gen_key_columns(spec, gen_key_ids(spec, party, rng))
+        features = [f"p{party}_f{i}" for i in range(spec.col_num)]
+        df = pandas.DataFrame(key_cols)
+        for feature in features:
+            df[feature] = rng.random(spec.rows).round(6)
+        data_path = os.path.join(data_dir, f"party{party}.csv")
+        common.write_csv_table([df], data_path)
+        inputs.append(
+            {
+                common.DATA_PATH: data_path,
+                common.SCHEMA: {
+                    common.IDS: list(key_cols),
+                    common.FEATURES: features,
+                    common.LABELS: [],
+                    common.ID_TYPES: key_types,
+                    common.FEATURE_TYPES: ["float"] * spec.col_num,
+                    common.LABEL_TYPES: [],
+                },
+                psi.KEY: list(key_cols),
+            }
+        )
+    return inputs
+
+
+def get_peak_rss_mb(who: int) -> float:
+    # ru_maxrss is in KB on linux
+    return resource.getrusage(who).ru_maxrss / 1024
+
+
+def count_lines(data_path: str) -> int:
+    with open(data_path, "rb") as data_f:
+        return sum(
+            block.count(b"\n")
+            for block in iter(lambda: data_f.read(common.COPY_BUFFER_SIZE), b"")
+        )
+
+
+def run_case(inputs: list, case: EngineCase, output_dir: str) -> dict:
+    """Run psi once in this process, and measure it."""
+    output = {
+        common.DATA_PATH: os.path.join(output_dir, "output.csv"),
+        common.DATA_SCHEMA_PATH: os.path.join(output_dir, "output_schema.json"),
+    }
+    task_config = {
+        common.COMPONENT_NAME: psi.COMPONENT_NAME,
+        common.INPUTS: inputs,
+        common.OUTPUTS: [output],
+        **case._asdict(),
+    }
+    timer = common.PhaseTimer()
+    start = time.perf_counter()
+    psi.run_psi(task_config, timer)
+    total_seconds = time.perf_counter() - start
+
+    result = {
+        "total_seconds": total_seconds,
+        "phases": {
+            name: {"seconds": seconds, "count": timer.counts[name]}
+            for name, seconds in timer.seconds.items()
+        },
+        "peak_rss_mb": get_peak_rss_mb(resource.RUSAGE_SELF),
+        # the max of partition workers, if any
+        "worker_peak_rss_mb": get_peak_rss_mb(resource.RUSAGE_CHILDREN),
+        # without the header
+        "output_rows": count_lines(output[common.DATA_PATH]) - 1,
+        "output_bytes": os.path.getsize(output[common.DATA_PATH]),
+    }
+    for path in output.values():
+        os.remove(path)
+    return result
+
+
+def run_isolated_case(inputs: list, case: EngineCase, output_dir: str) -> dict:
+    with futures.ProcessPoolExecutor(
+        1, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        return executor.submit(run_case, inputs, case, output_dir).result()
+
+
+def gen_env() -> dict:
+    env = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pandas.__version__,
+    }
+    if common.pyarrow is not None:
+        env["pyarrow"] = common.pyarrow.__version__
+    return env
+
+
+def run_benchmark(
+    specs: list, cases: list, repeat: int = 1, work_dir: str = None
+) -> dict:
+    """Run every case repeat times on the inputs of every spec.
+
+    Returns:
+        the environment, and a result per run with its spec and case.
+    """
+    results = []
+    with tempfile.TemporaryDirectory(dir=work_dir) as data_dir:
+        for spec in specs:
+            logging.info(f"Generating inputs: {spec._asdict()}")
+            start = time.perf_counter()
+            inputs = gen_inputs(spec, data_dir)
+            logging.info(f"Generated inputs in {time.perf_counter() - start:.3f}s")
+            for case, run in itertools.product(cases, range(repeat)):
+                logging.info(f"Running case {case._asdict()}, run {run}")
+                result = run_isolated_case(inputs, case, data_dir)
+                logging.info(
+                    f"Run in {result['total_seconds']:.3f}s, "
+                    f"peak RSS {result['peak_rss_mb']:.1f}MB"
+                )
+                results.append(
+                    {
+                        "data": spec._asdict(),
+                        "case": case._asdict(),
+                        "run": run,
+                        **result,
+                    }
+                )
+    return {"env": gen_env(), "results": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark psi on synthetic inputs.")
+    # every list option is a benchmark dimension, all combinations are run
+    parser.add_argument("--parties", type=int, nargs="+", default=[2])
+    parser.add_argument("--rows", type=int, nargs="+", default=[100000])
+    parser.add_argument("--col_num", type=int, nargs="+", default=[10])
+    parser.add_argument("--key_type", nargs="+", choices=KEY_TYPES, default=["int"])
+    parser.add_argument("--overlap", type=float, nargs="+", default=[0.5])
+    parser.add_argument("--dup_rate", type=float, nargs="+", default=[0.0])
+    parser.add_argument("--sorted_keys", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--memory_budget",
+        type=int,
+        nargs="+",
+        default=[psi.DEFAULT_MEMORY_BUDGET_IN_MB],
+    )
+    parser.add_argument(
+        "--worker_num", type=int, nargs="+", default=[psi.DEFAULT_WORKER_NUM]
+    )
+    parser.add_argument(
+        "--join_method",
+        nargs="+",
+        choices=psi.JOIN_METHODS,
+        default=[psi.DEFAULT_JOIN_METHOD],
+    )
+    parser.add_argument(
+        "--bloom_filter_fpr",
+        type=float,
+        nargs="+",
+        default=[psi.DEFAULT_BLOOM_FILTER_FPR],
+    )
+    parser.add_argument(
+        "--join_type",
+        nargs="+",
+        choices=psi.JOIN_TYPES,
+        default=[psi.DEFAULT_JOIN_TYPE],
+    )
+    parser.add_argument("--no_key_fingerprint", action="store_true")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--work_dir", help="where inputs are generated")
+    parser.add_argument("--output", default="psi_benchmark.json")
+    args = parser.parse_args()
+
+    specs = [
+        DataSpec(parties, rows, col_num, key_type, overlap, dup_rate)._replace(
+            sorted_keys=args.sorted_keys, seed=args.seed
+        )
+        for parties, rows, col_num, key_type, overlap, dup_rate in itertools.product(
+            args.parties,
+            args.rows,
+            args.col_num,
+            args.key_type,
+            args.overlap,
+            args.dup_rate,
+        )
+    ]
+    cases = [
+        EngineCase(
+            memory_budget,
+            worker_num,
+            join_method,
+            bloom_filter_fpr,
+            not args.no_key_fingerprint,
+            join_type,
+        )
+        for (
+            memory_budget,
+            worker_num,
+            join_method,
+            bloom_filter_fpr,
+            join_type,
+        ) in itertools.product(
+            args.memory_budget,
+            args.worker_num,
+            args.join_method,
+            args.bloom_filter_fpr,
+            args.join_type,
+        )
+    ]
+    report = run_benchmark(specs, cases, args.repeat, args.work_dir)
+    with open(args.output, "w") as output_f:
+        json.dump(report, output_f, indent=2)
+    logging.info(
+        f"Results of {len(report['results'])} runs are written to {args.output}"
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        stream=sys.stdout,
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+    )
+    main()
@@ -15,7 +15,9 @@
 
 import json
 import logging
+import math
 import sys
+from typing import NamedTuple
 
 import numpy as np
 import pandas
@@ -32,8 +34,15 @@ BUCKET_NUM = "bucket_num"
 MIN_ITEM_CNT_PER_BUCKET = "min_item_cnt_per_bucket"
 LABEL = "label"
 SCORE = "score"
+HEAD_FPR_THRESHOLDS = "head_fpr_thresholds"
+SKETCH_BIN_NUM = "sketch_bin_num"
 
-HEAD_FPR_THRESHOLDS = [0.001, 0.005, 0.01, 0.05, 0.1, 0.2]
+DEFAULT_HEAD_FPR_THRESHOLDS = [0.001, 0.005, 0.01, 0.05, 0.1, 0.2]
+# scores >= F1_THRESHOLD are predicted positive by f1_score of summary report
+F1_THRESHOLD = 0.5
+# 0 loads all rows and evaluates exactly, otherwise rows are read by chunks
+# into score histograms of about so many bins
+DEFAULT_SKETCH_BIN_NUM = 0
 
 # eq_bin_report
 START_VALUE = "start_value"
@@ -303,11 +312,37 @@ def init_bin_report() -> dict:
     return report
 
 
+class CumulativeCounts(NamedTuple):
+    """
+    cumulative counts of items sorted by score, an item is a row or a bin of
+    rows, element i sums items [0, i), so items [x, y) sum to
+    element y - element x
+    """
+
+    positives: np.ndarray
+    negatives: np.ndarray
+    rows: np.ndarray
+    scores: np.ndarray
+
+
+def gen_cumsum(values: np.ndarray) -> np.ndarray:
+    return np.concatenate([[0], np.cumsum(values)])
+
+
+def gen_cumulative_counts(y_true: np.ndarray, score: np.ndarray) -> CumulativeCounts:
+    """cumulative counts of rows sorted by score"""
+    return CumulativeCounts(
+        gen_cumsum(y_true == 1),
+        gen_cumsum(y_true == 0),
+        np.arange(len(score) + 1),
+        gen_cumsum(score),
+    )
+
+
 def fill_bin_report(
-    y_true: np.ndarray,
-    score: np.ndarray,
-    total_pos_cnt: int,
-    total_neg_cnt: int,
+    start_values: np.ndarray,
+    end_values: np.ndarray,
+    cumulative_counts: CumulativeCounts,
     start: int,
     end: int,
     min_item_cnt_per_bucket: int,
@@ -318,34 +353,42 @@ def fill_bin_report(
     index < start, the label is 0
     when calculate interval [x, y]
     start = x, end = y + 1
+    indexes are of items, whose min and max scores are start_values and
+    end_values, counts of any interval are taken from cumulative_counts in O(1)
     """
     if end <= start:
         return
-    if (end - start) < min_item_cnt_per_bucket:
+    row_cnt = int(cumulative_counts.rows[end] - cumulative_counts.rows[start])
+    if row_cnt < min_item_cnt_per_bucket:
         raise RuntimeError(
             (
                 f"One bin doesn't meet min_item_cnt_per_bucket requirement. "
-                f"Items num = {end-start}, min_item_cnt_per_bucket={min_item_cnt_per_bucket}"
+                f"Items num = {row_cnt}, min_item_cnt_per_bucket={min_item_cnt_per_bucket}"
             )
         )
     # prepare data
-    total_cnt = total_pos_cnt + total_neg_cnt
-    y_pred = np.array([(1 if i >= start else 0) for i in range(total_cnt)])
-    fp = sum(1 for i in range(total_cnt) if y_true[i] == 0 and y_pred[i] == 1)
-    cumu_pos_cnt = np.sum(y_true[start:] == 1)
-    cumu_neg_cnt = np.sum(y_true[start:] == 0)
-    score_sum = sum(score[start:end])
-
-    # fill report
-    report[POSITIVE] = np.sum(y_true[start:end] == 1)
-    report[NEGATIVE] = np.sum(y_true[start:end] == 0)
-    report[TOTAL] = end - start
-    report[START_VALUE] = score[start]
-    report[END_VALUE] = score[end - 1]
-    report[PRECISION] = metrics.precision_score(y_true, y_pred)
-    report[RECALL] = metrics.recall_score(y_true, y_pred)
+    cum_pos_cnts, cum_neg_cnts, cum_row_cnts, cum_scores = cumulative_counts
+    total_pos_cnt = int(cum_pos_cnts[-1])
+    total_neg_cnt = int(cum_neg_cnts[-1])
+    total_cnt = int(cum_row_cnts[-1])
+    # rows >= start are predicted positive
+    cumu_pos_cnt = total_pos_cnt - int(cum_pos_cnts[start])
+    cumu_neg_cnt = total_neg_cnt - int(cum_neg_cnts[start])
+    tp = cumu_pos_cnt
+    fp = cumu_neg_cnt
+    fn = total_pos_cnt - tp
+    score_sum = cum_scores[end] - cum_scores[start]
+
+    # fill report, ill-defined metrics are 0 as sklearn does
+    report[POSITIVE] = int(cum_pos_cnts[end] - cum_pos_cnts[start])
+    report[NEGATIVE] = int(cum_neg_cnts[end] - cum_neg_cnts[start])
+    report[TOTAL] = row_cnt
+    report[START_VALUE] = start_values[start]
+    report[END_VALUE] = end_values[end - 1]
+    report[PRECISION] = tp / (tp + fp) if tp + fp else 0.0
+    report[RECALL] = tp / total_pos_cnt if total_pos_cnt else 0.0
     report[FPR] = -1 if total_neg_cnt == 0 else fp / total_neg_cnt
-    report[F1_SCORE] = metrics.f1_score(y_true, y_pred)
+    report[F1_SCORE] = 2 * tp / (2 * tp + fp + fn) if tp + fp + fn else 0.0
     report[LIFT] = (
         -1 if total_pos_cnt == 0 else report[PRECISION] * total_cnt / total_pos_cnt
     )
@@ -368,6 +411,263 @@ def fill_bin_report(
     report[AVG_SCORE] = score_sum / report[TOTAL]
 
 
+def gen_bin_reports(
+    start_values: np.ndarray,
+    end_values: np.ndarray,
+    cumulative_counts: CumulativeCounts,
+    bins: np.ndarray,
+    min_item_cnt_per_bucket: int,
+) -> list:
+    """reports of bins from the highest scores to the lowest"""
+    # bins is ascending order, but we calc report must from len - 1 to 0
+    # sort flip bins
+    bins = np.flip(bins)
+    start = len(start_values)
+    bin_reports = list()
+    for thr in bins[1:-1]:
+        bin_report = init_bin_report()
+        # find index end enforce start_values[end - 1] < thr
+        end = np.searchsorted(start_values, thr, side="left")
+        # start > end, sort reverse it when pass into function
+        fill_bin_report(
+            start_values,
+            end_values,
+            cumulative_counts,
+            end,
+            start,
+            min_item_cnt_per_bucket,
+            bin_report,
+        )
+        bin_reports.append(bin_report)
+        start = end
+    # last bin
+    bin_report = init_bin_report()
+    fill_bin_report(
+        start_values,
+        end_values,
+        cumulative_counts,
+        0,
+        start,
+        min_item_cnt_per_bucket,
+        bin_report,
+    )
+    bin_reports.append(bin_report)
+    return bin_reports
+
+
+def gen_head_reports(
+    start_values: np.ndarray,
+    cumulative_counts: CumulativeCounts,
+    fprs: np.ndarray,
+    thresholds: np.ndarray,
+    target_fprs: list,
+) -> list:
+    """
+    reports of the thresholds on roc curve whose fpr is the closest to every
+    target fpr, items >= threshold are predicted positive and counted from
+    cumulative_counts by a binary search of start_values, so rows are never
+    scanned
+    """
+    cum_pos_cnts, cum_neg_cnts, _, _ = cumulative_counts
+    total_pos_cnt = int(cum_pos_cnts[-1])
+    total_neg_cnt = int(cum_neg_cnts[-1])
+    head_reports = list()
+    for target_fpr in target_fprs:
+        idx = np.abs(fprs - target_fpr).argmin()
+        threshold = thresholds[idx]
+        start = np.searchsorted(start_values, threshold, side="left")
+        tp = total_pos_cnt - int(cum_pos_cnts[start])
+        fp = total_neg_cnt - int(cum_neg_cnts[start])
+        head_report = dict()
+        head_report[THRESHOLD] = threshold
+        head_report[FPR] = -1 if total_neg_cnt == 0 else fp / total_neg_cnt
+        head_report[PRECISION] = tp / (tp + fp) if tp + fp else 0.0
+        head_report[RECALL] = tp / total_pos_cnt if total_pos_cnt else 0.0
+        head_reports.append(head_report)
+    return head_reports
+
+
+def gen_range_edges(min_score: float, max_score: float, bucket_num: int) -> np.ndarray:
+    """edges of equal-range bins, computed by pandas.cut as exact mode does"""
+    return pandas.cut([min_score, max_score], bucket_num, retbins=True)[1]
+
+
+class ScoreHistogram:
+    """Histograms of positive and negative rows over bin_num bins of scores
+    in [min_score, max_score], which also keep the sum, min and max score of
+    every bin. Every one of bucket_num equal-range bins is split into bins of
+    equal width. Histograms of the same bins are merged by sums, so rows are
+    added by chunks in O(bin_num) memory.
+
+    Metrics are evaluated as if every bin is a single score, so their errors
+    are bounded by rows of a bin, P positives and N negatives in total:
+    - auc takes a positive and a negative in the same bin as a tie, which is
+      at most sum(pos * neg) / (2 * P * N) over bins off
+    - ks is evaluated at bin boundaries, which is at most max(pos) / P lower
+    - equal-range bins are exact, as their edges are computed as exact mode
+      does and are bin boundaries as they are
+    - edges of equal-frequency bins and thresholds of head report are moved
+      to bin boundaries, rows of a bin at most
+    - f1_score at F1_THRESHOLD is counted exactly
+    """
+
+    def __init__(
+        self, min_score: float, max_score: float, bin_num: int, bucket_num: int = 1
+    ) -> None:
+        assert bin_num > 0, f"Bin num should be positive, but got {bin_num}"
+        assert (
+            bin_num % bucket_num == 0
+        ), f"Bin num {bin_num} should be a multiple of bucket num {bucket_num}"
+        self.min_score = min_score
+        self.max_score = max_score
+        self.bin_num = bin_num
+        self.bucket_num = bucket_num
+        self.range_edges = gen_range_edges(min_score, max_score, bucket_num)
+        # a score at an edge is in the upper bin, as bin reports split rows
+        # at edges, edges of equal-range bins are kept bit for bit
+        step = bin_num // bucket_num
+        self.edges = np.concatenate(
+            [
+                np.linspace(low, high, step + 1)[:-1]
+                for low, high in zip(self.range_edges[:-1], self.range_edges[1:])
+            ]
+            + [self.range_edges[-1:]]
+        )
+        self.positives = np.zeros(bin_num, dtype=np.int64)
+        self.negatives = np.zeros(bin_num, dtype=np.int64)
+        self.score_sums = np.zeros(bin_num, dtype=np.float64)
+        self.score_mins = np.full(bin_num, np.inf)
+        self.score_maxs = np.full(bin_num, -np.inf)
+        # positives and negatives of scores >= F1_THRESHOLD
+        self.tp = 0
+        self.fp = 0
+
+    def add(self, y_true: np.ndarray, score: np.ndarray) -> None:
+        indexes = np.clip(
+            np.searchsorted(self.edges, score, side="right") - 1, 0, self.bin_num - 1
+        )
+        self.positives += np.bincount(indexes[y_true == 1], minlength=self.bin_num)
+        self.negatives += np.bincount(indexes[y_true == 0], minlength=self.bin_num)
+        self.score_sums += np.bincount(indexes, weights=score, minlength=self.bin_num)
+        np.minimum.at(self.score_mins, indexes, score)
+        np.maximum.at(self.score_maxs, indexes, score)
+        predicted = score >= F1_THRESHOLD
+        self.tp += int(np.sum(predicted & (y_true == 1)))
+        self.fp += int(np.sum(predicted & (y_true == 0)))
+
+    def merge(self, other: "ScoreHistogram") -> "ScoreHistogram":
+        assert (self.min_score, self.max_score, self.bin_num, self.bucket_num) == (
+            other.min_score,
+            other.max_score,
+            other.bin_num,
+            other.bucket_num,
+        ), "Score histogram bins mismatch"
+        histogram = ScoreHistogram(
+            self.min_score, self.max_score, self.bin_num, self.bucket_num
+        )
+        histogram.positives = self.positives + other.positives
+        histogram.negatives = self.negatives + other.negatives
+        histogram.score_sums = self.score_sums + other.score_sums
+        histogram.score_mins = np.minimum(self.score_mins, other.score_mins)
+        histogram.score_maxs = np.maximum(self.score_maxs, other.score_maxs)
+        histogram.tp = self.tp + other.tp
+        histogram.fp = self.fp + other.fp
+        return histogram
+
+    def gen_items(self) -> tuple:
+        """
+        non-empty bins as items sorted by score, their min scores, max scores
+        and cumulative counts
+        """
+        kept = (self.positives + self.negatives) > 0
+        return (
+            self.score_mins[kept],
+            self.score_maxs[kept],
+            CumulativeCounts(
+                gen_cumsum(self.positives[kept]),
+                gen_cumsum(self.negatives[kept]),
+                gen_cumsum(self.positives[kept] + self.negatives[kept]),
+                gen_cumsum(self.score_sums[kept]),
+            ),
+        )
+
+    def gen_f1_score(self) -> float:
+        fn = int(self.positives.sum()) - self.tp
+        return 2 * self.tp / (2 * self.tp + self.fp + fn) if self.tp + fn else 0.0
+
+    def gen_error_bounds(self) -> tuple:
+        """max errors of auc and ks"""
+        total_pos_cnt = int(self.positives.sum())
+        total_neg_cnt = int(self.negatives.sum())
+        if total_pos_cnt == 0 or total_neg_cnt == 0:
+            return 0.0, 0.0
+        auc_bound = float(
+            np.sum(self.positives * self.negatives.astype(np.float64))
+            / (2 * total_pos_cnt * total_neg_cnt)
+        )
+        ks_bound = float(self.positives.max() / total_pos_cnt)
+        return auc_bound, ks_bound
+
+
+def sketch_scores(
+    task_input: dict, label: str, score: str, bin_num: int, bucket_num: int
+) -> ScoreHistogram:
+    """Read rows by chunks twice, for the range of scores, and then for the
+    histogram of scores."""
+    min_score = math.inf
+    max_score = -math.inf
+    for chunk in common.iter_data_frame(task_input, usecols=[score]):
+        if len(chunk):
+            min_score = min(min_score, float(chunk[score].min()))
+            max_score = max(max_score, float(chunk[score].max()))
+    assert min_score <= max_score, f"{COMPONENT_NAME} input has no rows"
+
+    histogram = ScoreHistogram(min_score, max_score, bin_num, bucket_num)
+    for chunk in common.iter_data_frame(task_input, usecols=[label, score]):
+        histogram.add(
+            chunk[label].astype("float64").to_numpy(),
+            chunk[score].astype("float64").to_numpy(),
+        )
+    return histogram
+
+
+def gen_roc_curve(
+    start_values: np.ndarray, cumulative_counts: CumulativeCounts
+) -> tuple:
+    """
+    roc curve of thresholds at start_values, items >= threshold are predicted
+    positive, in the order of sklearn roc_curve
+    """
+    cum_pos_cnts, cum_neg_cnts, _, _ = cumulative_counts
+    total_pos_cnt = int(cum_pos_cnts[-1])
+    total_neg_cnt = int(cum_neg_cnts[-1])
+    tps = total_pos_cnt - cum_pos_cnts[::-1]
+    fps = total_neg_cnt - cum_neg_cnts[::-1]
+    thresholds = np.concatenate([[np.inf], start_values[::-1]])
+    tprs = tps / total_pos_cnt if total_pos_cnt else np.zeros(len(tps))
+    fprs = fps / total_neg_cnt if total_neg_cnt else np.zeros(len(fps))
+    return fprs, tprs, thresholds
+
+
+def gen_quantile_bins(
+    start_values: np.ndarray, cumulative_counts: CumulativeCounts, bucket_num: int
+) -> np.ndarray:
+    """
+    edges of equal-frequency bins, quantiles are interpolated linearly as
+    pandas.qcut does, with scores of rows as the min score of their items,
+    duplicate edges are dropped
+    """
+    rows = cumulative_counts.rows
+    ranks = np.linspace(0, rows[-1] - 1, bucket_num + 1)
+
+    def gen_values(ranks: np.ndarray) -> np.ndarray:
+        return start_values[np.searchsorted(rows, ranks, side="right") - 1]
+
+    low_values = gen_values(np.floor(ranks))
+    high_values = gen_values(np.ceil(ranks))
+    return np.unique(low_values + (high_values - low_values) * (ranks % 1))
+
+
 def run_biclassification_eval(task_config: dict):
     logging.info("Running biclassification_eval...")
 
@@ -390,128 +690,85 @@ def run_biclassification_eval(task_config: dict):
     assert len(labels) == 1, f"{COMPONENT_NAME} should have only 1 label column"
     assert len(scores) == 1, f"{COMPONENT_NAME} should have only 1 score column"
 
-    # get data
-    df = common.gen_data_frame(inputs[0], usecols=[labels[0], scores[0]])
-    # sort ascending
-    df.sort_values(by=scores[0], inplace=True, ignore_index=True)
-    df[labels[0]] = df[labels[0]].astype("float64")
-    y_true = df[labels[0]].to_numpy()
-    df[scores[0]] = df[scores[0]].astype("float64")
-    score = df[scores[0]].to_numpy()
-    y_pred = np.array([(1 if x >= 0.5 else 0) for x in score])
+    bucket_num = task_config[BUCKET_NUM]
+    sketch_bin_num = task_config.get(SKETCH_BIN_NUM, DEFAULT_SKETCH_BIN_NUM)
+    summary_report = dict()
+    if sketch_bin_num > 0:
+        # bucket edges of equal-range bins are bin boundaries
+        bin_num = math.ceil(sketch_bin_num / bucket_num) * bucket_num
+        logging.info(f"Sketching scores by {bin_num} bins...")
+        histogram = sketch_scores(inputs[0], labels[0], scores[0], bin_num, bucket_num)
+        start_values, end_values, cumulative_counts = histogram.gen_items()
+        fprs, tprs, thresholds = gen_roc_curve(start_values, cumulative_counts)
+        summary_report[AUC] = metrics.auc(fprs, tprs)
+        summary_report[F1_SCORE] = histogram.gen_f1_score()
+        range_bins = histogram.range_edges
+        freq_bins = gen_quantile_bins(start_values, cumulative_counts, bucket_num)
+        auc_bound, ks_bound = histogram.gen_error_bounds()
+        logging.info(
+            f"Sketch errors are at most {auc_bound:.6f} of auc and {ks_bound:.6f} of ks"
+        )
+    else:
+        # get data
+        df = common.gen_data_frame(inputs[0], usecols=[labels[0], scores[0]])
+        # sort ascending
+        df.sort_values(by=scores[0], inplace=True, ignore_index=True)
+        df[labels[0]] = df[labels[0]].astype("float64")
+        y_true = df[labels[0]].to_numpy()
+        df[scores[0]] = df[scores[0]].astype("float64")
+        score = df[scores[0]].to_numpy()
+        y_pred = (score >= F1_THRESHOLD).astype(int)
+
+        fprs, tprs, thresholds = metrics.roc_curve(y_true, score)
+        if len(np.unique(y_true)) > 1:
+            summary_report[AUC] = metrics.roc_auc_score(y_true, score)
+        summary_report[F1_SCORE] = metrics.f1_score(y_true, y_pred)
+        # every bin report is O(1) from cumulative counts of sorted rows
+        start_values = end_values = score
+        cumulative_counts = gen_cumulative_counts(y_true, score)
+        range_bins = pandas.cut(score, bucket_num, duplicates="drop", retbins=True)[1]
+        freq_bins = pandas.qcut(score, bucket_num, duplicates="drop", retbins=True)[1]
 
     # summary report
-    summary_report = dict()
-    fprs, tprs, thresholds = metrics.roc_curve(y_true, score)
     summary_report[KS] = max(tprs - fprs)
-    summary_report[NEGATIVE_SAMPLES] = np.sum(y_true == 0)
-    summary_report[POSITIVE_SAMPLES] = np.sum(y_true == 1)
-    summary_report[TOTAL_SAMPLES] = len(y_true)
+    summary_report[NEGATIVE_SAMPLES] = int(cumulative_counts.negatives[-1])
+    summary_report[POSITIVE_SAMPLES] = int(cumulative_counts.positives[-1])
+    summary_report[TOTAL_SAMPLES] = int(cumulative_counts.rows[-1])
     if (
         max(summary_report[NEGATIVE_SAMPLES], summary_report[POSITIVE_SAMPLES])
         == summary_report[TOTAL_SAMPLES]
     ):
         summary_report[AUC] = -1.0
         logging.warning("The label of input all is 0 or 1")
-    else:
-        summary_report[AUC] = metrics.roc_auc_score(y_true, score)
-    summary_report[F1_SCORE] = metrics.f1_score(y_true, y_pred)
-
-    # head reports
-    head_reports = list()
-    for target_fpr in HEAD_FPR_THRESHOLDS:
-        idx = np.abs(fprs - target_fpr).argmin()
-        threshold = thresholds[idx]
-        y_pred_threshold = np.array([(1 if x >= threshold else 0) for x in score])
-        tn, fp, _, _ = metrics.confusion_matrix(
-            y_true=y_true, y_pred=y_pred_threshold
-        ).ravel()
-        head_report = dict()
-        head_report[THRESHOLD] = threshold
-        head_report[FPR] = fp / (fp + tn)
-        head_report[PRECISION] = metrics.precision_score(y_true, y_pred_threshold)
-        head_report[RECALL] = metrics.recall_score(y_true, y_pred_threshold)
-        head_reports.append(head_report)
 
     # eq range bin report
-    bins = pandas.cut(score, task_config[BUCKET_NUM], duplicates="drop", retbins=True)[
-        1
-    ]
-    # bins is ascending order, but we calc report must from len - 1 to 0
-    # sort flip bins
-    bins = np.flip(bins)
-    start = len(score)
-    eq_range_bin_reports = list()
-    for thr in bins[1:-1]:
-        eq_range_bin_report = init_bin_report()
-        # find index end enforce score[end - 1] < thr
-        end = np.searchsorted(score, thr, side="left")
-        # start > end, sort reverse it when pass into function
-        fill_bin_report(
-            y_true,
-            score,
-            summary_report[POSITIVE_SAMPLES],
-            summary_report[NEGATIVE_SAMPLES],
-            end,
-            start,
-            task_config[MIN_ITEM_CNT_PER_BUCKET],
-            eq_range_bin_report,
-        )
-        eq_range_bin_reports.append(eq_range_bin_report)
-        start = end
-    # last bin
-    eq_range_bin_report = init_bin_report()
-    fill_bin_report(
-        y_true,
-        score,
-        summary_report[POSITIVE_SAMPLES],
-        summary_report[NEGATIVE_SAMPLES],
-        0,
-        start,
+    eq_range_bin_reports = gen_bin_reports(
+        start_values,
+        end_values,
+        cumulative_counts,
+        range_bins,
         task_config[MIN_ITEM_CNT_PER_BUCKET],
-        eq_range_bin_report,
     )
-    eq_range_bin_reports.append(eq_range_bin_report)
 
     # eq freq bin report
-    bins = pandas.qcut(score, task_config[BUCKET_NUM], duplicates="drop", retbins=True)[
-        1
-    ]
-    # bins is ascending order, but we calc report must from len - 1 to 0
-    # sort flip bins
-    bins = np.flip(bins)
-    start = len(score)
-    eq_freq_bin_reports = list()
-    for thr in bins[1:-1]:
-        eq_freq_bin_report = init_bin_report()
-        # find index end enforce score[end - 1] < thr
-        end = np.searchsorted(score, thr, side="left")
-        # start > end, sort reverse it when pass into function
-        fill_bin_report(
-            y_true,
-            score,
-            summary_report[POSITIVE_SAMPLES],
-            summary_report[NEGATIVE_SAMPLES],
-            end,
-            start,
-            task_config[MIN_ITEM_CNT_PER_BUCKET],
-            eq_freq_bin_report,
-        )
-        eq_freq_bin_reports.append(eq_freq_bin_report)
-        start = end
-    # last bin
-    eq_freq_bin_report = init_bin_report()
-    fill_bin_report(
-        y_true,
-        score,
-        summary_report[POSITIVE_SAMPLES],
-        summary_report[NEGATIVE_SAMPLES],
-        0,
-        start,
+    eq_freq_bin_reports = gen_bin_reports(
+        start_values,
+        end_values,
+        cumulative_counts,
+        freq_bins,
         task_config[MIN_ITEM_CNT_PER_BUCKET],
-        eq_freq_bin_report,
     )
-    eq_freq_bin_reports.append(eq_freq_bin_report)
+
+    # head reports
+    head_fpr_thresholds = task_config.get(
+        HEAD_FPR_THRESHOLDS, DEFAULT_HEAD_FPR_THRESHOLDS
+    )
+    assert all(
+        0 <= fpr <= 1 for fpr in head_fpr_thresholds
+    ), f"Head fpr thresholds should be in [0, 1], but got {head_fpr_thresholds}"
+    head_reports = gen_head_reports(
+        start_values, cumulative_counts, fprs, thresholds, head_fpr_thresholds
+    )
 
     comp_report = Report(
         name="reports",
@@ -13,13 +13,44 @@
 # limitations under the License.
 
 
+import collections
+import contextlib
 import csv
+import io
+import itertools
 import logging
-from typing import Literal
+import math
+import os
+import shutil
+import time
+from concurrent import futures
+from typing import Iterable, Iterator, Literal, Union
 
+import joblib
+import numpy as np
 import pandas
+from google.protobuf import json_format
+from joblib.compressor import CompressorWrapper, register_compressor
 from secretflow.spec.v1 import data_pb2
 
+try:
+    import pyarrow
+    from pyarrow import csv as pa_csv
+    from pyarrow import feather, ipc, parquet
+except ImportError:
+    pyarrow = None
+    pa_csv = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
 COMPONENT_NAME = "component_name"
 INPUTS = "inputs"
 OUTPUTS = "outputs"
@@ -32,6 +63,9 @@ LABELS = "labels"
 ID_TYPES = "id_types"
 FEATURE_TYPES = "feature_types"
 LABEL_TYPES = "label_types"
+TABLE_FORMAT = "table_format"
+COMPRESSION = "compression"
+ROLE_TYPES = {IDS: ID_TYPES, FEATURES: FEATURE_TYPES, LABELS: LABEL_TYPES}
 
 TABLE_SCHEMA_STRING_TYPE = "str"
 TABLE_SCHEMA_FLOAT_DEFAULT_TYPE = "float64"
@@ -49,6 +83,97 @@ TABLE_SCHEMA_INT_TYPE_LIST = [
     "int",
 ]
 
+# keep the declared narrow types instead of widening them to int64/float64/object,
+# int and bool are nullable with masks, str is dictionary encoded as category,
+# float16 is read as float32 because parsers do not support half precision
+NARROW_PD_TYPES = {
+    "int8": "Int8",
+    "int16": "Int16",
+    "int32": "Int32",
+    "int64": "Int64",
+    "uint8": "UInt8",
+    "uint16": "UInt16",
+    "uint32": "UInt32",
+    "uint64": "UInt64",
+    "int": "Int64",
+    "float16": "float32",
+    "float32": "float32",
+    "float64": "float64",
+    "float": "float64",
+    "bool": "boolean",
+    "str": "category",
+}
+
+# arrow is a multi-threaded columnar parser, pandas is the single-threaded C parser
+READ_ENGINE_ARROW = "arrow"
+READ_ENGINE_PANDAS = "pandas"
+DEFAULT_READ_ENGINE = READ_ENGINE_ARROW
+
+# csv is the text format of individual tables,
+# arrow(feather v2) and parquet are typed columnar formats without text parsing
+TABLE_FORMAT_CSV = "csv"
+TABLE_FORMAT_ARROW = "arrow"
+TABLE_FORMAT_PARQUET = "parquet"
+DEFAULT_TABLE_FORMAT = TABLE_FORMAT_CSV
+ARROW_MAGIC = b"ARROW1"
+PARQUET_MAGIC = b"PAR1"
+
+# opt-in compression of table and model outputs, fewer bytes to encrypt and upload,
+# csv is wrapped in a zstd/lz4 frame, arrow/parquet use their own codecs
+COMPRESSION_ZSTD = "zstd"
+COMPRESSION_LZ4 = "lz4"
+COMPRESSIONS = [COMPRESSION_ZSTD, COMPRESSION_LZ4]
+DEFAULT_COMPRESSION = None
+DEFAULT_MODEL_COMPRESS_LEVEL = 3
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+LZ4_MAGIC = b"\x04\x22\x4d\x18"
+HEADER_BLOCK_SIZE = 1 << 16
+COPY_BUFFER_SIZE = 1 << 20
+
+# rows of every chunk yielded by iter_data_frame
+DEFAULT_CHUNK_SIZE = 100000
+
+# rows of every chunk formatted by write_table
+DEFAULT_WRITE_CHUNK_SIZE = 100000
+# None keeps the shortest repr of floats, e.g. "%.6f" trades precision for size
+DEFAULT_FLOAT_FORMAT = None
+# phase of PhaseTimer timing TableSchema json outputs
+PHASE_SCHEMA = "schema"
+
+# psi partitions are temporary, so the binary format is preferred if possible
+DEFAULT_PARTITION_FORMAT = (
+    TABLE_FORMAT_ARROW if pyarrow is not None else TABLE_FORMAT_CSV
+)
+# seed of the 64-bit hash of join keys
+DEFAULT_HASH_SEED = 0
+# differs from DEFAULT_HASH_SEED, so that filter bits are independent of partitions
+BLOOM_FILTER_HASH_SEED = 1
+
+# keep the same missing values as pandas.read_csv, so that engines agree with each other
+NA_VALUES = [
+    "",
+    "#N/A",
+    "#N/A N/A",
+    "#NA",
+    "-1.#IND",
+    "-1.#QNAN",
+    "-NaN",
+    "-nan",
+    "1.#IND",
+    "1.#QNAN",
+    "<NA>",
+    "N/A",
+    "NA",
+    "NULL",
+    "NaN",
+    "None",
+    "n/a",
+    "nan",
+    "null",
+]
+TRUE_VALUES = ["True", "TRUE", "true", "1"]
+FALSE_VALUES = ["False", "FALSE", "false", "0"]
+
 
 def sf_to_pd_type(
     sf_type: Literal[
@@ -67,7 +192,7 @@ def sf_to_pd_type(
         "int",
         "float",
         "str",
-    ]
+    ],
 ) -> Literal["float64", "int64", "bool", "object"]:
     if sf_type in TABLE_SCHEMA_INT_TYPE_LIST:
         return "int64"
@@ -78,9 +203,39 @@ def sf_to_pd_type(
     return "object"
 
 
-def pd_type_to_sf(pd_dtype: str) -> str:
-    if pd_dtype == "object":
+def sf_to_narrow_pd_type(sf_type: str) -> str:
+    return NARROW_PD_TYPES.get(sf_type, "category")
+
+
+def sf_to_pa_type(sf_type: str, narrow_dtypes: bool = False):
+    if narrow_dtypes:
+        pd_type = sf_to_narrow_pd_type(sf_type)
+        if pd_type == "category":
+            return pyarrow.dictionary(pyarrow.int32(), pyarrow.string())
+        elif pd_type == "boolean":
+            return pyarrow.bool_()
+        # Int8 -> int8, UInt64 -> uint64, float32 -> float32
+        return pyarrow.type_for_alias(pd_type.lower())
+    pd_type = sf_to_pd_type(sf_type)
+    if pd_type == "int64":
+        return pyarrow.int64()
+    elif pd_type == "float64":
+        return pyarrow.float64()
+    elif pd_type == "bool":
+        return pyarrow.bool_()
+    return pyarrow.string()
+
+
+def pd_type_to_sf(pd_dtype: str, nullable: bool = False) -> str:
+    if pd_dtype in ["object", "category", "string"]:
         return "str"
+    elif pd_dtype in ["bool", "boolean"]:
+        # readers can not hold missing values in bool columns
+        return "str" if nullable else "bool"
+    elif pd_dtype.lower() in TABLE_SCHEMA_INT_TYPE_LIST:
+        # readers can not hold missing values in int columns,
+        # nullable Int8/UInt64 -> int8/uint64
+        return TABLE_SCHEMA_FLOAT_DEFAULT_TYPE if nullable else pd_dtype.lower()
     else:
         return pd_dtype
 
@@ -102,17 +257,99 @@ def get_cols_in_schema(schema: dict) -> list:
     return cols
 
 
+def plan_usecols(task_input: dict, *col_lists: list) -> list:
+    """Project the columns a component needs out of the input schema.
+
+    Components declare the column groups they use, e.g. features, label and
+    id, and only those are parsed. Duplicates are dropped in declared order.
+    """
+    usecols = list(dict.fromkeys(itertools.chain(*col_lists)))
+    schema_cols = get_cols_in_schema(task_input[SCHEMA])
+    missing_cols = set(usecols) - set(schema_cols)
+    assert not missing_cols, f"Columns {missing_cols} are not in schema"
+    logging.info(f"Reading {len(usecols)} of {len(schema_cols)} columns")
+    return usecols
+
+
+def get_table_format(data_path: str) -> str:
+    with open(data_path, "rb") as file:
+        magic = file.read(len(ARROW_MAGIC))
+    if get_compression_by_magic(magic):
+        return TABLE_FORMAT_CSV
+    return get_table_format_by_magic(magic)
+
+
+def get_compression_by_magic(magic: bytes) -> str:
+    if magic.startswith(ZSTD_MAGIC):
+        return COMPRESSION_ZSTD
+    elif magic.startswith(LZ4_MAGIC):
+        return COMPRESSION_LZ4
+    return None
+
+
+def check_compression(compression: str) -> None:
+    if compression is None:
+        return
+    if compression not in COMPRESSIONS:
+        raise RuntimeError(f"unsupported compression: {compression}")
+    assert pyarrow is not None, f"pyarrow is required to compress by {compression}"
+
+
+def check_model_compression(compression: str) -> None:
+    # models are compressed by joblib, which needs no pyarrow
+    if compression is None:
+        return
+    if compression not in COMPRESSIONS:
+        raise RuntimeError(f"unsupported compression: {compression}")
+    assert (
+        compression != COMPRESSION_ZSTD or zstandard is not None
+    ), "zstandard is required to compress models by zstd"
+    assert (
+        compression != COMPRESSION_LZ4 or lz4 is not None
+    ), "lz4 is required to compress models by lz4"
+
+
+def open_output_stream(data_path: str, compression: str = None):
+    check_compression(compression)
+    if compression is None:
+        return open(data_path, "wb")
+    return pyarrow.output_stream(data_path, compression=compression)
+
+
+def read_head_lines(stream, line_num: int) -> bytes:
+    # compressed streams can not read lines, read blocks until enough lines
+    blocks = []
+    while True:
+        block = stream.read(HEADER_BLOCK_SIZE)
+        blocks.append(block)
+        if not block or b"".join(blocks).count(b"\n") >= line_num:
+            break
+    return b"".join(blocks)
+
+
+def get_table_format_by_magic(magic: bytes) -> str:
+    if magic.startswith(ARROW_MAGIC):
+        return TABLE_FORMAT_ARROW
+    elif magic.startswith(PARQUET_MAGIC):
+        return TABLE_FORMAT_PARQUET
+    return TABLE_FORMAT_CSV
+
+
+def sniff_dialect(sample: str):
+    try:
+        dialect = csv.Sniffer().sniff(sample)
+    except csv.Error:
+        logging.warn(
+            "Can not determine dialect with csv sniffer. Use default excel dialect instead."
+        )
+        dialect = csv.excel()
+    return dialect
+
+
 def get_dialect(csv_file):
     with open(csv_file, "r", newline="") as file:
         sample = file.readline() + file.readline()
-        try:
-            dialect = csv.Sniffer().sniff(sample)
-        except csv.Error:
-            logging.warn(
-                "Can not determine dialect with csv sniffer. Use default excel dialect instead."
-            )
-            dialect = csv.excel()
-    return dialect
+    return sniff_dialect(sample)
 
 
 def get_col_names(task_input: dict, delimiter: str, file_path: str = None) -> list:
@@ -123,132 +360,923 @@ def get_col_names(task_input: dict, delimiter: str, file_path: str = None) -> li
     return df.columns.to_list()
 
 
-def get_col_types(task_input: dict, col_names: list) -> list:
+def gen_col_index(schema: dict) -> dict:
+    """Map every column name in schema to (role, index in role), role is one of
+    ids/features/labels. The first one wins if a column is declared repeatedly.
+    """
+    col_index = dict()
+    for role in [IDS, FEATURES, LABELS]:
+        for index, col_name in enumerate(schema[role]):
+            col_index.setdefault(col_name, (role, index))
+    return col_index
+
+
+def get_col_types(task_input: dict, col_names: list, col_index: dict = None) -> list:
+    schema = task_input[SCHEMA]
+    if col_index is None:
+        col_index = gen_col_index(schema)
     col_types = []
     for col_name in col_names:
-        if col_name in task_input[SCHEMA][IDS]:
-            col_types.append(
-                task_input[SCHEMA][ID_TYPES][
-                    list(task_input[SCHEMA][IDS]).index(col_name)
-                ]
-            )
-        elif col_name in task_input[SCHEMA][FEATURES]:
-            col_types.append(
-                task_input[SCHEMA][FEATURE_TYPES][
-                    list(task_input[SCHEMA][FEATURES]).index(col_name)
-                ]
-            )
-        elif col_name in task_input[SCHEMA][LABELS]:
-            col_types.append(
-                task_input[SCHEMA][LABEL_TYPES][
-                    list(task_input[SCHEMA][LABELS]).index(col_name)
-                ]
-            )
-        else:
+        if col_name not in col_index:
             raise RuntimeError(f"{col_name} not found in schema")
+        role, index = col_index[col_name]
+        col_types.append(schema[ROLE_TYPES[role]][index])
     return col_types
 
 
 # only used by format_file_schema
-def col_type_to_float(task_input: dict, col_name: str) -> None:
-    if col_name in task_input[SCHEMA][IDS]:
-        task_input[SCHEMA][ID_TYPES][
-            list(task_input[SCHEMA][IDS]).index(col_name)
-        ] = TABLE_SCHEMA_FLOAT_DEFAULT_TYPE
-    elif col_name in task_input[SCHEMA][FEATURES]:
-        task_input[SCHEMA][FEATURE_TYPES][
-            list(task_input[SCHEMA][FEATURES]).index(col_name)
-        ] = TABLE_SCHEMA_FLOAT_DEFAULT_TYPE
-    elif col_name in task_input[SCHEMA][LABELS]:
-        task_input[SCHEMA][LABEL_TYPES][
-            list(task_input[SCHEMA][LABELS]).index(col_name)
-        ] = TABLE_SCHEMA_FLOAT_DEFAULT_TYPE
-    else:
+def col_type_to_float(task_input: dict, col_name: str, col_index: dict = None) -> None:
+    schema = task_input[SCHEMA]
+    if col_index is None:
+        col_index = gen_col_index(schema)
+    if col_name not in col_index:
         raise RuntimeError(f"{col_name} not found in schema")
+    role, index = col_index[col_name]
+    schema[ROLE_TYPES[role]][index] = TABLE_SCHEMA_FLOAT_DEFAULT_TYPE
+
+
+class TableSource:
+    """Header of an input table, scanned once and shared by the readers.
+
+    It caches the table format, csv dialect, column names, their schema
+    types and pandas dtypes, and a name -> (role, type) dict, so that schema
+    lookups are O(1) instead of scanning the repeated fields of schema.
+    """
+
+    def __init__(self, task_input: dict, file_path: str = None):
+        self.task_input = task_input
+        self.data_path = file_path if file_path else task_input[DATA_PATH]
+        assert self.data_path, "Data path is empty."
+
+        self.dialect = None
+        with open(self.data_path, "rb") as file:
+            magic = file.read(len(ARROW_MAGIC))
+            self.compression = get_compression_by_magic(magic)
+            self.table_format = get_table_format_by_magic(magic)
+            if self.compression is None and self.table_format == TABLE_FORMAT_CSV:
+                file.seek(0)
+                header = file.readline().decode("utf-8-sig")
+                sample = header + file.readline().decode("utf-8")
+        if self.compression is not None:
+            check_compression(self.compression)
+            with self.open_input() as stream:
+                lines = read_head_lines(stream, 2).split(b"\n")
+            # only csv is wrapped, columnar tables are compressed inside
+            self.table_format = TABLE_FORMAT_CSV
+            header = lines[0].decode("utf-8-sig") + "\n"
+            sample = header + (lines[1].decode("utf-8") if len(lines) > 1 else "")
+
+        if self.table_format == TABLE_FORMAT_CSV:
+            self.dialect = sniff_dialect(sample)
+            # parse header the same way as the data, e.g. quoting and duplicate names
+            self.col_names = pandas.read_csv(
+                io.StringIO(header), delimiter=self.dialect.delimiter, nrows=0
+            ).columns.to_list()
+        else:
+            assert (
+                pyarrow is not None
+            ), f"pyarrow is required to read {self.table_format} table"
+            if self.table_format == TABLE_FORMAT_ARROW:
+                self.col_names = feather.read_table(
+                    self.data_path, columns=[]
+                ).schema.names
+            else:
+                self.col_names = parquet.read_schema(self.data_path).names
+
+        self.col_index = gen_col_index(task_input[SCHEMA])
+        self.col_types = get_col_types(task_input, self.col_names, self.col_index)
+        self.col_schema = {
+            col_name: (self.col_index[col_name][0], col_type)
+            for col_name, col_type in zip(self.col_names, self.col_types)
+        }
+        self.dtypes = {
+            col_name: sf_to_pd_type(col_type)
+            for col_name, col_type in zip(self.col_names, self.col_types)
+        }
+        self.narrow_pd_dtypes = {
+            col_name: sf_to_narrow_pd_type(col_type)
+            for col_name, col_type in zip(self.col_names, self.col_types)
+        }
+
+    @property
+    def delimiter(self) -> str:
+        return self.dialect.delimiter
+
+    def open_input(self):
+        # path of a plain file, or a decompressing stream which readers accept
+        if self.compression is None:
+            return self.data_path
+        return pyarrow.input_stream(self.data_path, compression=self.compression)
+
+    def get_col_role(self, col_name: str) -> str:
+        return self.col_schema[col_name][0]
+
+    def get_col_type(self, col_name: str) -> str:
+        return self.col_schema[col_name][1]
+
+    def get_usecols(self, usecols: list = None) -> list:
+        # keep the file order of columns, the same as pandas.read_csv
+        if not usecols:
+            return self.col_names
+        missing_cols = set(usecols) - set(self.col_names)
+        if missing_cols:
+            raise ValueError(f"Usecols do not match columns: {missing_cols}")
+        usecols_set = set(usecols)
+        return [col for col in self.col_names if col in usecols_set]
+
+
+def narrow_types_mapper(pa_type):
+    if pyarrow.types.is_integer(pa_type):
+        return pandas.api.types.pandas_dtype(NARROW_PD_TYPES[str(pa_type)])
+    elif pyarrow.types.is_boolean(pa_type):
+        return pandas.BooleanDtype()
+    # use the default conversion
+    return None
+
+
+def table_to_pandas(table, types_mapper=None) -> pandas.DataFrame:
+    """Convert an arrow table to pandas, with missing strings as NaN instead
+    of None, the same as pandas.read_csv, so that readers agree on nulls.
+    """
+    null_str_indexes = [
+        i
+        for i, (field, column) in enumerate(zip(table.schema, table.columns))
+        if column.null_count > 0
+        and (
+            pyarrow.types.is_string(field.type)
+            or pyarrow.types.is_large_string(field.type)
+        )
+    ]
+    # split_blocks and self_destruct avoid consolidating and doubling the memory
+    df = table.to_pandas(
+        split_blocks=True, self_destruct=True, types_mapper=types_mapper
+    )
+    for i in null_str_indexes:
+        col = df.iloc[:, i]
+        df.isetitem(i, col.where(col.notna(), np.nan))
+    return df
+
+
+def read_csv_by_pandas(
+    source: TableSource,
+    usecols: list = None,
+    chunksize: int = None,
+    narrow_dtypes: bool = False,
+) -> pandas.DataFrame:
+    # return an iterator of DataFrame chunks if chunksize is set
+    return pandas.read_csv(
+        source.open_input(),
+        names=source.col_names,
+        dtype=source.narrow_pd_dtypes if narrow_dtypes else source.dtypes,
+        usecols=usecols,
+        header=0,
+        delimiter=source.delimiter,
+        chunksize=chunksize,
+    )
+
+
+def gen_arrow_csv_options(
+    source: TableSource, usecols: list = None, narrow_dtypes: bool = False
+) -> dict:
+    return dict(
+        read_options=pa_csv.ReadOptions(
+            use_threads=True, column_names=source.col_names, skip_rows=1
+        ),
+        parse_options=pa_csv.ParseOptions(delimiter=source.delimiter),
+        convert_options=pa_csv.ConvertOptions(
+            column_types={
+                col_name: sf_to_pa_type(col_type, narrow_dtypes)
+                for col_name, col_type in zip(source.col_names, source.col_types)
+            },
+            include_columns=source.get_usecols(usecols),
+            null_values=NA_VALUES,
+            true_values=TRUE_VALUES,
+            false_values=FALSE_VALUES,
+            strings_can_be_null=True,
+        ),
+    )
+
+
+def csv_table_to_pandas(table, narrow_dtypes: bool = False) -> pandas.DataFrame:
+    if narrow_dtypes:
+        # missing values are kept by masks of the nullable pandas types
+        return table_to_pandas(table, narrow_types_mapper)
+    # pandas can not hold missing values in int64/bool columns,
+    # let the pandas engine decide how to deal with them
+    for field, column in zip(table.schema, table.columns):
+        if column.null_count > 0 and (
+            pyarrow.types.is_integer(field.type) or pyarrow.types.is_boolean(field.type)
+        ):
+            raise ValueError(f"{field.name} has missing values")
+    return table_to_pandas(table)
+
+
+def read_csv_by_arrow(
+    source: TableSource,
+    usecols: list = None,
+    narrow_dtypes: bool = False,
+) -> pandas.DataFrame:
+    table = pa_csv.read_csv(
+        source.open_input(), **gen_arrow_csv_options(source, usecols, narrow_dtypes)
+    )
+    return csv_table_to_pandas(table, narrow_dtypes)
+
+
+def iter_table_chunks(batches: Iterable, schema, chunksize: int) -> Iterator:
+    """Regroup arrow record batches into tables of chunksize rows, the last
+    one may be smaller. A table without rows still yields an empty chunk, as
+    pandas.read_csv does.
+    """
+    pending = []
+    pending_rows = 0
+    chunk_num = 0
+    for batch in batches:
+        pending.append(batch)
+        pending_rows += batch.num_rows
+        while pending_rows >= chunksize:
+            table = pyarrow.Table.from_batches(pending, schema)
+            yield table.slice(0, chunksize)
+            chunk_num += 1
+            rest = table.slice(chunksize)
+            pending = rest.to_batches()
+            pending_rows = rest.num_rows
+    if pending_rows > 0 or chunk_num == 0:
+        yield pyarrow.Table.from_batches(pending, schema)
+
+
+def index_chunks(chunks: Iterable[pandas.DataFrame]) -> Iterator[pandas.DataFrame]:
+    """Index rows of chunks continuously, as chunks of pandas.read_csv are."""
+    start = 0
+    for chunk in chunks:
+        chunk.index = pandas.RangeIndex(start, start + len(chunk))
+        start += len(chunk)
+        yield chunk
+
+
+def iter_csv_by_arrow(
+    source: TableSource,
+    usecols: list = None,
+    chunksize: int = DEFAULT_CHUNK_SIZE,
+    narrow_dtypes: bool = False,
+) -> Iterator[pandas.DataFrame]:
+    reader = pa_csv.open_csv(
+        source.open_input(), **gen_arrow_csv_options(source, usecols, narrow_dtypes)
+    )
+    for table in iter_table_chunks(reader, reader.schema, chunksize):
+        yield csv_table_to_pandas(table, narrow_dtypes)
+
+
+def iter_columnar_table(
+    source: TableSource, usecols: list = None, chunksize: int = DEFAULT_CHUNK_SIZE
+) -> Iterator[pandas.DataFrame]:
+    """Read an arrow/parquet table batch by batch, instead of the whole table."""
+    columns = source.get_usecols(usecols)
+    if source.table_format == TABLE_FORMAT_ARROW:
+        with pyarrow.memory_map(source.data_path) as file:
+            reader = ipc.open_file(file)
+            schema = pyarrow.schema([reader.schema.field(col) for col in columns])
+            batches = (
+                reader.get_batch(i).select(columns)
+                for i in range(reader.num_record_batches)
+            )
+            for table in iter_table_chunks(batches, schema, chunksize):
+                yield table_to_pandas(table)
+        return
+
+    parquet_file = parquet.ParquetFile(source.data_path)
+    schema = parquet_file.schema_arrow
+    schema = pyarrow.schema([schema.field(col) for col in columns])
+    batches = parquet_file.iter_batches(batch_size=chunksize, columns=columns)
+    for table in iter_table_chunks(batches, schema, chunksize):
+        yield table_to_pandas(table)
+
+
+def read_columnar_table(source: TableSource, usecols: list = None):
+    columns = source.get_usecols(usecols)
+    if source.table_format == TABLE_FORMAT_ARROW:
+        return feather.read_table(source.data_path, columns=columns, memory_map=True)
+    return parquet.read_table(source.data_path, columns=columns)
+
+
+def narrow_data_frame(
+    df: pandas.DataFrame, source: TableSource, categories: dict = None
+) -> pandas.DataFrame:
+    """Cast columns of df to their declared narrow types, see NARROW_PD_TYPES.
+
+    Every reader ends with it, so that tables are typed the same whatever
+    their format and engine. Str columns are categorical with the sorted
+    values of categories if set, e.g. of the whole table read by chunks, so
+    that chunks are still categorical after concatenation, or else with the
+    sorted values of df.
+    """
+    dtypes = {}
+    for col in df.columns:
+        dtype = source.narrow_pd_dtypes[col]
+        if dtype == "category":
+            values = (
+                categories[col] if categories is not None else df[col].dropna().unique()
+            )
+            dtype = pandas.CategoricalDtype(sorted(values))
+        dtypes[col] = dtype
+    return df.astype(dtypes, copy=False)
+
+
+def gen_categories(
+    source: TableSource, usecols: list = None, chunksize: int = DEFAULT_CHUNK_SIZE
+) -> dict:
+    """Values of the str columns of a table, as categories of narrow_data_frame."""
+    cols = [
+        col
+        for col in source.get_usecols(usecols)
+        if source.narrow_pd_dtypes[col] == "category"
+    ]
+    categories = {col: set() for col in cols}
+    if not cols:
+        return categories
+    for chunk in iter_table_source(source, cols, chunksize):
+        for col in cols:
+            categories[col].update(chunk[col].dropna().unique())
+    return categories
 
 
 def gen_data_frame(
     task_input: dict,
     file_path: str = None,
     usecols: list = None,
+    engine: str = DEFAULT_READ_ENGINE,
+    narrow_dtypes: bool = False,
 ) -> pandas.DataFrame:
-    data_path = file_path if file_path else task_input[DATA_PATH]
-    assert data_path, "Data path is empty."
+    """Read the table with the column types declared in schema.
 
-    dialect = get_dialect(data_path)
+    By default int/float/str columns are widened to int64/float64/object. If
+    narrow_dtypes is set, the declared narrow types are kept to cut memory, see
+    NARROW_PD_TYPES.
+    """
+    source = TableSource(task_input, file_path)
+    df = read_table_source(source, usecols, engine, narrow_dtypes)
+    return narrow_data_frame(df, source) if narrow_dtypes else df
 
-    col_names = get_col_names(task_input, dialect.delimiter, data_path)
-    col_types = get_col_types(task_input, col_names)
-    return pandas.read_csv(
-        data_path,
-        names=col_names,
-        dtype={
-            col_name: sf_to_pd_type(col_type)
-            for col_name, col_type in zip(col_names, col_types)
-        },
-        usecols=usecols,
-        header=0,
-        delimiter=dialect.delimiter,
-    )
+
+def read_table_source(
+    source: TableSource,
+    usecols: list = None,
+    engine: str = DEFAULT_READ_ENGINE,
+    narrow_dtypes: bool = False,
+) -> pandas.DataFrame:
+    # csv readers parse narrow types already, as wide int/bool can not be missing
+    if source.table_format != TABLE_FORMAT_CSV:
+        return table_to_pandas(read_columnar_table(source, usecols))
+
+    if engine == READ_ENGINE_ARROW and pyarrow is not None:
+        try:
+            return read_csv_by_arrow(source, usecols, narrow_dtypes)
+        except (pyarrow.ArrowException, ValueError) as e:
+            logging.warning(
+                f"Can not read {source.data_path} with arrow engine: {e}. Use pandas engine instead."
+            )
+    elif engine not in [READ_ENGINE_ARROW, READ_ENGINE_PANDAS]:
+        raise RuntimeError(f"unsupported read engine: {engine}")
+    return read_csv_by_pandas(source, usecols, narrow_dtypes=narrow_dtypes)
+
+
+def iter_data_frame(
+    task_input: dict,
+    file_path: str = None,
+    usecols: list = None,
+    chunksize: int = DEFAULT_CHUNK_SIZE,
+    narrow_dtypes: bool = False,
+) -> Iterator[pandas.DataFrame]:
+    """Read the table chunk by chunk, so that memory is bounded by chunksize
+    instead of the table size. Chunks are read by the same engine and typed
+    the same as gen_data_frame. Csv is read by pandas only if arrow fails
+    before the first chunk. If narrow_dtypes is set, str columns are scanned
+    first, so that every chunk has the categories of the whole table.
+    """
+    assert chunksize > 0, f"Chunk size should be positive, but got {chunksize}"
+
+    source = TableSource(task_input, file_path)
+    chunks = iter_table_source(source, usecols, chunksize, narrow_dtypes)
+    if not narrow_dtypes:
+        yield from chunks
+        return
+    categories = gen_categories(source, usecols, chunksize)
+    for chunk in chunks:
+        yield narrow_data_frame(chunk, source, categories)
+
+
+def iter_table_source(
+    source: TableSource,
+    usecols: list = None,
+    chunksize: int = DEFAULT_CHUNK_SIZE,
+    narrow_dtypes: bool = False,
+) -> Iterator[pandas.DataFrame]:
+    if source.table_format != TABLE_FORMAT_CSV:
+        yield from index_chunks(iter_columnar_table(source, usecols, chunksize))
+        return
+
+    if pyarrow is not None:
+        chunks = index_chunks(
+            iter_csv_by_arrow(source, usecols, chunksize, narrow_dtypes)
+        )
+        try:
+            first_chunk = next(chunks)
+        except (pyarrow.ArrowException, ValueError) as e:
+            logging.warning(
+                f"Can not read {source.data_path} with arrow engine: {e}. Use pandas engine instead."
+            )
+        else:
+            yield first_chunk
+            yield from chunks
+            return
+
+    with read_csv_by_pandas(source, usecols, chunksize, narrow_dtypes) as reader:
+        for chunk in reader:
+            yield chunk
+
+
+def write_data_frame(
+    df: pandas.DataFrame,
+    data_path: str,
+    table_format: str = DEFAULT_TABLE_FORMAT,
+    compression: str = DEFAULT_COMPRESSION,
+) -> None:
+    check_compression(compression)
+    if table_format == TABLE_FORMAT_CSV:
+        with open_output_stream(data_path, compression) as data_f:
+            data_f.write(df.to_csv(index=False).encode("utf-8"))
+    elif table_format == TABLE_FORMAT_ARROW:
+        feather.write_feather(
+            df.reset_index(drop=True),
+            data_path,
+            compression=compression if compression else "uncompressed",
+        )
+    elif table_format == TABLE_FORMAT_PARQUET:
+        df.to_parquet(
+            data_path, index=False, compression=compression if compression else "snappy"
+        )
+    else:
+        raise RuntimeError(f"unsupported table format: {table_format}")
+
+
+def read_data_frame(data_path: str) -> pandas.DataFrame:
+    """Read an arrow/parquet table with the column types stored in it, e.g.
+    intermediate results whose columns are not declared by any schema.
+    """
+    table_format = get_table_format(data_path)
+    if table_format == TABLE_FORMAT_ARROW:
+        return feather.read_feather(data_path)
+    elif table_format == TABLE_FORMAT_PARQUET:
+        return pandas.read_parquet(data_path)
+    raise RuntimeError(f"{data_path} is not a typed table")
 
 
 def gen_output_schema(
-    df: pandas.DataFrame, schema: data_pb2.TableSchema
+    df: pandas.DataFrame, schema: data_pb2.TableSchema, nullable_cols: list = ()
 ) -> data_pb2.TableSchema:
+    """Declare columns of df with the roles in schema and types of df.
+
+    Int and bool columns in nullable_cols, which can hold missing values even
+    if df does not, are declared float64 and str to be readable.
+    """
     output_schema = data_pb2.TableSchema()
 
-    for col in df.columns:
-        if col in schema.ids:
+    col_roles = dict()
+    for role, cols in [
+        (IDS, schema.ids),
+        (FEATURES, schema.features),
+        (LABELS, schema.labels),
+    ]:
+        for col in cols:
+            col_roles.setdefault(col, role)
+
+    nullable_cols = set(nullable_cols)
+    for col, dtype in df.dtypes.items():
+        role = col_roles.get(col)
+        sf_type = pd_type_to_sf(str(dtype), col in nullable_cols)
+        if role == IDS:
             output_schema.ids.append(col)
-            output_schema.id_types.append(pd_type_to_sf(str(df[col].dtype)))
-        elif col in schema.features:
+            output_schema.id_types.append(sf_type)
+        elif role == FEATURES:
             output_schema.features.append(col)
-            output_schema.feature_types.append(pd_type_to_sf(str(df[col].dtype)))
-        elif col in schema.labels:
+            output_schema.feature_types.append(sf_type)
+        elif role == LABELS:
             output_schema.labels.append(col)
-            output_schema.label_types.append(pd_type_to_sf(str(df[col].dtype)))
+            output_schema.label_types.append(sf_type)
         else:
             raise RuntimeError(f"{col} not found in schema")
     return output_schema
 
 
+def format_csv_chunk(df: pandas.DataFrame, header: bool, float_format: str) -> str:
+    return df.to_csv(index=False, header=header, float_format=float_format)
+
+
+def encode_csv_chunk(df: pandas.DataFrame, header: bool, float_format: str) -> bytes:
+    return format_csv_chunk(df, header, float_format).encode("utf-8")
+
+
+def iter_csv_chunks(
+    dfs: Iterable[pandas.DataFrame], chunksize: int, header: bool = True
+) -> Iterator:
+    has_head = not header
+    for df in dfs:
+        # an empty table still has a header
+        starts = range(0, len(df), chunksize) if len(df) > 0 or has_head else [0]
+        for start in starts:
+            yield df.iloc[start : start + chunksize], not has_head
+            has_head = True
+
+
+def write_csv_table(
+    dfs: Iterable[pandas.DataFrame],
+    data_path: str,
+    float_format: str = DEFAULT_FLOAT_FORMAT,
+    chunksize: int = DEFAULT_WRITE_CHUNK_SIZE,
+    compression: str = DEFAULT_COMPRESSION,
+    header: bool = True,
+) -> None:
+    check_compression(compression)
+    max_workers = os.cpu_count() or 1
+    with futures.ThreadPoolExecutor(max_workers) as executor, open_output_stream(
+        data_path, compression
+    ) as data_f:
+        # format chunks in parallel and write them in order as soon as they are ready,
+        # at most 2 * max_workers formatted chunks are kept in memory
+        pending = collections.deque()
+        for chunk, chunk_header in iter_csv_chunks(dfs, chunksize, header):
+            pending.append(
+                executor.submit(encode_csv_chunk, chunk, chunk_header, float_format)
+            )
+            if len(pending) >= 2 * max_workers:
+                data_f.write(pending.popleft().result())
+        while pending:
+            data_f.write(pending.popleft().result())
+
+
+class PhaseTimer:
+    """Wall time of named phases, accumulated over their runs.
+
+    Phases can be nested, and the time of an inner phase is not counted in
+    the outer one, so that phase times add up to the total time.
+    """
+
+    def __init__(self) -> None:
+        self.seconds = {}
+        self.counts = {}
+        self._stack = []
+
+    def add(self, name: str, seconds: float) -> None:
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+        self.counts[name] = self.counts.get(name, 0) + 1
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        now = time.perf_counter()
+        if self._stack:
+            # the outer phase is paused
+            outer = self._stack[-1]
+            self.seconds[outer[0]] = self.seconds.get(outer[0], 0.0) + now - outer[1]
+        self._stack.append([name, now])
+        try:
+            yield
+        finally:
+            now = time.perf_counter()
+            self.add(name, now - self._stack.pop()[1])
+            if self._stack:
+                self._stack[-1][1] = now
+
+    def iter_phase(self, name: str, items: Iterable) -> Iterator:
+        """Yield items of an iterable, and time producing them as a phase."""
+        items = iter(items)
+        while True:
+            with self.phase(name):
+                item = next(items, StopIteration)
+            if item is StopIteration:
+                return
+            yield item
+
+    def summary(self) -> str:
+        return ", ".join(
+            f"{name} {seconds:.3f}s" for name, seconds in self.seconds.items()
+        )
+
+
+def write_table(
+    df: Union[pandas.DataFrame, Iterable[pandas.DataFrame]],
+    task_output: dict,
+    schema: data_pb2.TableSchema,
+    float_format: str = DEFAULT_FLOAT_FORMAT,
+    chunksize: int = DEFAULT_WRITE_CHUNK_SIZE,
+    timer: PhaseTimer = None,
+    nullable_cols: list = (),
+) -> data_pb2.TableSchema:
+    """Write a table output and its TableSchema json in one call.
+
+    Args:
+        df: the table, or its parts in order which share the same columns.
+        task_output: output in task config, the table format is csv unless
+            "table_format" is set, and it is compressed if "compression" is
+            set to zstd or lz4.
+        schema: TableSchema declaring the role of every column.
+        float_format: format string for floats in csv, e.g. "%.6f".
+        chunksize: rows of every csv chunk formatted in parallel.
+        timer: if set, writing the TableSchema json is timed as phase
+            "schema".
+        nullable_cols: columns which can hold missing values in any part,
+            see gen_output_schema.
+    Returns:
+        output TableSchema with column types of df.
+    """
+    dfs = iter([df] if isinstance(df, pandas.DataFrame) else df)
+    # output schema is derived from the first part
+    first_df = next(dfs)
+    table_format = task_output.get(TABLE_FORMAT, DEFAULT_TABLE_FORMAT)
+    compression = task_output.get(COMPRESSION, DEFAULT_COMPRESSION)
+    check_compression(compression)
+    if table_format == TABLE_FORMAT_CSV:
+        write_csv_table(
+            itertools.chain([first_df], dfs),
+            task_output[DATA_PATH],
+            float_format,
+            chunksize,
+            compression,
+        )
+    else:
+        # columnar table can not be appended, write all parts at once
+        write_data_frame(
+            pandas.concat([first_df, *dfs], ignore_index=True),
+            task_output[DATA_PATH],
+            table_format,
+            compression,
+        )
+
+    return write_table_schema(first_df, task_output, schema, timer, nullable_cols)
+
+
+def write_table_schema(
+    df: pandas.DataFrame,
+    task_output: dict,
+    schema: data_pb2.TableSchema,
+    timer: PhaseTimer = None,
+    nullable_cols: list = (),
+) -> data_pb2.TableSchema:
+    with timer.phase(PHASE_SCHEMA) if timer else contextlib.nullcontext():
+        output_schema = gen_output_schema(df, schema, nullable_cols)
+        if task_output.get(DATA_SCHEMA_PATH):
+            with open(task_output[DATA_SCHEMA_PATH], "w") as schema_f:
+                schema_f.write(json_format.MessageToJson(output_schema))
+    return output_schema
+
+
+def concat_csv_parts(
+    header_df: pandas.DataFrame,
+    part_paths: Iterable[str],
+    task_output: dict,
+    schema: data_pb2.TableSchema,
+    timer: PhaseTimer = None,
+    nullable_cols: list = (),
+) -> data_pb2.TableSchema:
+    """Write a csv output by concatenating the bytes of header-less csv parts.
+
+    The header and the output schema come from the columns and types of
+    header_df, see gen_output_schema for nullable_cols. Parts should be
+    compressed the same as the output, zstd/lz4 frames are still readable
+    after concatenation. Every part is removed once it is copied, so parts
+    can be yielded as soon as they are ready.
+    """
+    data_path = task_output[DATA_PATH]
+    compression = task_output.get(COMPRESSION, DEFAULT_COMPRESSION)
+    check_compression(compression)
+    write_csv_table([header_df.iloc[:0]], data_path, compression=compression)
+    with open(data_path, "ab") as data_f:
+        for part_path in part_paths:
+            with open(part_path, "rb") as part_f:
+                shutil.copyfileobj(part_f, data_f, COPY_BUFFER_SIZE)
+            os.remove(part_path)
+    return write_table_schema(header_df, task_output, schema, timer, nullable_cols)
+
+
+class ZstdCompressorWrapper(CompressorWrapper):
+    """Let joblib dump and load models in zstd frames, like its builtin lz4."""
+
+    def __init__(self):
+        super().__init__(obj=None, prefix=ZSTD_MAGIC, extension=".zst")
+
+    def compressor_file(self, fileobj, compresslevel=None):
+        cctx = zstandard.ZstdCompressor(
+            level=compresslevel if compresslevel else DEFAULT_MODEL_COMPRESS_LEVEL
+        )
+        return zstandard.open(fileobj, "wb", cctx=cctx)
+
+    def decompressor_file(self, fileobj):
+        return zstandard.open(fileobj, "rb")
+
+
+if zstandard is not None:
+    register_compressor(COMPRESSION_ZSTD, ZstdCompressorWrapper(), force=True)
+
+
+def write_model(model, task_output: dict) -> None:
+    """Dump a model by joblib, compressed if "compression" of task_output is
+    set. joblib.load detects the compression by itself.
+    """
+    compression = task_output.get(COMPRESSION, DEFAULT_COMPRESSION)
+    check_model_compression(compression)
+    if compression is None:
+        joblib.dump(model, task_output[DATA_PATH])
+        return
+    joblib.dump(
+        model,
+        task_output[DATA_PATH],
+        compress=(compression, DEFAULT_MODEL_COMPRESS_LEVEL),
+    )
+
+
+def gen_hash_key(seed: int) -> str:
+    assert (
+        0 <= seed < 1 << 64
+    ), f"Hash seed should be a 64-bit unsigned int, but got {seed}"
+    # 16 bytes key of siphash used by pandas
+    return f"{seed:016x}"
+
+
+def hash_join_keys(
+    df: pandas.DataFrame, join_key: list, seed: int = DEFAULT_HASH_SEED
+) -> np.ndarray:
+    """Stable and seedable 64-bit hash of the join key of every row.
+
+    Numbers are hashed as float64, so that int and float keys which are
+    merged with each other get the same hash, so do 0.0 and -0.0.
+    """
+    keys = pandas.DataFrame(
+        {
+            col: (
+                df[col].astype("float64") + 0.0
+                if pandas.api.types.is_numeric_dtype(df[col])
+                and not pandas.api.types.is_bool_dtype(df[col])
+                else df[col]
+            )
+            for col in join_key
+        },
+        columns=join_key,
+    )
+    # join keys are mostly distinct, factorizing them before hashing is a waste
+    return pandas.util.hash_pandas_object(
+        keys, index=False, hash_key=gen_hash_key(seed), categorize=False
+    ).to_numpy()
+
+
+def gen_bloom_filter_size(key_num: int, fpr: float) -> tuple:
+    """Optimal bits and hashes of a Bloom filter for key_num keys with false
+    positive rate fpr: m = -n * ln(p) / ln(2)^2 and k = m / n * ln(2).
+    Bits are rounded up to 64-bit words.
+    """
+    assert 0 < fpr < 1, f"False positive rate should be in (0, 1), but got {fpr}"
+    key_num = max(key_num, 1)
+    bit_num = math.ceil(-key_num * math.log(fpr) / math.log(2) ** 2 / 64) * 64
+    hash_num = max(round(bit_num / key_num * math.log(2)), 1)
+    return bit_num, hash_num
+
+
+class BloomFilter:
+    """Bloom filter of join keys, rows are tested by the keys of their join key
+    columns. The bit positions of a key are derived from its 64-bit hash by
+    double hashing, so every row is hashed once whatever the hash number is.
+    Keys are compared the same way as hash_join_keys.
+    """
+
+    def __init__(
+        self, key_num: int, fpr: float, seed: int = BLOOM_FILTER_HASH_SEED
+    ) -> None:
+        self.bit_num, self.hash_num = gen_bloom_filter_size(key_num, fpr)
+        self.seed = seed
+        self.words = np.zeros(self.bit_num // 64, dtype=np.uint64)
+
+    @property
+    def nbytes(self) -> int:
+        return self.words.nbytes
+
+    def iter_bits(self, df: pandas.DataFrame, join_key: list):
+        hashes = hash_join_keys(df, join_key, self.seed)
+        h1 = hashes >> np.uint64(32)
+        # an odd step is never 0, so the probes of a key do not stay on one bit
+        h2 = (hashes & np.uint64(0xFFFFFFFF)) | np.uint64(1)
+        for i in range(self.hash_num):
+            bits = (h1 + np.uint64(i) * h2) % np.uint64(self.bit_num)
+            yield bits >> np.uint64(6), np.uint64(1) << (bits & np.uint64(63))
+
+    def add(self, df: pandas.DataFrame, join_key: list) -> None:
+        for words, masks in self.iter_bits(df, join_key):
+            np.bitwise_or.at(self.words, words, masks)
+
+    def contains(self, df: pandas.DataFrame, join_key: list) -> np.ndarray:
+        """Whether the key of every row may be added, keys never added are
+        reported with the false positive rate the filter is sized for.
+        """
+        found = np.ones(len(df), dtype=bool)
+        for words, masks in self.iter_bits(df, join_key):
+            found &= (self.words[words] & masks) != 0
+        return found
+
+
+def split_data_frame(
+    df: pandas.DataFrame, file_index: np.ndarray, file_num: int
+) -> list:
+    # a stable sort keeps the row order in every part, and scans df only once
+    order = np.argsort(file_index, kind="stable")
+    ends = np.cumsum(np.bincount(file_index, minlength=file_num))
+    starts = ends - np.bincount(file_index, minlength=file_num)
+    df = df.take(order)
+    return [df.iloc[start:end] for start, end in zip(starts, ends)]
+
+
+class PartitionWriter:
+    """Append chunks of a table to a partition file in csv or arrow format."""
+
+    def __init__(self, file_path: str, source: TableSource, partition_format: str):
+        self.partition_format = partition_format
+        if partition_format == TABLE_FORMAT_CSV:
+            self.file = open(file_path, "w", newline="")
+            # header is quoted and delimited the same as rows
+            self.file.write(
+                pandas.DataFrame(columns=source.col_names).to_csv(index=False)
+            )
+        elif partition_format == TABLE_FORMAT_ARROW:
+            assert pyarrow is not None, "pyarrow is required to write arrow table"
+            self.schema = pyarrow.schema(
+                [
+                    (col_name, sf_to_pa_type(source.get_col_type(col_name)))
+                    for col_name in source.col_names
+                ]
+            )
+            self.file = pyarrow.ipc.new_file(file_path, self.schema)
+        else:
+            raise RuntimeError(f"unsupported partition format: {partition_format}")
+
+    def write(self, df: pandas.DataFrame) -> None:
+        if len(df) == 0:
+            return
+        if self.partition_format == TABLE_FORMAT_CSV:
+            self.file.write(format_csv_chunk(df, False, DEFAULT_FLOAT_FORMAT))
+        else:
+            self.file.write_table(
+                pyarrow.Table.from_pandas(df, self.schema, preserve_index=False)
+            )
+
+    def close(self) -> None:
+        self.file.close()
+
+
 def split_bigfile_into_smallfiles(
     task_input: dict,
     join_key: list,
     file_num: int,
+    seed: int = DEFAULT_HASH_SEED,
+    partition_format: str = DEFAULT_PARTITION_FORMAT,
+    chunksize: int = DEFAULT_CHUNK_SIZE,
+    key_filter: BloomFilter = None,
 ) -> list:
+    """Hash partition the table by join key into file_num files.
+
+    The table is read chunk by chunk, the keys of a chunk are hashed at
+    once by hash_join_keys, and the parts of a chunk are written to their
+    files in parallel. Rows with equal keys of different tables land in the
+    same partition if the same seed is used. Partitions are read back by
+    gen_data_frame whatever the partition_format is.
+
+    Rows whose keys are not in key_filter are dropped before partitioning,
+    the table itself is returned only if nothing is filtered and file_num is 1.
+    """
     data_path = task_input[DATA_PATH]
     assert data_path, "Data path is empty."
-    if file_num == 1:
+    if file_num == 1 and key_filter is None:
         return [data_path]
 
     # split big file into small files
     file_names = [data_path + "_" + str(index) for index in range(file_num)]
-    file_handles = [open(filename, "w") for filename in file_names]
 
-    dialect = get_dialect(data_path)
-
-    col_names = get_col_names(task_input, dialect.delimiter, data_path)
-    join_key_idx = [i for i in range(len(col_names)) if col_names[i] in join_key]
-
-    # write header to every small files
-    header = dialect.lineterminator.join(col_names) + dialect.lineterminator
-    [handle.write(header) for handle in file_handles]
-
-    with open(data_path, "r", newline="") as csv_file:
-        reader = csv.reader(
-            csv_file, delimiter=dialect.delimiter, lineterminator=dialect.lineterminator
+    source = TableSource(task_input, data_path)
+    writers = [
+        PartitionWriter(file_name, source, partition_format) for file_name in file_names
+    ]
+    row_num = 0
+    kept_row_num = 0
+    try:
+        with futures.ThreadPoolExecutor(min(file_num, os.cpu_count() or 1)) as executor:
+            for chunk in iter_data_frame(task_input, data_path, chunksize=chunksize):
+                row_num += len(chunk)
+                if key_filter is not None:
+                    chunk = chunk[key_filter.contains(chunk, join_key)]
+                kept_row_num += len(chunk)
+                file_index = hash_join_keys(chunk, join_key, seed) % np.uint64(file_num)
+                parts = split_data_frame(chunk, file_index.astype(np.intp), file_num)
+                # every writer gets one part of a chunk, so rows keep their order
+                list(executor.map(PartitionWriter.write, writers, parts))
+    finally:
+        for writer in writers:
+            writer.close()
+    if key_filter is not None:
+        logging.info(
+            f"{kept_row_num} of {row_num} rows of {data_path} passed the filter"
         )
-        # skip header
-        next(reader)
-        for row in reader:
-            file_index = (
-                hash(dialect.lineterminator.join([row[idx] for idx in join_key_idx]))
-                % file_num
-            )
-            file_handles[file_index].write(
-                dialect.lineterminator.join(row) + dialect.lineterminator
-            )
-
-    [handle.close() for handle in file_handles]
     return file_names
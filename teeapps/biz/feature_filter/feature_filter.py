@@ -17,7 +17,6 @@ import json
 import logging
 import sys
 
-from google.protobuf import json_format
 from secretflow.spec.v1 import data_pb2
 from teeapps.biz.common import common
 
@@ -45,15 +44,11 @@ def run_feature_filter(task_config: dict) -> None:
     use_columns = [col for col in columns if col not in input[DROP_FEATURES]]
 
     df = common.gen_data_frame(task_input=input, usecols=use_columns)
-    df.to_csv(output[common.DATA_PATH], index=False)
-
-    logging.info("Dumping output schema...")
-    output_schema = data_pb2.TableSchema()
-    common.append_table_schema(output_schema, input[common.SCHEMA])
-    output_schema = common.gen_output_schema(df, output_schema)
-    schema_json = json_format.MessageToJson(output_schema)
-    with open(output[common.DATA_SCHEMA_PATH], "w") as schema_f:
-        schema_f.write(schema_json)
+
+    logging.info("Dumping output and schema...")
+    schema = data_pb2.TableSchema()
+    common.append_table_schema(schema, input[common.SCHEMA])
+    common.write_table(df, output, schema)
 
 
 def main():
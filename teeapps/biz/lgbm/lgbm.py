@@ -17,7 +17,6 @@ import json
 import logging
 import sys
 
-import joblib
 import lightgbm as lgb
 import pandas
 
@@ -51,10 +50,6 @@ def run_lgbm(task_config: dict):
     assert len(inputs) == 1, f"{COMPONENT_NAME} should have only 1 input"
     assert len(outputs) == 1, f"{COMPONENT_NAME} should have only 1 output"
 
-    # get train data
-    logging.info("Loading training data...")
-    df = common.gen_data_frame(inputs[0])
-
     # labels in schema can be multiple, but eval target label is unique(in params)
     ids = inputs[0][IDS]
     labels = inputs[0][LABEL]
@@ -63,6 +58,11 @@ def run_lgbm(task_config: dict):
     features = inputs[0][common.SCHEMA][common.FEATURES]
     features = [feature for feature in features if feature not in ids + labels]
 
+    # get train data
+    logging.info("Loading training data...")
+    usecols = common.plan_usecols(inputs[0], features, labels)
+    df = common.gen_data_frame(inputs[0], usecols=usecols)
+
     X = df[features]
     Y = pandas.to_numeric(df[labels[0]], errors="coerce")
 
@@ -89,8 +89,7 @@ def run_lgbm(task_config: dict):
 
     # dump model
     logging.info("Dumping model...")
-    model_data_path = outputs[0][common.DATA_PATH]
-    joblib.dump(model, model_data_path)
+    common.write_model(model, outputs[0])
 
 
 def main():
@@ -20,7 +20,6 @@ import sys
 import joblib
 import numpy as np
 import pandas
-from google.protobuf import json_format
 from lightgbm import LGBMClassifier, LGBMRegressor
 from secretflow.spec.v1 import data_pb2
 from sklearn.linear_model import LogisticRegression, Ridge
@@ -54,46 +53,18 @@ def run_predict(task_config: dict):
     assert len(inputs) == 2, "Predict should have only 2 input"
     assert len(outputs) == 1, "Predict should have only 1 output"
 
-    # deal input data
-    logging.info("Dealing input data...")
-    # get test data
-    df = common.gen_data_frame(inputs[0])
-
     # load model
     logging.info("Loading model...")
     model = joblib.load(inputs[1][common.DATA_PATH])
 
-    logging.info("Model predicting...")
     # check model type
-    if isinstance(model, (XGBClassifier, LogisticRegression)):
-        predict_data = df[model.feature_names_in_]
-        # prob list, only get index=1, which means positive probability
-        predict_result = pandas.DataFrame(
-            [round(x, 6) for x in model.predict_proba(predict_data)[:, 1]],
-            columns=[task_config[PRED_NAME]],
-        )
-    elif isinstance(model, (XGBRegressor, Ridge)):
-        predict_data = df[model.feature_names_in_]
-        predict_result = pandas.DataFrame(
-            [round(x, 6) for x in model.predict(predict_data)],
-            columns=[task_config[PRED_NAME]],
-        )
-    elif isinstance(model, LGBMClassifier):
-        predict_data = df[model.origin_feature_name_]
-        predict_result = pandas.DataFrame(
-            [round(x, 6) for x in model.predict_proba(predict_data)[:, 1]],
-            columns=[task_config[PRED_NAME]],
-        )
-    elif isinstance(model, LGBMRegressor):
-        predict_data = df[model.origin_feature_name_]
-        predict_result = pandas.DataFrame(
-            [round(x, 6) for x in model.predict(predict_data)],
-            columns=[task_config[PRED_NAME]],
-        )
+    if isinstance(model, (XGBClassifier, LogisticRegression, XGBRegressor, Ridge)):
+        model_features = list(model.feature_names_in_)
+    elif isinstance(model, (LGBMClassifier, LGBMRegressor)):
+        model_features = list(model.origin_feature_name_)
     else:
         raise RuntimeError(f"Unsupported model type: {type(model)}")
 
-    result_list = [predict_result]
     ids = (
         inputs[0][IDS]
         if len(inputs[0][IDS]) > 0
@@ -105,13 +76,43 @@ def run_predict(task_config: dict):
         else inputs[0][common.SCHEMA][common.LABELS]
     )
     features = inputs[0][common.SCHEMA][common.FEATURES]
+    if task_config[SAVE_ID] == True:
+        assert len(ids) > 0, "ID should not empty when save_id is true."
+    if task_config[SAVE_LABEL] == True:
+        assert len(labels) > 0, "Label should not empty when save_label is true."
+
+    # deal input data
+    logging.info("Dealing input data...")
+    # get test data
+    usecols = common.plan_usecols(
+        inputs[0],
+        model_features,
+        ids[:1] if task_config[SAVE_ID] == True else [],
+        labels[:1] if task_config[SAVE_LABEL] == True else [],
+        task_config[COL_NAMES],
+    )
+    df = common.gen_data_frame(inputs[0], usecols=usecols)
+
+    logging.info("Model predicting...")
+    predict_data = df[model_features]
+    if isinstance(model, (XGBClassifier, LogisticRegression, LGBMClassifier)):
+        # prob list, only get index=1, which means positive probability
+        predict_result = pandas.DataFrame(
+            [round(x, 6) for x in model.predict_proba(predict_data)[:, 1]],
+            columns=[task_config[PRED_NAME]],
+        )
+    else:
+        predict_result = pandas.DataFrame(
+            [round(x, 6) for x in model.predict(predict_data)],
+            columns=[task_config[PRED_NAME]],
+        )
+
+    result_list = [predict_result]
 
     # output data
     if task_config[SAVE_ID] == True:
-        assert len(ids) > 0, "ID should not empty when save_id is true."
         result_list.append(df[[ids[0]]].rename(columns={ids[0]: task_config[ID_NAME]}))
     if task_config[SAVE_LABEL] == True:
-        assert len(labels) > 0, "Label should not empty when save_label is true."
         result_list.append(
             df[[labels[0]]].rename(columns={labels[0]: task_config[LABEL_NAME]})
         )
@@ -119,10 +120,7 @@ def run_predict(task_config: dict):
         result_list.append(df[task_config[COL_NAMES]])
     result = pandas.concat(result_list, axis=1)
     # dump data
-    logging.info("Dumping data...")
-    output_path = outputs[0][common.DATA_PATH]
-    result.to_csv(output_path, index=False)
-    # dump output schema
+    logging.info("Dumping data and schema...")
     # set default type TABLE_SCHEMA_STRING_TYPE
     schema = data_pb2.TableSchema()
     schema.labels.append(task_config[PRED_NAME])
@@ -141,10 +139,7 @@ def run_predict(task_config: dict):
     else:
         schema.features.extend(features)
         schema.feature_types.extend([common.TABLE_SCHEMA_STRING_TYPE for _ in features])
-    schema = common.gen_output_schema(result, schema)
-    schema_json = json_format.MessageToJson(schema)
-    with open(outputs[0][common.DATA_SCHEMA_PATH], "w") as schema_f:
-        schema_f.write(schema_json)
+    common.write_table(result, outputs[0], schema)
 
 
 def main():
@@ -13,55 +13,1273 @@
 # limitations under the License.
 
 
+import itertools
 import json
 import logging
 import math
+import multiprocessing
 import os
 import sys
+import time
 from concurrent import futures
+from typing import Iterator, NamedTuple
 
+import numpy as np
 import pandas
-from google.protobuf import json_format
 from secretflow.spec.v1 import data_pb2
 from teeapps.biz.common import common
 
 COMPONENT_NAME = "psi"
 
 KEY = "key"
+MEMORY_BUDGET = "memory_budget"
+WORKER_NUM = "worker_num"
+BLOOM_FILTER_FPR = "bloom_filter_fpr"
+JOIN_METHOD = "join_method"
+KEY_FINGERPRINT = "key_fingerprint"
+JOIN_TYPE = "join_type"
+MAX_OUTPUT_ROWS = "max_output_rows"
 
+# sort-merge join if every input looks sorted by join key, otherwise hash join
+JOIN_METHOD_AUTO = "auto"
+JOIN_METHOD_HASH = "hash"
+# every input is declared sorted by join key in ascending order
+JOIN_METHOD_SORT_MERGE = "sort_merge"
+JOIN_METHODS = [JOIN_METHOD_AUTO, JOIN_METHOD_HASH, JOIN_METHOD_SORT_MERGE]
+DEFAULT_JOIN_METHOD = JOIN_METHOD_AUTO
+# rows of the first input are all kept by left joins, and rows of every
+# input by outer joins, columns of missing rows are null
+JOIN_TYPE_INNER = "inner"
+JOIN_TYPE_LEFT = "left"
+JOIN_TYPE_OUTER = "outer"
+JOIN_TYPES = [JOIN_TYPE_INNER, JOIN_TYPE_LEFT, JOIN_TYPE_OUTER]
+DEFAULT_JOIN_TYPE = JOIN_TYPE_INNER
+# composite and non-numeric keys are indexed and joined by 64-bit fingerprints
+# in memory, which are hashed once while building and probing
+DEFAULT_KEY_FINGERPRINT = True
+
+# upper bound of a partition in text bytes, also the lower bound of partition number
 DEFAULT_FILE_SIZE_LIMIT_IN_BYTES = 200 * 1024 * 1024
+DEFAULT_MEMORY_BUDGET_IN_MB = 2048
+# rows read from the head of every input to estimate row width and key cardinality
+SAMPLE_ROWS = 10000
+# every input keeps a file handle for each partition while splitting
+MAX_FILE_NUM = 256
+# 0 uses as many workers as the plan allows
+DEFAULT_WORKER_NUM = 0
+# smallest key hashes kept by a sketch, estimates have about 1/sqrt(k) error
+KEY_SKETCH_SIZE = 1024
+# differs from seeds of partitions and filters, so sketches are unbiased
+KEY_SKETCH_HASH_SEED = 2
+# inputs are reordered only if intermediate rows shrink below this ratio,
+# since estimates are rough and restoring the output order costs a sort
+JOIN_ORDER_MIN_RATIO = 0.5
+# keys of the input with the least keys are put in a Bloom filter, rows of
+# other inputs missing in it are dropped before partitioning, 0 disables it
+DEFAULT_BLOOM_FILTER_FPR = 0.01
+# counters of the Misra-Gries summary of every input, the count of a key is
+# underestimated by at most rows / (HEAVY_KEY_NUM + 1)
+HEAVY_KEY_NUM = 4096
+# keys of the smallest hashes of every input whose counts are kept exactly
+MULTIPLICITY_SAMPLE_SIZE = 4096
+# psi refuses to join if the projected output has more rows, 0 disables it
+DEFAULT_MAX_OUTPUT_ROWS = 0
+# log format of the app, also set up in partition workers
+LOG_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+
+# phases timed by run_psi, join of partitions is the sum over workers, and
+# join_wait is the time the output waits for them
+PHASE_PLAN = "plan"
+PHASE_SPLIT = "split"
+PHASE_JOIN = "join"
+PHASE_JOIN_WAIT = "join_wait"
+PHASE_DUMP = "dump"
+
+
+class UnsortedInputError(RuntimeError):
+    pass
+
+
+class JoinExplosionError(RuntimeError):
+    pass
+
+
+class InputStats(NamedTuple):
+    rows: int
+    # memory of a row once loaded by pandas
+    row_bytes: float
+    # estimated number of distinct join keys
+    key_num: int
+    # whether sampled rows are sorted by join key
+    key_sorted: bool
+
+
+class KeySketch(NamedTuple):
+    rows: int
+    key_num: int
+    # the smallest distinct key hashes in ascending order, a uniform sample of keys
+    hashes: np.ndarray
+
+
+class MultiplicitySketch(NamedTuple):
+    rows: int
+    # Misra-Gries summary of frequent keys, hashes in ascending order and
+    # their counts, which are lower bounds
+    heavy_hashes: np.ndarray
+    heavy_counts: np.ndarray
+    # the smallest distinct key hashes in ascending order and their exact counts
+    sample_hashes: np.ndarray
+    sample_counts: np.ndarray
+    # whether the sample holds every key
+    complete: bool
+
+
+class PsiPlan(NamedTuple):
+    in_memory: bool
+    file_num: int
+    workers: int
+    memory_budget: int
+    input_bytes: int
+    output_rows: int
+    output_bytes: int
+    # estimated number of distinct join keys of every input
+    key_nums: tuple
+    # whether sampled rows of every input are sorted by join key
+    key_sorted: bool
+    # projected output rows of the most frequent key, which can not be split,
+    # 0 if keys are not sketched
+    max_key_rows: int = 0
+
+
+def get_physical_memory() -> int:
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def count_csv_rows(source: common.TableSource, sample_num: int) -> int:
+    if source.compression is not None:
+        # size of compressed file tells nothing about rows, count lines instead
+        line_num = 0
+        with source.open_input() as stream:
+            for block in iter(lambda: stream.read(common.HEADER_BLOCK_SIZE), b""):
+                line_num += block.count(b"\n")
+        return max(line_num - 1, sample_num)
+
+    # extrapolate rows from the text width of sampled rows
+    with open(source.data_path, "rb") as file:
+        header_bytes = len(file.readline())
+        sample_bytes = sum(len(file.readline()) for _ in range(sample_num))
+    file_size = os.path.getsize(source.data_path)
+    return max(math.ceil((file_size - header_bytes) * sample_num / sample_bytes), 1)
+
+
+def estimate_key_num(sample_keys: pandas.DataFrame, rows: int) -> int:
+    """GEE estimator of distinct keys, keys seen once in the sample are scaled by
+    sqrt(rows / sample rows), the error ratio is bounded by the same factor.
+    """
+    key_counts = sample_keys.value_counts(dropna=False)
+    singleton_num = int((key_counts == 1).sum())
+    if singleton_num == len(sample_keys):
+        # keys are unique in most psi tasks, GEE would underestimate them
+        return rows
+    key_num = math.sqrt(rows / len(sample_keys)) * singleton_num + (
+        len(key_counts) - singleton_num
+    )
+    return min(max(math.ceil(key_num), len(key_counts), 1), rows)
+
+
+def gen_key_arrays(df: pandas.DataFrame, join_key: list) -> list:
+    return [df[col].to_numpy() for col in join_key]
+
+
+def compare_keys(left_keys: list, right_keys: list) -> tuple:
+    """Compare keys in lexicographic order, right keys may be scalars.
+
+    Returns:
+        masks of left keys less than and equal to right keys.
+    """
+    less = np.zeros(len(left_keys[0]), dtype=bool)
+    equal = np.ones(len(left_keys[0]), dtype=bool)
+    for left, right in zip(left_keys, right_keys):
+        less |= equal & (left < right)
+        equal &= left == right
+    return less, equal
+
+
+def is_key_sorted(keys: list, last_key: tuple = None) -> bool:
+    """Whether keys are in ascending order and not less than last_key. Null
+    keys are never regarded as sorted, since they are joined with each other
+    by pandas but can not be compared.
+    """
+    if any(pandas.isna(col).any() for col in keys):
+        return False
+    if last_key is not None:
+        keys = [
+            np.concatenate([np.array([key], dtype=col.dtype), col])
+            for key, col in zip(last_key, keys)
+        ]
+    if len(keys[0]) < 2:
+        return True
+    descending, _ = compare_keys([col[1:] for col in keys], [col[:-1] for col in keys])
+    return not descending.any()
+
+
+def sample_input(task_input: dict, join_key: list) -> InputStats:
+    source = common.TableSource(task_input)
+    sample_df = next(common.iter_data_frame(task_input, chunksize=SAMPLE_ROWS))
+    sample_num = len(sample_df)
+    if sample_num == 0:
+        return InputStats(0, 0.0, 0, True)
+
+    if sample_num < SAMPLE_ROWS:
+        # the whole table is sampled
+        rows = sample_num
+    elif source.table_format == common.TABLE_FORMAT_CSV:
+        rows = count_csv_rows(source, sample_num)
+    else:
+        rows = len(common.read_columnar_table(source, join_key))
+
+    row_bytes = sample_df.memory_usage(index=False, deep=True).sum() / sample_num
+    return InputStats(
+        rows,
+        row_bytes,
+        estimate_key_num(sample_df[join_key], rows),
+        is_key_sorted(gen_key_arrays(sample_df, join_key)),
+    )
+
+
+def sum_counts(hashes: np.ndarray, counts: np.ndarray) -> tuple:
+    """Sum counts of the same hash, and sort hashes in ascending order."""
+    hashes, inverse = np.unique(hashes, return_inverse=True)
+    sums = np.zeros(len(hashes), dtype=np.int64)
+    np.add.at(sums, inverse, counts)
+    return hashes, sums
+
+
+def gen_multiplicity_sketch(task_input: dict, join_key: list) -> MultiplicitySketch:
+    """Sketch how many rows every join key has by a scan of key columns.
+
+    Frequent keys are found by a mergeable Misra-Gries summary: every chunk
+    is counted exactly and added to the summary, then if the summary has more
+    than HEAVY_KEY_NUM keys, the (HEAVY_KEY_NUM + 1)-th largest count is taken
+    from all keys and keys left with nothing are dropped. Keys of the
+    smallest hashes are a uniform sample of keys, and their counts are exact,
+    since a key dropped from the sample never gets back. Hashes are seeded
+    the same for every input, so that samples of inputs are coordinated.
+    """
+    rows = 0
+    heavy_hashes = np.array([], dtype=np.uint64)
+    heavy_counts = np.array([], dtype=np.int64)
+    sample_hashes = np.array([], dtype=np.uint64)
+    sample_counts = np.array([], dtype=np.int64)
+    complete = True
+    for chunk in common.iter_data_frame(task_input, usecols=join_key):
+        rows += len(chunk)
+        hashes, counts = np.unique(
+            common.hash_join_keys(chunk, join_key, KEY_SKETCH_HASH_SEED),
+            return_counts=True,
+        )
+
+        heavy_hashes, heavy_counts = sum_counts(
+            np.concatenate([heavy_hashes, hashes]),
+            np.concatenate([heavy_counts, counts]),
+        )
+        if len(heavy_hashes) > HEAVY_KEY_NUM:
+            cut = np.partition(heavy_counts, -HEAVY_KEY_NUM - 1)[-HEAVY_KEY_NUM - 1]
+            kept = heavy_counts > cut
+            heavy_hashes = heavy_hashes[kept]
+            heavy_counts = heavy_counts[kept] - cut
+
+        sample_hashes, sample_counts = sum_counts(
+            np.concatenate([sample_hashes, hashes[:MULTIPLICITY_SAMPLE_SIZE]]),
+            np.concatenate([sample_counts, counts[:MULTIPLICITY_SAMPLE_SIZE]]),
+        )
+        if max(len(hashes), len(sample_hashes)) > MULTIPLICITY_SAMPLE_SIZE:
+            complete = False
+            sample_hashes = sample_hashes[:MULTIPLICITY_SAMPLE_SIZE]
+            sample_counts = sample_counts[:MULTIPLICITY_SAMPLE_SIZE]
+    return MultiplicitySketch(
+        rows, heavy_hashes, heavy_counts, sample_hashes, sample_counts, complete
+    )
+
+
+def lookup_counts(
+    hashes: np.ndarray, sketch_hashes: np.ndarray, sketch_counts: np.ndarray
+) -> np.ndarray:
+    if len(sketch_hashes) == 0:
+        return np.zeros(len(hashes), dtype=np.int64)
+    index = np.minimum(np.searchsorted(sketch_hashes, hashes), len(sketch_hashes) - 1)
+    return np.where(sketch_hashes[index] == hashes, sketch_counts[index], 0)
+
+
+def gen_key_rows(counts: np.ndarray, join_type: str) -> np.ndarray:
+    """Output rows of every key, from its rows in every input as columns."""
+    # float products do not overflow
+    counts = counts.astype(np.float64)
+    if join_type == JOIN_TYPE_INNER:
+        return counts.prod(axis=1)
+    # a missing input is a null row
+    kept_counts = np.maximum(counts, 1)
+    if join_type == JOIN_TYPE_LEFT:
+        return counts[:, 0] * kept_counts[:, 1:].prod(axis=1)
+    return np.where(counts.any(axis=1), kept_counts.prod(axis=1), 0)
+
+
+def project_output_rows(sketches: list, join_type: str = DEFAULT_JOIN_TYPE) -> tuple:
+    """Project the output rows from multiplicity sketches of all inputs.
+
+    Keys frequent in any input are counted in every input, exactly if its
+    sample covers the key hash, otherwise by its summary. Other keys are
+    estimated from samples: below the smallest max hash of incomplete
+    samples, every sample holds all keys of its input, so the rows of keys
+    there are scaled up by the inverse of the covered fraction of hashes.
+
+    Returns:
+        projected output rows, and the most output rows of a single key.
+    """
+    max_hash = np.uint64(np.iinfo(np.uint64).max)
+    bounds = [
+        max_hash if sketch.complete else sketch.sample_hashes[-1] for sketch in sketches
+    ]
+
+    def gen_counts(hashes: np.ndarray) -> np.ndarray:
+        return np.stack(
+            [
+                np.where(
+                    hashes <= bound,
+                    lookup_counts(hashes, sketch.sample_hashes, sketch.sample_counts),
+                    lookup_counts(hashes, sketch.heavy_hashes, sketch.heavy_counts),
+                )
+                for sketch, bound in zip(sketches, bounds)
+            ],
+            axis=1,
+        )
+
+    heavy_hashes = np.unique(
+        np.concatenate([sketch.heavy_hashes for sketch in sketches])
+    )
+    heavy_rows = gen_key_rows(gen_counts(heavy_hashes), join_type)
+
+    bound = min(bounds)
+    sample_hashes = np.unique(
+        np.concatenate([sketch.sample_hashes for sketch in sketches])
+    )
+    sample_hashes = sample_hashes[
+        (sample_hashes <= bound)
+        & ~np.isin(sample_hashes, heavy_hashes, assume_unique=True)
+    ]
+    sample_rows = gen_key_rows(gen_counts(sample_hashes), join_type)
+    scale = 1.0 if bound == max_hash else 2.0**64 / (float(bound) + 1)
+
+    rows = heavy_rows.sum() + sample_rows.sum() * scale
+    max_key_rows = max(heavy_rows.max(initial=0), sample_rows.max(initial=0))
+    return math.ceil(rows), math.ceil(max_key_rows)
+
+
+def plan_psi(
+    inputs: list,
+    join_keys: list,
+    memory_budget: int,
+    hold_output: bool = False,
+    join_type: str = DEFAULT_JOIN_TYPE,
+    sketch_keys: bool = False,
+) -> PsiPlan:
+    """Estimate the join from samples of inputs, and pick the way to join.
+
+    Keys of the smallest key set are assumed to appear in every input to
+    estimate matched rows of inputs, and output rows by the average number
+    of rows of a key. If sketch_keys, output rows are projected from
+    multiplicity sketches of join keys instead, so that many-to-many joins
+    of duplicate keys are foreseen and split into more partitions, which
+    costs a scan of the key columns of every input.
+    """
+    stats = [
+        sample_input(task_input, join_key)
+        for task_input, join_key in zip(inputs, join_keys)
+    ]
+    for i, stat in enumerate(stats):
+        logging.info(
+            f"Input {i}: estimated {stat.rows} rows, {stat.row_bytes:.1f} bytes per row, "
+            f"{stat.key_num} distinct keys, "
+            f"{'sorted' if stat.key_sorted else 'not sorted'} by join key"
+        )
+
+    key_nums = tuple(stat.key_num for stat in stats)
+    key_sorted = all(stat.key_sorted for stat in stats)
+    joined_key_num = min(key_nums)
+    # rows of every input which can be joined
+    matched_rows = [
+        min(stat.rows, joined_key_num * stat.rows / stat.key_num) if stat.rows else 0
+        for stat in stats
+    ]
+    if sketch_keys:
+        output_rows, max_key_rows = project_output_rows(
+            [
+                gen_multiplicity_sketch(task_input, join_key)
+                for task_input, join_key in zip(inputs, join_keys)
+            ],
+            join_type,
+        )
+        logging.info(
+            f"Projected output has {output_rows} rows, "
+            f"and at most {max_key_rows} rows of a key"
+        )
+    else:
+        output_rows = math.ceil(
+            joined_key_num
+            * math.prod(stat.rows / stat.key_num if stat.rows else 0 for stat in stats)
+        )
+        # unmatched rows of kept inputs are output once
+        kept_indexes = {
+            JOIN_TYPE_INNER: [],
+            JOIN_TYPE_LEFT: [0],
+            JOIN_TYPE_OUTER: range(len(stats)),
+        }[join_type]
+        output_rows += math.ceil(
+            sum(stats[i].rows - matched_rows[i] for i in kept_indexes)
+        )
+        # unknown without sketches
+        max_key_rows = 0
+    output_bytes = math.ceil(output_rows * sum(stat.row_bytes for stat in stats))
+    inputs_bytes = [stat.rows * stat.row_bytes for stat in stats]
+    input_bytes = math.ceil(sum(inputs_bytes))
+
+    physical_memory = get_physical_memory()
+    if physical_memory and (memory_budget == 0 or memory_budget > physical_memory):
+        logging.info(f"Memory budget is bounded by physical memory {physical_memory}")
+        budget = physical_memory
+    else:
+        budget = memory_budget
+    workers = os.cpu_count() or 1
+
+    # the build side, matched rows of other inputs and the output are in memory,
+    # the first input is the build side of left joins, outer joins load all
+    if join_type == JOIN_TYPE_OUTER:
+        in_memory_bytes = input_bytes + output_bytes
+    else:
+        build_index = (
+            0
+            if join_type == JOIN_TYPE_LEFT
+            else min(range(len(stats)), key=lambda i: inputs_bytes[i])
+        )
+        in_memory_bytes = (
+            inputs_bytes[build_index]
+            + sum(
+                matched_rows[i] * stats[i].row_bytes
+                for i in range(len(stats))
+                if i != build_index
+            )
+            + output_bytes
+        )
+    if memory_budget > 0 and in_memory_bytes <= budget:
+        return PsiPlan(
+            True,
+            1,
+            1,
+            budget,
+            input_bytes,
+            output_rows,
+            output_bytes,
+            key_nums,
+            key_sorted,
+            max_key_rows,
+        )
+
+    # every worker joins a partition of all inputs and writes its part, the
+    # output of all partitions is kept in memory only if hold_output
+    available_bytes = budget - output_bytes if hold_output else budget
+    if available_bytes <= 0:
+        logging.warning("Estimated join output does not fit in memory budget")
+        available_bytes = budget
+    file_size_limit_num = math.ceil(
+        max(os.path.getsize(task_input[common.DATA_PATH]) for task_input in inputs)
+        / DEFAULT_FILE_SIZE_LIMIT_IN_BYTES
+    )
+    file_num = max(
+        math.ceil(workers * (input_bytes + output_bytes) / available_bytes),
+        file_size_limit_num,
+        1,
+    )
+    if file_num > MAX_FILE_NUM:
+        file_num = MAX_FILE_NUM
+        # less partitions are joined at the same time if they are larger
+        workers = max(
+            math.floor(available_bytes * file_num / (input_bytes + output_bytes)), 1
+        )
+    workers = min(workers, file_num)
+    return PsiPlan(
+        False,
+        file_num,
+        workers,
+        budget,
+        input_bytes,
+        output_rows,
+        output_bytes,
+        key_nums,
+        key_sorted,
+        max_key_rows,
+    )
+
+
+def check_join_explosion(plan: PsiPlan, max_output_rows: int) -> None:
+    """Refuse to join if the projected output has more than max_output_rows
+    rows, or rows of a single key, which are always joined at once, do not
+    fit in the memory budget. Rows of a key are only known from sketches.
+    """
+    if max_output_rows > 0 and plan.output_rows > max_output_rows:
+        raise JoinExplosionError(
+            f"Projected output has {plan.output_rows} rows, "
+            f"more than max_output_rows {max_output_rows}"
+        )
+    row_bytes = plan.output_bytes / plan.output_rows if plan.output_rows else 0
+    key_bytes = math.ceil(plan.max_key_rows * row_bytes)
+    if plan.memory_budget > 0 and key_bytes > plan.memory_budget:
+        raise JoinExplosionError(
+            f"Projected output has {plan.max_key_rows} rows of a single key in "
+            f"{key_bytes} bytes, more than the memory budget {plan.memory_budget}"
+        )
+
+
+def gen_nullable_data_frame(df: pandas.DataFrame) -> pandas.DataFrame:
+    """Cast int and bool columns to nullable types, so that they keep their
+    types with missing rows of left and outer joins, instead of being float
+    and object in some partitions only.
+    """
+    dtypes = {}
+    for col, dtype in df.dtypes.items():
+        if isinstance(dtype, np.dtype) and dtype.kind == "b":
+            dtypes[col] = "boolean"
+        elif isinstance(dtype, np.dtype) and dtype.kind in "iu":
+            # int8 -> Int8, uint64 -> UInt64
+            dtypes[col] = dtype.name.capitalize().replace("Uint", "UInt")
+    return df.astype(dtypes) if dtypes else df
 
 
-def run_psi_part(file_list: list, inputs: dict, join_keys: list) -> pandas.DataFrame:
+def gen_join_data_frames(dfs: list, join_type: str) -> list:
+    """Cast dfs whose columns can be null in the join to nullable types."""
+    if join_type == JOIN_TYPE_INNER:
+        return dfs
+    return [
+        df if i == 0 and join_type == JOIN_TYPE_LEFT else gen_nullable_data_frame(df)
+        for i, df in enumerate(dfs)
+    ]
+
+
+def gen_nullable_cols(inputs: list, join_keys: list, join_type: str) -> list:
+    """Output columns which hold missing values of unmatched rows.
+
+    Every row keeps the keys of the first input, by left joins since all its
+    rows are kept, and by outer joins since keys of other rows are put in.
+    """
+    if join_type == JOIN_TYPE_INNER:
+        return []
+    nullable_inputs = inputs[1:] if join_type == JOIN_TYPE_LEFT else inputs
+    cols = []
+    for task_input in nullable_inputs:
+        cols.extend(common.get_cols_in_schema(task_input[common.SCHEMA]))
+    return [col for col in cols if col not in join_keys[0]]
+
+
+def merge_keys(
+    left_df: pandas.DataFrame,
+    right_df: pandas.DataFrame,
+    left_key: list,
+    right_key: list,
+    join_type: str = DEFAULT_JOIN_TYPE,
+) -> pandas.DataFrame:
+    """Merge as pandas does. Keys of rows only in right_df are also put in
+    the left key columns by outer joins, as pandas does for keys of the same
+    name, so that the left keys are the keys of all rows and can be joined
+    with more inputs.
+    """
+    df = left_df.merge(right_df, how=join_type, left_on=left_key, right_on=right_key)
+    if join_type == JOIN_TYPE_OUTER:
+        # right columns follow left columns, keys of the same name are merged
+        right_cols = list(right_df.columns)
+        for left_col, right_col in zip(left_key, right_key):
+            if left_col == right_col:
+                right_cols.remove(right_col)
+        for left_col, right_col in zip(left_key, right_key):
+            if left_col != right_col:
+                left_pos = left_df.columns.get_loc(left_col)
+                right_pos = len(left_df.columns) + right_cols.index(right_col)
+                df.isetitem(
+                    left_pos, df.iloc[:, left_pos].fillna(df.iloc[:, right_pos])
+                )
+    return df
+
+
+def merge_data_frame(
+    left_df: pandas.DataFrame,
+    right_df: pandas.DataFrame,
+    left_key: list,
+    right_key: list,
+    join_type: str = DEFAULT_JOIN_TYPE,
+) -> pandas.DataFrame:
+    col_type = ",".join(f"{col}:{right_df[col].dtype}" for col in right_df.columns)
+    logging.info(f"Right dataframe's column types are {col_type}")
+
+    assert len(left_key) == len(right_key), "Join keys should be the same size"
+
+    left_df = merge_keys(left_df, right_df, left_key, right_key, join_type)
+    key_type = ",".join(f"{col}:{left_df[col].dtype}" for col in left_df.columns)
+    logging.info(f"Joined dataframe's column types are {key_type}")
+    return left_df
+
+
+def is_fingerprint_key(df: pandas.DataFrame, join_key: list) -> bool:
+    # a single numeric key is as compact as its fingerprint
+    return len(join_key) > 1 or not pandas.api.types.is_numeric_dtype(df[join_key[0]])
+
+
+def merge_by_fingerprint(
+    left_df: pandas.DataFrame,
+    right_df: pandas.DataFrame,
+    left_key: list,
+    right_key: list,
+    left_hashes: np.ndarray = None,
+    right_hashes: np.ndarray = None,
+) -> tuple:
+    """Inner join on 64-bit fingerprints of keys instead of keys.
+
+    Rows are matched by fingerprints from hash_join_keys, so the hash table
+    of pandas holds 8 bytes per key instead of Python objects. Keys of
+    matched rows are compared to drop fingerprint collisions, and the result
+    is the same as merging on keys, including column names and row order.
+    Fingerprints already known are not hashed again.
+
+    Returns:
+        joined dataframe and fingerprints of its keys.
+    """
+    if left_hashes is None:
+        left_hashes = common.hash_join_keys(left_df, left_key)
+    if right_hashes is None:
+        right_hashes = common.hash_join_keys(right_df, right_key)
+    # an empty merge checks key types and names columns, suffixes included
+    names = (
+        left_df.iloc[:0]
+        .merge(right_df.iloc[:0], left_on=left_key, right_on=right_key)
+        .columns
+    )
+    rows = pandas.DataFrame(
+        {"key": left_hashes, "left": np.arange(len(left_df))}
+    ).merge(
+        pandas.DataFrame({"key": right_hashes, "right": np.arange(len(right_df))}),
+        on="key",
+    )
+    left_rows = rows["left"].to_numpy()
+    right_rows = rows["right"].to_numpy()
+
+    matched = np.ones(len(rows), dtype=bool)
+    for left_col, right_col in zip(left_key, right_key):
+        left_keys = left_df[left_col].to_numpy()[left_rows]
+        right_keys = right_df[right_col].to_numpy()[right_rows]
+        left_null = pandas.isna(left_keys)
+        right_null = pandas.isna(right_keys)
+        # null keys are joined with each other by pandas, but never equal
+        equal = left_null & right_null
+        both = ~left_null & ~right_null
+        equal[both] = left_keys[both] == right_keys[both]
+        matched &= equal
+    if not matched.all():
+        logging.info(f"{int((~matched).sum())} fingerprint collisions are dropped")
+        left_rows = left_rows[matched]
+        right_rows = right_rows[matched]
+
+    # keys of the same name are merged into the left one
+    merged_cols = {
+        right_col
+        for left_col, right_col in zip(left_key, right_key)
+        if left_col == right_col
+    }
+    df = pandas.concat(
+        [
+            left_df.iloc[left_rows].reset_index(drop=True),
+            right_df[[col for col in right_df.columns if col not in merged_cols]]
+            .iloc[right_rows]
+            .reset_index(drop=True),
+        ],
+        axis=1,
+    )
+    assert len(df.columns) == len(names), "Joined columns mismatch"
+    df.columns = names
+    return df, left_hashes[left_rows]
+
+
+def gen_key_sketch(df: pandas.DataFrame, join_key: list) -> KeySketch:
+    hashes = np.unique(common.hash_join_keys(df, join_key, KEY_SKETCH_HASH_SEED))
+    return KeySketch(len(df), len(hashes), hashes[:KEY_SKETCH_SIZE])
+
+
+def estimate_join_rows(sketches: list) -> float:
+    """Estimate rows of joining all inputs of sketches by bottom-k sketches.
+
+    The k smallest hashes of the union are a uniform sample of the union
+    keys, and a hash among them is in an input iff it is in the sketch of
+    the input, so the fraction of them in every sketch estimates the
+    overlap. Every joined key has the average multiplicity of each input.
+    """
+    if any(sketch.key_num == 0 for sketch in sketches):
+        return 0.0
+    union_hashes = np.unique(np.concatenate([sketch.hashes for sketch in sketches]))
+    if len(union_hashes) > KEY_SKETCH_SIZE:
+        union_hashes = union_hashes[:KEY_SKETCH_SIZE]
+        union_key_num = (KEY_SKETCH_SIZE - 1) / (
+            (float(union_hashes[-1]) + 1) / 2.0**64
+        )
+    else:
+        # every input has less keys than the sketch size, so keys are exact
+        union_key_num = len(union_hashes)
+    joined = np.ones(len(union_hashes), dtype=bool)
+    for sketch in sketches:
+        joined &= np.isin(union_hashes, sketch.hashes, assume_unique=True)
+    return (
+        union_key_num
+        * joined.mean()
+        * math.prod(sketch.rows / sketch.key_num for sketch in sketches)
+    )
+
+
+def plan_join_order(dfs: list, join_keys: list) -> list:
+    """Order the left-deep join greedily, the pair with the least estimated
+    rows is joined first, then the input which keeps the least rows. The
+    input order is kept unless it makes much more intermediate rows.
+    """
+    if len(dfs) <= 2:
+        return list(range(len(dfs)))
+
+    sketches = [gen_key_sketch(df, join_key) for df, join_key in zip(dfs, join_keys)]
+    order = list(
+        min(
+            itertools.combinations(range(len(dfs)), 2),
+            key=lambda pair: estimate_join_rows([sketches[i] for i in pair]),
+        )
+    )
+    while len(order) < len(dfs):
+        order.append(
+            min(
+                (i for i in range(len(dfs)) if i not in order),
+                key=lambda i: estimate_join_rows(
+                    [sketches[j] for j in order] + [sketches[i]]
+                ),
+            )
+        )
+
+    def estimate_cost(order: list) -> float:
+        # rows of every intermediate join
+        return sum(
+            estimate_join_rows([sketches[i] for i in order[:end]])
+            for end in range(2, len(order))
+        )
+
+    planned_cost = estimate_cost(order)
+    input_order_cost = estimate_cost(list(range(len(dfs))))
+    logging.info(
+        f"Estimated intermediate rows are {planned_cost:.0f} in the order of "
+        f"{order}, and {input_order_cost:.0f} in the input order"
+    )
+    if planned_cost >= input_order_cost * JOIN_ORDER_MIN_RATIO:
+        return list(range(len(dfs)))
+    return order
+
+
+def merge_data_frames(
+    dfs: list,
+    join_keys: list,
+    order: list,
+    hashes: list = None,
+    join_type: str = DEFAULT_JOIN_TYPE,
+) -> pandas.DataFrame:
+    """Join dfs left-deep in the order, the result is the same as joining
+    them in the input order, including column names and row order. If key
+    fingerprints of dfs are given as hashes, dfs are joined on them. Left and
+    outer joins are only in the input order and never on fingerprints.
+    """
+    if order == list(range(len(dfs))):
+        if join_type != JOIN_TYPE_INNER:
+            assert not hashes, f"{join_type} join is not on fingerprints"
+            dfs = gen_join_data_frames(dfs, join_type)
+        left_df = dfs[0]
+        left_hashes = hashes[0] if hashes else None
+        for i in range(1, len(dfs)):
+            if hashes:
+                left_df, left_hashes = merge_by_fingerprint(
+                    left_df, dfs[i], join_keys[0], join_keys[i], left_hashes, hashes[i]
+                )
+            else:
+                left_df = merge_data_frame(
+                    left_df, dfs[i], join_keys[0], join_keys[i], join_type
+                )
+        return left_df
+
+    assert join_type == JOIN_TYPE_INNER, f"{join_type} join can not be reordered"
+
+    # columns are renamed to be unique, so that they are neither suffixed
+    # nor merged whatever the order is
+    tagged_dfs = []
+    for i, df in enumerate(dfs):
+        df = df.copy(deep=False)
+        df.columns = [f"{i}_{j}" for j in range(len(df.columns))]
+        df[f"{i}_row"] = np.arange(len(df))
+        tagged_dfs.append(df)
+
+    def gen_key_tags(i: int) -> list:
+        return [f"{i}_{dfs[i].columns.get_loc(col)}" for col in join_keys[i]]
+
+    left_df = tagged_dfs[order[0]]
+    left_key = gen_key_tags(order[0])
+    left_hashes = hashes[order[0]] if hashes else None
+    for i in order[1:]:
+        if hashes:
+            left_df, left_hashes = merge_by_fingerprint(
+                left_df,
+                tagged_dfs[i],
+                left_key,
+                gen_key_tags(i),
+                left_hashes,
+                hashes[i],
+            )
+        else:
+            left_df = left_df.merge(
+                tagged_dfs[i], left_on=left_key, right_on=gen_key_tags(i)
+            )
+        logging.info(f"{len(left_df)} rows are joined with input {i}")
+
+    # rows of inner joins follow the left rows, then the right rows
+    left_df = left_df.sort_values(
+        [f"{i}_row" for i in range(len(dfs))], ignore_index=True
+    )
+
+    # keys of the same name as the first input's are merged into one column
+    tags = list(tagged_dfs[0].columns[:-1])
+    for i in range(1, len(dfs)):
+        merged_cols = {
+            col
+            for col, first_col in zip(join_keys[i], join_keys[0])
+            if col == first_col
+        }
+        tags += [
+            f"{i}_{j}" for j, col in enumerate(dfs[i].columns) if col not in merged_cols
+        ]
+    # names of joining empty dfs in the input order, with suffixes if any
+    names = dfs[0].iloc[:0]
+    for i in range(1, len(dfs)):
+        names = names.merge(
+            dfs[i].iloc[:0], left_on=join_keys[0], right_on=join_keys[i]
+        )
+    assert len(names.columns) == len(tags), "Joined columns mismatch"
+    left_df = left_df[tags]
+    left_df.columns = names.columns
+    return left_df
+
+
+def run_psi_part(
+    file_list: list,
+    inputs: dict,
+    join_keys: list,
+    join_type: str = DEFAULT_JOIN_TYPE,
+) -> pandas.DataFrame:
     logging.info("Joining input data...")
 
-    # read left dataframe
-    left_df = common.gen_data_frame(inputs[0], file_list[0])
-    col_type = ",".join(f"{col}:{left_df[col].dtype}" for col in left_df.columns)
+    dfs = [
+        common.gen_data_frame(task_input, file_path)
+        for task_input, file_path in zip(inputs, file_list)
+    ]
+    col_type = ",".join(f"{col}:{dfs[0][col].dtype}" for col in dfs[0].columns)
     logging.info(f"Left dataframe's column types are {col_type}")
 
-    # join right df one by one
-    for i in range(1, len(inputs)):
-        # read right dataframe
-        right_df = common.gen_data_frame(inputs[i], file_list[i])
-        col_type = ",".join(f"{col}:{right_df[col].dtype}" for col in right_df.columns)
-        logging.info(f"Right dataframe's column types are {col_type}")
+    # unmatched rows of the partition are kept in the same join
+    order = (
+        plan_join_order(dfs, join_keys)
+        if join_type == JOIN_TYPE_INNER
+        else list(range(len(dfs)))
+    )
+    return merge_data_frames(dfs, join_keys, order, join_type=join_type)
+
+
+def is_csv_output(task_output: dict) -> bool:
+    return (
+        task_output.get(common.TABLE_FORMAT, common.DEFAULT_TABLE_FORMAT)
+        == common.TABLE_FORMAT_CSV
+    )
+
+
+def run_psi_part_to_file(
+    file_list: list,
+    inputs: dict,
+    join_keys: list,
+    part_path: str,
+    task_output: dict,
+    join_type: str = DEFAULT_JOIN_TYPE,
+) -> tuple:
+    # the result goes back by file, instead of pickling it through the pool
+    start = time.perf_counter()
+    df = run_psi_part(file_list, inputs, join_keys, join_type)
+    join_seconds = time.perf_counter() - start
+    if is_csv_output(task_output):
+        # parts are concatenated into the output, which has the only header
+        common.write_csv_table(
+            [df],
+            part_path,
+            compression=task_output.get(common.COMPRESSION, common.DEFAULT_COMPRESSION),
+            header=False,
+        )
+    else:
+        common.write_data_frame(df, part_path, common.TABLE_FORMAT_ARROW)
+    # column types of the part to derive the output schema, and the join time
+    return df.dtypes, join_seconds
+
+
+def gen_header_df(dtypes: pandas.Series) -> pandas.DataFrame:
+    return pandas.DataFrame(
+        {col: pandas.Series(dtype=dtype) for col, dtype in dtypes.items()}
+    )
+
+
+def build_key_filter(
+    task_input: dict, join_key: list, key_num: int, fpr: float
+) -> common.BloomFilter:
+    key_filter = common.BloomFilter(key_num, fpr)
+    logging.info(
+        f"Building Bloom filter of {key_num} keys with {key_filter.nbytes} bytes "
+        f"and {key_filter.hash_num} hashes..."
+    )
+    # only join keys are read
+    for chunk in common.iter_data_frame(task_input, usecols=join_key):
+        key_filter.add(chunk, join_key)
+    return key_filter
+
+
+def split_inputs(
+    inputs: list,
+    join_keys: list,
+    file_num: int,
+    key_nums: tuple,
+    fpr: float,
+    join_type: str = DEFAULT_JOIN_TYPE,
+) -> list:
+    """Partition all inputs into file_num files each.
+
+    If fpr is positive, a semi-join is done first: the keys of the input
+    with the least keys are put in a Bloom filter, and rows of other inputs
+    missing in it are dropped before partitioning, so that they are neither
+    written nor joined. The filter lives only while splitting. Left joins
+    filter by the keys of the first input, whose rows are all kept, and
+    outer joins keep every row, so they are not filtered.
+    """
+    key_filters = [None] * len(inputs)
+    if fpr > 0 and join_type != JOIN_TYPE_OUTER:
+        filter_index = (
+            0
+            if join_type == JOIN_TYPE_LEFT
+            else min(range(len(inputs)), key=lambda i: key_nums[i])
+        )
+        key_filter = build_key_filter(
+            inputs[filter_index], join_keys[filter_index], key_nums[filter_index], fpr
+        )
+        key_filters = [
+            None if i == filter_index else key_filter for i in range(len(inputs))
+        ]
+
+    with futures.ThreadPoolExecutor() as executor:
+        return list(
+            executor.map(
+                lambda index: common.split_bigfile_into_smallfiles(
+                    inputs[index],
+                    join_keys[index],
+                    file_num,
+                    key_filter=key_filters[index],
+                ),
+                range(len(inputs)),
+            )
+        )
+
+
+def init_part_worker(log_level: int) -> None:
+    # spawned workers do not inherit the logging setup of the app
+    logging.basicConfig(stream=sys.stdout, level=log_level, format=LOG_FORMAT)
+
+
+def gen_part_executor(workers: int) -> futures.Executor:
+    # parsing and merging hold the GIL, so partitions are joined by processes,
+    # spawn does not inherit the threads and locks of this process
+    executor = None
+    try:
+        executor = futures.ProcessPoolExecutor(
+            workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_part_worker,
+            initargs=(logging.getLogger().getEffectiveLevel(),),
+        )
+        # workers are started by the first task, which fails if they can not
+        executor.submit(int).result()
+        return executor
+    except (OSError, NotImplementedError, futures.BrokenExecutor) as e:
+        if executor is not None:
+            executor.shutdown(wait=False)
+        logging.warning(f"Can not start process pool: {e}. Use threads instead.")
+        return futures.ThreadPoolExecutor(workers)
+
+
+def gen_key_index(
+    df: pandas.DataFrame, join_key: list, hashes: np.ndarray = None
+) -> pandas.Index:
+    if hashes is not None:
+        # key fingerprints instead of keys
+        return pandas.Index(np.unique(hashes))
+    if len(join_key) == 1:
+        return pandas.Index(df[join_key[0]].unique())
+    return pandas.MultiIndex.from_frame(df[join_key]).unique()
+
 
-        assert len(join_keys[0]) == len(
-            join_keys[i]
-        ), "Join keys should be the same size"
+def isin_key_index(
+    df: pandas.DataFrame, join_key: list, key_index: pandas.Index
+) -> np.ndarray:
+    if len(join_key) == 1:
+        return df[join_key[0]].isin(key_index).to_numpy()
+    return pandas.MultiIndex.from_frame(df[join_key]).isin(key_index)
 
-        left_df = left_df.merge(right_df, left_on=join_keys[0], right_on=join_keys[i])
-        key_type = ",".join(f"{col}:{left_df[col].dtype}" for col in left_df.columns)
-        logging.info(f"Joined dataframe's column types are {key_type}")
 
+def probe_input(
+    task_input: dict, join_key: list, key_index: pandas.Index, fingerprint: bool
+) -> tuple:
+    """Read rows whose keys are in key_index, which can be joined.
+
+    Returns:
+        matched rows, and their key fingerprints if key_index holds
+        fingerprints, otherwise None.
+    """
+    chunks = []
+    chunk_hashes = []
+    for chunk in common.iter_data_frame(task_input):
+        if fingerprint:
+            # collisions only keep a few more rows, which are dropped by join
+            hashes = common.hash_join_keys(chunk, join_key)
+            matched = pandas.Index(hashes).isin(key_index)
+            chunk_hashes.append(hashes[matched])
+        else:
+            matched = isin_key_index(chunk, join_key, key_index)
+        chunks.append(chunk[matched])
+    df = pandas.concat(chunks, ignore_index=True)
+    return df, np.concatenate(chunk_hashes) if fingerprint else None
+
+
+def run_psi_in_memory(
+    inputs: list,
+    join_keys: list,
+    fingerprint: bool = DEFAULT_KEY_FINGERPRINT,
+    join_type: str = DEFAULT_JOIN_TYPE,
+) -> pandas.DataFrame:
+    """Hash join without partition files.
+
+    The smallest input is loaded as the build side, and a hash index of its
+    keys is built. The other inputs are probed chunk by chunk and only their
+    matched rows are kept, then all inputs are merged in the planned order,
+    and the result is the same as joining the whole inputs. With fingerprint,
+    composite and non-numeric keys are hashed once, and both the index and
+    the join are on their fingerprints. Left joins build on the first input,
+    and join on keys in the input order. Outer joins load all inputs.
+    """
+    if join_type == JOIN_TYPE_OUTER:
+        logging.info("Loading all inputs for outer join...")
+        dfs = [common.gen_data_frame(task_input) for task_input in inputs]
+        return merge_data_frames(
+            dfs, join_keys, list(range(len(dfs))), join_type=join_type
+        )
+
+    build_index = (
+        0
+        if join_type == JOIN_TYPE_LEFT
+        else min(
+            range(len(inputs)),
+            key=lambda i: os.path.getsize(inputs[i][common.DATA_PATH]),
+        )
+    )
+    logging.info(f"Building hash index on input {build_index}...")
+    dfs = [None] * len(inputs)
+    dfs[build_index] = common.gen_data_frame(inputs[build_index])
+    hashes = [None] * len(inputs)
+    fingerprint = fingerprint and is_fingerprint_key(
+        dfs[build_index], join_keys[build_index]
+    )
+    if fingerprint:
+        logging.info("Join keys are indexed by fingerprints")
+        hashes[build_index] = common.hash_join_keys(
+            dfs[build_index], join_keys[build_index]
+        )
+    key_index = gen_key_index(
+        dfs[build_index], join_keys[build_index], hashes[build_index]
+    )
+
+    for i in range(len(inputs)):
+        if i == build_index:
+            continue
+        logging.info(f"Probing input {i}...")
+        dfs[i], hashes[i] = probe_input(inputs[i], join_keys[i], key_index, fingerprint)
+        if join_type == JOIN_TYPE_INNER:
+            # keys missing in any input can not be joined, shrink the index
+            key_index = key_index.intersection(
+                gen_key_index(dfs[i], join_keys[i], hashes[i])
+            )
+        logging.info(f"{len(dfs[i])} rows of input {i} matched")
+
+    logging.info("Joining input data...")
+    if join_type != JOIN_TYPE_INNER:
+        # fingerprints only pruned the probed rows
+        return merge_data_frames(
+            dfs, join_keys, list(range(len(dfs))), join_type=join_type
+        )
+    return merge_data_frames(
+        dfs,
+        join_keys,
+        plan_join_order(dfs, join_keys),
+        hashes if fingerprint else None,
+    )
+
+
+def join_batch(
+    dfs: list, join_keys: list, join_type: str = DEFAULT_JOIN_TYPE
+) -> pandas.DataFrame:
+    dfs = gen_join_data_frames(dfs, join_type)
+    left_df = dfs[0]
+    for i in range(1, len(dfs)):
+        left_df = merge_keys(left_df, dfs[i], join_keys[0], join_keys[i], join_type)
     return left_df
 
 
+def iter_sort_merge_join(
+    inputs: list,
+    join_keys: list,
+    chunksize: int = common.DEFAULT_CHUNK_SIZE,
+    join_type: str = DEFAULT_JOIN_TYPE,
+) -> Iterator[pandas.DataFrame]:
+    """Streaming merge join of inputs sorted by join key.
+
+    Every input is read chunk by chunk. Rows whose keys are less than the
+    smallest last key read of all unfinished inputs can not appear in any
+    later chunk, so they are joined in a batch and dropped. Rows of the same
+    key are always joined in the same batch, so duplicate keys are joined as
+    pandas does, and batches follow the key order as well as the output of
+    joining whole inputs. Memory is bounded by chunksize and the rows of a
+    key. Raises UnsortedInputError once an input is found unsorted. Inner
+    joins stop once any input is used up, left joins once the first input
+    is, and outer joins read all inputs.
+    """
+    readers = [
+        common.iter_data_frame(task_input, chunksize=chunksize) for task_input in inputs
+    ]
+    buffers = [None] * len(inputs)
+    last_keys = [None] * len(inputs)
+    finished = [False] * len(inputs)
+
+    def read_chunk(i: int) -> None:
+        chunk = next(readers[i], None)
+        if chunk is None:
+            finished[i] = True
+            return
+        keys = gen_key_arrays(chunk, join_keys[i])
+        if not is_key_sorted(keys, last_keys[i]):
+            raise UnsortedInputError(f"Input {i} is not sorted by join key")
+        if len(chunk) > 0:
+            last_keys[i] = tuple(col[-1] for col in keys)
+        buffers[i] = (
+            chunk
+            if buffers[i] is None
+            else pandas.concat([buffers[i], chunk], ignore_index=True)
+        )
+
+    for i in range(len(inputs)):
+        while not finished[i] and last_keys[i] is None:
+            read_chunk(i)
+
+    # no more rows can be joined once any of these inputs is used up
+    stop_indexes = {
+        JOIN_TYPE_INNER: range(len(inputs)),
+        JOIN_TYPE_LEFT: [0],
+        JOIN_TYPE_OUTER: [],
+    }[join_type]
+    yielded = False
+    while True:
+        unfinished = [i for i in range(len(inputs)) if not finished[i]]
+        # rows below the bound are complete in every input
+        bound = min(last_keys[i] for i in unfinished) if unfinished else None
+        batch = []
+        for i, buffer in enumerate(buffers):
+            if bound is None:
+                end = len(buffer)
+            else:
+                less, _ = compare_keys(gen_key_arrays(buffer, join_keys[i]), bound)
+                # buffers are sorted, rows below the bound are a prefix
+                end = int(less.sum())
+            batch.append(buffer.iloc[:end])
+            buffers[i] = buffer.iloc[end:]
+
+        df = join_batch(batch, join_keys, join_type)
+        # the first batch is always yielded, so an empty output has columns
+        if len(df) > 0 or not yielded:
+            yield df
+            yielded = True
+
+        if bound is None or any(
+            finished[i] and len(buffers[i]) == 0 for i in stop_indexes
+        ):
+            return
+        # inputs stopped at the bound may have more rows of the bound key
+        for i in unfinished:
+            if last_keys[i] == bound:
+                read_chunk(i)
+
+
+def run_psi_sort_merge(
+    inputs: list,
+    join_keys: list,
+    task_output: dict,
+    schema: data_pb2.TableSchema,
+    timer: common.PhaseTimer,
+    join_type: str = DEFAULT_JOIN_TYPE,
+) -> None:
+    logging.info("Joining sorted inputs by streaming merge join...")
+    batches = iter_sort_merge_join(inputs, join_keys, join_type=join_type)
+    # batches are written into a temp file, so that no partial output is left
+    # once an input is found unsorted
+    output_path = task_output[common.DATA_PATH]
+    tmp_output = dict(task_output)
+    tmp_output[common.DATA_PATH] = f"{output_path}.tmp"
+    # batches are joined while the output is written
+    with timer.phase(PHASE_DUMP):
+        try:
+            common.write_table(
+                timer.iter_phase(PHASE_JOIN, batches),
+                tmp_output,
+                schema,
+                timer=timer,
+                nullable_cols=gen_nullable_cols(inputs, join_keys, join_type),
+            )
+        except BaseException:
+            if os.path.exists(tmp_output[common.DATA_PATH]):
+                os.remove(tmp_output[common.DATA_PATH])
+            raise
+        os.replace(tmp_output[common.DATA_PATH], output_path)
+
+
 # Todo(jimi): for TEE, psi may not be a good name, rename later
-def run_psi(task_config: dict) -> None:
+def run_psi(task_config: dict, timer: common.PhaseTimer = None) -> None:
+    """Join inputs by keys into the output.
+
+    Args:
+        task_config: the task config of psi.
+        timer: if set, the time of every phase is added to it, phases are
+            PHASE_* and common.PHASE_SCHEMA.
+    """
     logging.info("Running psi...")
+    timer = timer if timer is not None else common.PhaseTimer()
+    run_psi_phases(task_config, timer)
+    logging.info(f"Psi phases: {timer.summary()}")
 
+
+def run_psi_phases(task_config: dict, timer: common.PhaseTimer) -> None:
     assert (
         task_config[common.COMPONENT_NAME] == COMPONENT_NAME
     ), f"Component name should be {COMPONENT_NAME}, but got {task_config[common.COMPONENT_NAME]}"
@@ -79,22 +1297,81 @@ def run_psi(task_config: dict) -> None:
     for input in inputs:
         common.append_table_schema(merged_schema, input[common.SCHEMA])
 
-    files_size = [os.path.getsize(input[common.DATA_PATH]) for input in inputs]
+    fingerprint = task_config.get(KEY_FINGERPRINT, DEFAULT_KEY_FINGERPRINT)
+    join_type = task_config.get(JOIN_TYPE, DEFAULT_JOIN_TYPE)
+    assert (
+        join_type in JOIN_TYPES
+    ), f"Join type should be one of {JOIN_TYPES}, but got {join_type}"
+    nullable_cols = gen_nullable_cols(inputs, join_keys, join_type)
+    max_output_rows = task_config.get(MAX_OUTPUT_ROWS, DEFAULT_MAX_OUTPUT_ROWS)
+    join_method = task_config.get(JOIN_METHOD, DEFAULT_JOIN_METHOD)
+    assert (
+        join_method in JOIN_METHODS
+    ), f"Join method should be one of {JOIN_METHODS}, but got {join_method}"
+    # memory budget 0 always joins by partition files
+    memory_budget = (
+        task_config.get(MEMORY_BUDGET, DEFAULT_MEMORY_BUDGET_IN_MB) * 1024 * 1024
+    )
+    # columnar output can not be appended by parts, so it is held in memory
+    with timer.phase(PHASE_PLAN):
+        plan = plan_psi(
+            inputs,
+            join_keys,
+            memory_budget,
+            hold_output=not is_csv_output(outputs[0]),
+            join_type=join_type,
+            # only joins bounded by max_output_rows pay for the scan of sketches
+            sketch_keys=max_output_rows > 0,
+        )
+    logging.info(f"Psi plan: {plan._asdict()}")
+    # a join which can not finish fails before any input is split
+    check_join_explosion(plan, max_output_rows)
+
+    if join_method == JOIN_METHOD_SORT_MERGE:
+        run_psi_sort_merge(
+            inputs, join_keys, outputs[0], merged_schema, timer, join_type
+        )
+        return
+    if plan.in_memory:
+        with timer.phase(PHASE_JOIN):
+            df = run_psi_in_memory(inputs, join_keys, fingerprint, join_type)
+        logging.info("Dumping output dataframe and schema...")
+        with timer.phase(PHASE_DUMP):
+            common.write_table(
+                df,
+                outputs[0],
+                merged_schema,
+                timer=timer,
+                nullable_cols=nullable_cols,
+            )
+        return
+
+    if join_method == JOIN_METHOD_AUTO and plan.key_sorted:
+        # only samples are known sorted, fall back once any input is not
+        try:
+            run_psi_sort_merge(
+                inputs, join_keys, outputs[0], merged_schema, timer, join_type
+            )
+            return
+        except UnsortedInputError as e:
+            logging.warning(f"{e}, fall back to hash join")
 
-    file_num = math.ceil(max(files_size) / DEFAULT_FILE_SIZE_LIMIT_IN_BYTES)
+    file_num = plan.file_num
+    worker_num = task_config.get(WORKER_NUM, DEFAULT_WORKER_NUM)
+    # more workers than planned may exceed the memory budget
+    workers = min(worker_num, plan.workers) if worker_num > 0 else plan.workers
 
     logging.info(f"Inputs can be split into {file_num} files")
 
     # split bigfile into small files
-    with futures.ThreadPoolExecutor() as executor:
-        small_files = list(
-            executor.map(
-                lambda x: common.split_bigfile_into_smallfiles(*x),
-                [
-                    (inputs[index], join_keys[index], file_num)
-                    for index in range(len(inputs))
-                ],
-            )
+    with timer.phase(PHASE_SPLIT):
+        small_files = split_inputs(
+            inputs,
+            join_keys,
+            file_num,
+            plan.key_nums,
+            task_config.get(BLOOM_FILTER_FPR, DEFAULT_BLOOM_FILTER_FPR),
+            join_type,
         )
 
     # deal every small file
@@ -103,47 +1380,73 @@ def run_psi(task_config: dict) -> None:
     output_path = outputs[0][common.DATA_PATH]
     if os.path.exists(output_path):
         os.remove(output_path)
-    # df is used to get data schema
-    df = pandas.DataFrame()
-    has_head = False
 
     # task executor parallelly
-    with futures.ThreadPoolExecutor() as executor:
-        df_list = list(
-            executor.map(
-                lambda x: run_psi_part(*x),
-                [
-                    (
-                        [files[index] for files in small_files],
-                        inputs,
-                        join_keys,
-                    )
-                    for index in range(file_num)
-                ],
-            )
+    logging.info(f"Joining {file_num} partitions by {workers} workers...")
+    part_paths = [f"{output_path}.part{index}" for index in range(file_num)]
+    with gen_part_executor(workers) as executor:
+        part_results = executor.map(
+            run_psi_part_to_file,
+            [[files[index] for files in small_files] for index in range(file_num)],
+            [inputs] * file_num,
+            [join_keys] * file_num,
+            part_paths,
+            [outputs[0]] * file_num,
+            [join_type] * file_num,
         )
 
-    # delete small files
+        def iter_part_dtypes():
+            for dtypes, join_seconds in timer.iter_phase(PHASE_JOIN_WAIT, part_results):
+                timer.add(PHASE_JOIN, join_seconds)
+                yield dtypes
+
+        part_dtypes = iter_part_dtypes()
+
+        logging.info("Dumping output dataframe and schema...")
+        with timer.phase(PHASE_DUMP):
+            if is_csv_output(outputs[0]):
+                # output TableSchema is derived from the first part, every part is
+                # appended to the output as soon as it is ready
+                header_df = gen_header_df(next(part_dtypes))
+
+                def iter_part_paths():
+                    yield part_paths[0]
+                    for part_path, _ in zip(part_paths[1:], part_dtypes):
+                        yield part_path
+
+                common.concat_csv_parts(
+                    header_df,
+                    iter_part_paths(),
+                    outputs[0],
+                    merged_schema,
+                    timer,
+                    nullable_cols,
+                )
+            else:
+                list(part_dtypes)
+                # columnar output is written at once
+                common.write_table(
+                    (common.read_data_frame(part_path) for part_path in part_paths),
+                    outputs[0],
+                    merged_schema,
+                    timer=timer,
+                    nullable_cols=nullable_cols,
+                )
+                for part_path in part_paths:
+                    os.remove(part_path)
+
+    # delete small files, inputs may be joined as they are
     with futures.ThreadPoolExecutor() as executor:
         executor.map(
             os.remove,
-            [file for files in small_files if len(files) > 1 for file in files],
+            [
+                file
+                for task_input, files in zip(inputs, small_files)
+                for file in files
+                if file != task_input[common.DATA_PATH]
+            ],
         )
 
-    logging.info("Dumping output dataframe...")
-    # get task result parallelly
-    for part_df in df_list:
-        df = part_df
-        df.to_csv(output_path, index=False, mode="a", header=not has_head)
-        has_head = True if not has_head else has_head
-
-    logging.info("Dumping output schema...")
-    # gen output TableSchema
-    output_schema = common.gen_output_schema(df, merged_schema)
-    schema_json = json_format.MessageToJson(output_schema)
-    with open(outputs[0][common.DATA_SCHEMA_PATH], "w") as schema_f:
-        schema_f.write(schema_json)
-
 
 def main():
     assert len(sys.argv) == 2, f"Wrong arguments number: {len(sys.argv)}"
@@ -166,9 +1469,5 @@ and stdout.
 """
 if __name__ == "__main__":
     # TODO set log level
-    logging.basicConfig(
-        stream=sys.stdout,
-        level=logging.INFO,
-        format="%(asctime)s - %(levelname)s - %(message)s",
-    )
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO, format=LOG_FORMAT)
     main()
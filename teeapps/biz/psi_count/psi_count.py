@@ -0,0 +1,339 @@
+# Copyright 2023 Ant Group Co., Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import itertools
+import json
+import logging
+import math
+import sys
+
+import numpy as np
+from google.protobuf import json_format
+from secretflow.spec.v1.component_pb2 import Attribute
+from secretflow.spec.v1.report_pb2 import Descriptions, Div, Report, Tab, Table
+
+from teeapps.biz.common import common
+
+COMPONENT_NAME = "psi_count"
+
+KEY = "key"
+COUNT_METHOD = "count_method"
+HLL_PRECISION = "hll_precision"
+
+# distinct keys are counted by sets of 64-bit key fingerprints, the chance
+# of any collision is below n^2 / 2^65 for n keys
+COUNT_METHOD_EXACT = "exact"
+# distinct keys are estimated by HyperLogLog sketches in O(2^precision) memory
+COUNT_METHOD_HLL = "hll"
+COUNT_METHODS = [COUNT_METHOD_EXACT, COUNT_METHOD_HLL]
+DEFAULT_COUNT_METHOD = COUNT_METHOD_EXACT
+# 2^14 registers, estimates have a relative standard error of 0.81%
+DEFAULT_HLL_PRECISION = 14
+MIN_HLL_PRECISION = 4
+MAX_HLL_PRECISION = 18
+# bias correction of HyperLogLog with few registers, the formula of alpha
+# only holds for 128 registers or more
+HLL_SMALL_ALPHAS = {16: 0.673, 32: 0.697, 64: 0.709}
+
+
+def get_bit_length(values: np.ndarray) -> np.ndarray:
+    # halves of 32 bits are exact in float64, frexp returns their bit length
+    high = np.frexp((values >> np.uint64(32)).astype(np.float64))[1]
+    low = np.frexp((values & np.uint64(0xFFFFFFFF)).astype(np.float64))[1]
+    return np.where(high > 0, high + 32, low)
+
+
+class HyperLogLog:
+    """HyperLogLog sketch of 64-bit key fingerprints.
+
+    The first precision bits of a fingerprint pick a register, which keeps
+    the max position of the first 1 bit in the rest bits. Sketches of the
+    same precision are merged by max, so unions are estimated as well, with
+    the relative standard error of 1.04 / sqrt(2^precision).
+    """
+
+    def __init__(self, precision: int = DEFAULT_HLL_PRECISION) -> None:
+        assert (
+            MIN_HLL_PRECISION <= precision <= MAX_HLL_PRECISION
+        ), f"HyperLogLog precision should be in [{MIN_HLL_PRECISION}, {MAX_HLL_PRECISION}], but got {precision}"
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def add(self, hashes: np.ndarray) -> None:
+        rest_bits = 64 - self.precision
+        indexes = (hashes >> np.uint64(rest_bits)).astype(np.intp)
+        rest = hashes & np.uint64((1 << rest_bits) - 1)
+        ranks = (rest_bits + 1 - get_bit_length(rest)).astype(np.uint8)
+        np.maximum.at(self.registers, indexes, ranks)
+
+    def union(self, other: "HyperLogLog") -> "HyperLogLog":
+        assert self.precision == other.precision, "HyperLogLog precision mismatch"
+        sketch = HyperLogLog(self.precision)
+        sketch.registers = np.maximum(self.registers, other.registers)
+        return sketch
+
+    def estimate(self) -> float:
+        register_num = len(self.registers)
+        alpha = HLL_SMALL_ALPHAS.get(register_num, 0.7213 / (1 + 1.079 / register_num))
+        raw = (
+            alpha
+            * register_num**2
+            / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        )
+        zero_num = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * register_num and zero_num > 0:
+            # linear counting is more accurate for small sets
+            return register_num * math.log(register_num / zero_num)
+        return float(raw)
+
+
+def read_key_hashes(task_input: dict, join_key: list):
+    """Read only the join key columns, and yield key fingerprints by chunk."""
+    for chunk in common.iter_data_frame(task_input, usecols=join_key):
+        yield common.hash_join_keys(chunk, join_key)
+
+
+def count_exact(inputs: list, join_keys: list) -> tuple:
+    """Count rows, distinct keys and intersections by sets of fingerprints.
+
+    Returns:
+        rows and distinct keys of inputs, intersections of all pairs of
+        inputs and of all inputs.
+    """
+    row_nums = []
+    key_sets = []
+    for i, (task_input, join_key) in enumerate(zip(inputs, join_keys)):
+        logging.info(f"Counting keys of input {i}...")
+        row_num = 0
+        chunk_keys = []
+        for hashes in read_key_hashes(task_input, join_key):
+            row_num += len(hashes)
+            chunk_keys.append(np.unique(hashes))
+        row_nums.append(row_num)
+        key_sets.append(
+            np.unique(np.concatenate(chunk_keys))
+            if chunk_keys
+            else np.array([], np.uint64)
+        )
+
+    pair_nums = {
+        (a, b): len(np.intersect1d(key_sets[a], key_sets[b], assume_unique=True))
+        for a, b in itertools.combinations(range(len(inputs)), 2)
+    }
+    # the smallest sets first, so that intersections shrink fast
+    joined_keys = None
+    for key_set in sorted(key_sets, key=len):
+        joined_keys = (
+            key_set
+            if joined_keys is None
+            else np.intersect1d(joined_keys, key_set, assume_unique=True)
+        )
+    return (
+        row_nums,
+        [len(key_set) for key_set in key_sets],
+        pair_nums,
+        len(joined_keys),
+    )
+
+
+def count_hll(inputs: list, join_keys: list, precision: int) -> tuple:
+    """Estimate distinct keys and intersections by HyperLogLog sketches.
+
+    Intersections are estimated from unions by inclusion-exclusion, so their
+    errors scale with the unions, and they are clipped to
+    [0, min(distinct keys)].
+
+    Returns:
+        the same as count_exact, with estimated counts.
+    """
+    row_nums = []
+    sketches = []
+    for i, (task_input, join_key) in enumerate(zip(inputs, join_keys)):
+        logging.info(f"Sketching keys of input {i}...")
+        row_num = 0
+        sketch = HyperLogLog(precision)
+        for hashes in read_key_hashes(task_input, join_key):
+            row_num += len(hashes)
+            sketch.add(hashes)
+        row_nums.append(row_num)
+        sketches.append(sketch)
+    key_nums = [round(sketch.estimate()) for sketch in sketches]
+
+    def estimate_intersection(indexes: tuple) -> int:
+        # |A1 & ... & An| = sum of (-1)^(|S|+1) * |union of S| over subsets S
+        count = 0.0
+        for size in range(1, len(indexes) + 1):
+            for subset in itertools.combinations(indexes, size):
+                union = sketches[subset[0]]
+                for index in subset[1:]:
+                    union = union.union(sketches[index])
+                count += (-1) ** (size + 1) * union.estimate()
+        return min(max(round(count), 0), min(key_nums[i] for i in indexes))
+
+    pair_nums = {
+        pair: estimate_intersection(pair)
+        for pair in itertools.combinations(range(len(inputs)), 2)
+    }
+    return (
+        row_nums,
+        key_nums,
+        pair_nums,
+        estimate_intersection(tuple(range(len(inputs)))),
+    )
+
+
+def gen_report(
+    count_method: str,
+    row_nums: list,
+    key_nums: list,
+    pair_nums: dict,
+    joined_key_num: int,
+) -> Report:
+    def gen_ratio(num: int, total: int) -> float:
+        return num / total if total else 0.0
+
+    desc = Descriptions(
+        items=[
+            Descriptions.Item(
+                name="count_method", type="str", value=Attribute(s=count_method)
+            ),
+            Descriptions.Item(
+                name="intersection", type="int", value=Attribute(i64=joined_key_num)
+            ),
+        ]
+        + [
+            item
+            for i in range(len(key_nums))
+            for item in [
+                Descriptions.Item(
+                    name=f"input{i + 1}_rows",
+                    type="int",
+                    value=Attribute(i64=row_nums[i]),
+                ),
+                Descriptions.Item(
+                    name=f"input{i + 1}_keys",
+                    type="int",
+                    value=Attribute(i64=key_nums[i]),
+                ),
+                Descriptions.Item(
+                    name=f"input{i + 1}_intersection_ratio",
+                    type="float",
+                    value=Attribute(f=gen_ratio(joined_key_num, key_nums[i])),
+                ),
+            ]
+        ]
+    )
+    pair_table = Table(
+        headers=[
+            Table.HeaderItem(name="intersection", desc="", type="int"),
+            Table.HeaderItem(name="left_ratio", desc="", type="float"),
+            Table.HeaderItem(name="right_ratio", desc="", type="float"),
+        ],
+        rows=[
+            Table.Row(
+                name=f"input{a + 1}-input{b + 1}",
+                items=[
+                    Attribute(i64=pair_num),
+                    Attribute(f=gen_ratio(pair_num, key_nums[a])),
+                    Attribute(f=gen_ratio(pair_num, key_nums[b])),
+                ],
+            )
+            for (a, b), pair_num in pair_nums.items()
+        ],
+    )
+    return Report(
+        name="psi count",
+        desc="distinct join keys and their intersections",
+        tabs=[
+            Tab(
+                divs=[
+                    Div(
+                        children=[
+                            Div.Child(type="descriptions", descriptions=desc),
+                            Div.Child(type="table", table=pair_table),
+                        ],
+                    )
+                ],
+            )
+        ],
+    )
+
+
+def run_psi_count(task_config: dict) -> None:
+    logging.info("Running psi count...")
+
+    assert (
+        task_config[common.COMPONENT_NAME] == COMPONENT_NAME
+    ), f"Component name should be {COMPONENT_NAME}, but got {task_config[common.COMPONENT_NAME]}"
+
+    inputs = task_config[common.INPUTS]
+    outputs = task_config[common.OUTPUTS]
+    assert 1 < len(inputs) <= 10, f"{COMPONENT_NAME} should have [2,10] inputs"
+    assert len(outputs) == 1, f"{COMPONENT_NAME} should have only 1 output"
+
+    join_keys = [input[KEY] for input in inputs]
+    count_method = task_config.get(COUNT_METHOD, DEFAULT_COUNT_METHOD)
+    assert (
+        count_method in COUNT_METHODS
+    ), f"Count method should be one of {COUNT_METHODS}, but got {count_method}"
+
+    if count_method == COUNT_METHOD_EXACT:
+        counts = count_exact(inputs, join_keys)
+    else:
+        counts = count_hll(
+            inputs,
+            join_keys,
+            task_config.get(HLL_PRECISION, DEFAULT_HLL_PRECISION),
+        )
+    logging.info(f"Intersection of all inputs has {counts[3]} keys")
+    report = gen_report(count_method, *counts)
+
+    logging.info("Dumping report...")
+    report_json = json_format.MessageToJson(
+        report,
+        preserving_proto_field_name=True,
+        indent=0,
+    )
+    with open(outputs[0][common.DATA_PATH], "w") as report_f:
+        report_f.write(report_json)
+
+
+def main():
+    assert len(sys.argv) == 2, f"Wrong arguments number: {len(sys.argv)}"
+    # load task_config json
+    task_config_path = sys.argv[1]
+    logging.info("Reading task config file...")
+    with open(task_config_path, "r") as task_config_f:
+        task_config = json.load(task_config_f)
+        logging.debug(f"Configurations: {task_config}")
+        run_psi_count(task_config)
+
+
+"""
+This app is expected to be launched by app framework via running a subprocess
+`python3 psi_count.py config`. Before launching the subprocess, the app framework will
+firstly generate a config file which is a json file containing all the required
+parameters and is serialized from the task.proto. Currently we do not handle any
+errors/exceptions in this file as the outer app framework will capture the stderr
+and stdout.
+"""
+if __name__ == "__main__":
+    # TODO set log level
+    logging.basicConfig(
+        stream=sys.stdout,
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+    )
+    main()
@@ -18,9 +18,13 @@ import json
 import os
 import unittest
 
+import numpy as np
+import pandas
 from google.protobuf import json_format
 from secretflow.spec.v1.report_pb2 import Div, Report, Tab, Table
+from sklearn import metrics
 
+from teeapps.biz.biclassification_eval import biclassification_eval
 from teeapps.biz.biclassification_eval.biclassification_eval import (
     run_biclassification_eval,
 )
@@ -61,7 +65,9 @@ class UnitTests(unittest.TestCase):
         # before
         self.assertTrue(not os.path.exists(TEST_OUTPUT_REPORT_PATH))
         # run
-        run_biclassification_eval(json.loads(TEST_CONFIG_JSON))
+        task_config = json.loads(TEST_CONFIG_JSON)
+        task_config["head_fpr_thresholds"] = [0.1, 0.5]
+        run_biclassification_eval(task_config)
         # after
         self.assertTrue(os.path.exists(TEST_OUTPUT_REPORT_PATH))
         # check output report
@@ -69,6 +75,149 @@ class UnitTests(unittest.TestCase):
             report_json = report_f.read()
         report = Report()
         json_format.Parse(report_json, report)
+        head_table = report.tabs[3].divs[0].children[0].table
+        self.assertEqual(len(head_table.rows), 2)
+        os.remove(TEST_OUTPUT_REPORT_PATH)
+
+    def test_fill_bin_report(self):
+        rng = np.random.default_rng(0)
+        score = np.sort(rng.random(1000))
+        y_true = (rng.random(1000) < score).astype("float64")
+        cumulative_counts = biclassification_eval.gen_cumulative_counts(y_true, score)
+        for start, end in [(0, 1000), (100, 300), (990, 1000), (0, 10)]:
+            report = biclassification_eval.init_bin_report()
+            biclassification_eval.fill_bin_report(
+                score, score, cumulative_counts, start, end, 1, report
+            )
+            # metrics of predicting rows >= start positive
+            y_pred = (np.arange(1000) >= start).astype(int)
+            self.assertEqual(
+                report[biclassification_eval.POSITIVE], y_true[start:end].sum()
+            )
+            self.assertEqual(report[biclassification_eval.TOTAL], end - start)
+            self.assertAlmostEqual(
+                report[biclassification_eval.PRECISION],
+                metrics.precision_score(y_true, y_pred),
+            )
+            self.assertAlmostEqual(
+                report[biclassification_eval.RECALL],
+                metrics.recall_score(y_true, y_pred),
+            )
+            self.assertAlmostEqual(
+                report[biclassification_eval.F1_SCORE],
+                metrics.f1_score(y_true, y_pred),
+            )
+            self.assertAlmostEqual(
+                report[biclassification_eval.AVG_SCORE], score[start:end].mean()
+            )
+
+    def test_gen_head_reports(self):
+        rng = np.random.default_rng(0)
+        score = np.sort(rng.random(1000))
+        y_true = (rng.random(1000) < score).astype("float64")
+        fprs, _, thresholds = metrics.roc_curve(y_true, score)
+        target_fprs = [0.0, 0.02, 0.3, 1.0]
+        head_reports = biclassification_eval.gen_head_reports(
+            score,
+            biclassification_eval.gen_cumulative_counts(y_true, score),
+            fprs,
+            thresholds,
+            target_fprs,
+        )
+        self.assertEqual(len(head_reports), len(target_fprs))
+        for target_fpr, report in zip(target_fprs, head_reports):
+            y_pred = (score >= report[biclassification_eval.THRESHOLD]).astype(int)
+            tn, fp, _, _ = metrics.confusion_matrix(y_true, y_pred).ravel()
+            self.assertAlmostEqual(report[biclassification_eval.FPR], fp / (fp + tn))
+            self.assertAlmostEqual(
+                report[biclassification_eval.FPR], target_fpr, delta=0.01
+            )
+            self.assertAlmostEqual(
+                report[biclassification_eval.PRECISION],
+                metrics.precision_score(y_true, y_pred, zero_division=0),
+            )
+            self.assertAlmostEqual(
+                report[biclassification_eval.RECALL],
+                metrics.recall_score(y_true, y_pred),
+            )
+
+    def test_biclassification_eval_sketch(self):
+        # few distinct scores, so every bin has a single score and the
+        # sketch evaluates exactly
+        reports = []
+        for sketch_bin_num in [0, 1000]:
+            task_config = json.loads(TEST_CONFIG_JSON)
+            task_config[biclassification_eval.SKETCH_BIN_NUM] = sketch_bin_num
+            run_biclassification_eval(task_config)
+            with open(TEST_OUTPUT_REPORT_PATH, "r") as report_f:
+                reports.append(json_format.Parse(report_f.read(), Report()))
+            os.remove(TEST_OUTPUT_REPORT_PATH)
+        self.assertEqual(reports[1], reports[0])
+
+    def test_score_histogram(self):
+        rng = np.random.default_rng(0)
+        score = rng.random(10000)
+        y_true = (rng.random(10000) < score).astype("float64")
+        histograms = []
+        for part in [slice(0, 3000), slice(3000, 10000)]:
+            histogram = biclassification_eval.ScoreHistogram(
+                score.min(), score.max(), 100
+            )
+            histogram.add(y_true[part], score[part])
+            histograms.append(histogram)
+        histogram = histograms[0].merge(histograms[1])
+        start_values, end_values, cumulative_counts = histogram.gen_items()
+        self.assertEqual(cumulative_counts.rows[-1], 10000)
+        self.assertEqual(cumulative_counts.positives[-1], y_true.sum())
+        self.assertAlmostEqual(cumulative_counts.scores[-1], score.sum())
+        self.assertEqual(start_values[0], score.min())
+        self.assertEqual(end_values[-1], score.max())
+        self.assertAlmostEqual(
+            histogram.gen_f1_score(), metrics.f1_score(y_true, score >= 0.5)
+        )
+
+        fprs, tprs, _ = biclassification_eval.gen_roc_curve(
+            start_values, cumulative_counts
+        )
+        auc_bound, ks_bound = histogram.gen_error_bounds()
+        self.assertLessEqual(
+            abs(metrics.auc(fprs, tprs) - metrics.roc_auc_score(y_true, score)),
+            auc_bound,
+        )
+        exact_fprs, exact_tprs, _ = metrics.roc_curve(y_true, score)
+        ks_error = max(exact_tprs - exact_fprs) - max(tprs - fprs)
+        self.assertGreaterEqual(ks_error, 0)
+        self.assertLessEqual(ks_error, ks_bound)
+
+    def test_score_histogram_range_bins(self):
+        # rounded scores, many of which are on edges of equal-range bins
+        rng = np.random.default_rng(0)
+        score = np.sort(np.round(rng.random(10000), 2))
+        y_true = (rng.random(10000) < score).astype("float64")
+        bucket_num = 10
+        range_bins = pandas.cut(score, bucket_num, duplicates="drop", retbins=True)[1]
+        exact_reports = biclassification_eval.gen_bin_reports(
+            score,
+            score,
+            biclassification_eval.gen_cumulative_counts(y_true, score),
+            range_bins,
+            0,
+        )
+
+        histogram = biclassification_eval.ScoreHistogram(
+            score.min(), score.max(), 10000, bucket_num
+        )
+        histogram.add(y_true, score)
+        np.testing.assert_array_equal(histogram.range_edges, range_bins)
+        start_values, end_values, cumulative_counts = histogram.gen_items()
+        reports = biclassification_eval.gen_bin_reports(
+            start_values, end_values, cumulative_counts, histogram.range_edges, 0
+        )
+        self.assertEqual(len(reports), len(exact_reports))
+        for report, exact_report in zip(reports, exact_reports):
+            self.assertEqual(report.keys(), exact_report.keys())
+            for key, value in exact_report.items():
+                self.assertAlmostEqual(report[key], value, msg=key)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,503 @@
+# Copyright 2024 Ant Group Co., Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import json
+import os
+import unittest
+from unittest import mock
+
+import joblib
+import numpy
+import pandas
+from google.protobuf import json_format
+from secretflow.spec.v1 import data_pb2
+from teeapps.biz.common import common
+
+TEST_INPUT_JSON = """
+{
+  "data_path": "teeapps/biz/testdata/breast_cancer/breast_cancer.csv",
+  "schema": {
+    "ids": [
+      "id"
+    ],
+    "features": [
+      "mean radius",
+      "mean texture",
+      "mean perimeter",
+      "mean area",
+      "mean smoothness",
+      "mean compactness",
+      "mean concavity",
+      "mean concave points",
+      "mean symmetry",
+      "mean fractal dimension"
+    ],
+    "labels": [
+      "target"
+    ],
+    "id_types": [
+      "int"
+    ],
+    "feature_types": [
+      "float",
+      "float",
+      "float",
+      "float",
+      "float",
+      "float",
+      "float",
+      "float",
+      "float",
+      "float"
+    ],
+    "label_types": [
+      "bool"
+    ]
+  }
+}
+"""
+
+TEST_USECOLS = ["target", "mean area", "id"]
+TEST_USECOLS_IN_FILE_ORDER = ["id", "mean area", "target"]
+
+TEST_OUTPUT_PATH = "output.table"
+TEST_OUTPUT_SCHEMA_PATH = "output_schema.json"
+
+TEST_PARTITION_NUM = 3
+
+TEST_NARROW_CSV = """id,age,height,married,salary
+a,3,1.5,True,20000
+b,,1.75,,
+c,200,,False,65000
+"""
+TEST_NARROW_SCHEMA = {
+    "ids": ["id"],
+    "features": ["age", "height", "married", "salary"],
+    "labels": [],
+    "id_types": ["str"],
+    "feature_types": ["uint8", "float32", "bool", "int32"],
+    "label_types": [],
+}
+TEST_NARROW_DTYPES = ["category", "UInt8", "float32", "boolean", "Int32"]
+TEST_NARROW_CSV_PATH = "narrow.csv"
+
+
+class UnitTests(unittest.TestCase):
+    def test_read_engines(self):
+        task_input = json.loads(TEST_INPUT_JSON)
+        arrow_df = common.gen_data_frame(task_input, engine=common.READ_ENGINE_ARROW)
+        pandas_df = common.gen_data_frame(task_input, engine=common.READ_ENGINE_PANDAS)
+        pandas.testing.assert_frame_equal(arrow_df, pandas_df)
+        self.assertEqual(arrow_df.shape, (569, 12))
+        self.assertEqual(str(arrow_df["id"].dtype), "int64")
+        self.assertEqual(str(arrow_df["target"].dtype), "bool")
+
+    def test_read_engines_with_missing_str(self):
+        with open(TEST_NARROW_CSV_PATH, "w") as csv_f:
+            csv_f.write(TEST_NARROW_CSV.replace("a,3", ",3"))
+        task_input = {
+            common.DATA_PATH: TEST_NARROW_CSV_PATH,
+            common.SCHEMA: dict(
+                TEST_NARROW_SCHEMA, feature_types=["float", "float", "str", "float"]
+            ),
+        }
+        # missing strings are NaN whichever engine reads them
+        arrow_df = common.gen_data_frame(task_input, engine=common.READ_ENGINE_ARROW)
+        pandas_df = common.gen_data_frame(task_input, engine=common.READ_ENGINE_PANDAS)
+        pandas.testing.assert_frame_equal(arrow_df, pandas_df)
+        self.assertTrue(numpy.isnan(arrow_df["id"][0]))
+        self.assertTrue(numpy.isnan(arrow_df["married"][1]))
+        common.write_data_frame(
+            pandas_df, TEST_OUTPUT_PATH, common.TABLE_FORMAT_PARQUET
+        )
+        pandas.testing.assert_frame_equal(
+            common.gen_data_frame(task_input, TEST_OUTPUT_PATH), pandas_df
+        )
+        os.remove(TEST_OUTPUT_PATH)
+        os.remove(TEST_NARROW_CSV_PATH)
+
+    def test_read_engines_with_usecols(self):
+        task_input = json.loads(TEST_INPUT_JSON)
+        arrow_df = common.gen_data_frame(
+            task_input, usecols=TEST_USECOLS, engine=common.READ_ENGINE_ARROW
+        )
+        pandas_df = common.gen_data_frame(
+            task_input, usecols=TEST_USECOLS, engine=common.READ_ENGINE_PANDAS
+        )
+        pandas.testing.assert_frame_equal(arrow_df, pandas_df)
+        self.assertListEqual(arrow_df.columns.to_list(), TEST_USECOLS_IN_FILE_ORDER)
+
+    def test_read_engine_fallback(self):
+        task_input = json.loads(TEST_INPUT_JSON)
+        # arrow can not parse float text into int column, pandas engine raises
+        task_input[common.SCHEMA][common.FEATURE_TYPES][0] = "int"
+        with self.assertRaises(ValueError):
+            common.gen_data_frame(task_input, engine=common.READ_ENGINE_ARROW)
+
+    def test_iter_data_frame(self):
+        task_input = json.loads(TEST_INPUT_JSON)
+        df = common.gen_data_frame(task_input, usecols=TEST_USECOLS)
+        chunks = list(
+            common.iter_data_frame(task_input, usecols=TEST_USECOLS, chunksize=100)
+        )
+        self.assertListEqual([len(chunk) for chunk in chunks], [100] * 5 + [69])
+        pandas.testing.assert_frame_equal(pandas.concat(chunks), df)
+
+        # chunks agree with gen_data_frame on missing values and narrow types
+        with open(TEST_NARROW_CSV_PATH, "w") as csv_f:
+            csv_f.write(TEST_NARROW_CSV.replace("a,3", ",3"))
+        narrow_input = {
+            common.DATA_PATH: TEST_NARROW_CSV_PATH,
+            common.SCHEMA: TEST_NARROW_SCHEMA,
+        }
+        narrow_df = common.gen_data_frame(narrow_input, narrow_dtypes=True)
+        common.write_data_frame(narrow_df, TEST_OUTPUT_PATH, common.TABLE_FORMAT_ARROW)
+        # chunks share the categories of the whole table, whatever the reader
+        for file_path, pyarrow in [
+            (None, common.pyarrow),
+            (None, None),
+            (TEST_OUTPUT_PATH, common.pyarrow),
+        ]:
+            with mock.patch.object(common, "pyarrow", pyarrow):
+                chunks = list(
+                    common.iter_data_frame(
+                        narrow_input, file_path, chunksize=2, narrow_dtypes=True
+                    )
+                )
+                df = common.gen_data_frame(narrow_input, file_path, narrow_dtypes=True)
+            pandas.testing.assert_frame_equal(df, narrow_df)
+            pandas.testing.assert_frame_equal(pandas.concat(chunks), narrow_df)
+        os.remove(TEST_OUTPUT_PATH)
+        # a table without rows still has a typed chunk
+        with open(TEST_NARROW_CSV_PATH, "w") as csv_f:
+            csv_f.write(TEST_NARROW_CSV.split("\n")[0] + "\n")
+        chunks = list(common.iter_data_frame(narrow_input, narrow_dtypes=True))
+        self.assertEqual(len(chunks), 1)
+        self.assertEqual(len(chunks[0]), 0)
+        self.assertListEqual(
+            [str(dtype) for dtype in chunks[0].dtypes], TEST_NARROW_DTYPES
+        )
+        os.remove(TEST_NARROW_CSV_PATH)
+
+    def test_columnar_table_format(self):
+        task_input = json.loads(TEST_INPUT_JSON)
+        df = common.gen_data_frame(task_input)
+        for table_format in [common.TABLE_FORMAT_ARROW, common.TABLE_FORMAT_PARQUET]:
+            common.write_data_frame(df, TEST_OUTPUT_PATH, table_format)
+            self.assertEqual(common.get_table_format(TEST_OUTPUT_PATH), table_format)
+            pandas.testing.assert_frame_equal(
+                common.gen_data_frame(task_input, TEST_OUTPUT_PATH), df
+            )
+            pandas.testing.assert_frame_equal(
+                common.gen_data_frame(task_input, TEST_OUTPUT_PATH, TEST_USECOLS),
+                df[TEST_USECOLS_IN_FILE_ORDER],
+            )
+            # batches are read one by one instead of the whole table
+            with mock.patch.object(
+                common, "read_columnar_table", side_effect=AssertionError
+            ):
+                chunks = list(
+                    common.iter_data_frame(
+                        task_input, TEST_OUTPUT_PATH, TEST_USECOLS, chunksize=100
+                    )
+                )
+            self.assertListEqual([len(chunk) for chunk in chunks], [100] * 5 + [69])
+            pandas.testing.assert_frame_equal(
+                pandas.concat(chunks), df[TEST_USECOLS_IN_FILE_ORDER]
+            )
+            os.remove(TEST_OUTPUT_PATH)
+
+    def test_table_source(self):
+        task_input = json.loads(TEST_INPUT_JSON)
+        source = common.TableSource(task_input)
+        self.assertEqual(source.table_format, common.TABLE_FORMAT_CSV)
+        self.assertEqual(source.delimiter, ",")
+        self.assertListEqual(
+            source.col_names, common.get_cols_in_schema(task_input[common.SCHEMA])
+        )
+        self.assertEqual(source.get_col_role("id"), common.IDS)
+        self.assertEqual(source.get_col_type("target"), "bool")
+        self.assertEqual(source.dtypes["mean area"], "float64")
+        self.assertListEqual(
+            source.get_usecols(TEST_USECOLS), TEST_USECOLS_IN_FILE_ORDER
+        )
+        with self.assertRaises(ValueError):
+            source.get_usecols(["not exist"])
+
+    def test_wide_table_schema(self):
+        col_num = 20000
+        features = [f"f{i}" for i in range(col_num)]
+        schema = {
+            common.IDS: ["id"],
+            common.FEATURES: features,
+            common.LABELS: [],
+            common.ID_TYPES: ["str"],
+            common.FEATURE_TYPES: ["float"] * col_num,
+            common.LABEL_TYPES: [],
+        }
+        task_input = {common.SCHEMA: schema}
+        col_types = common.get_col_types(task_input, ["id"] + features)
+        self.assertEqual(len(col_types), col_num + 1)
+        common.col_type_to_float(task_input, "id")
+        self.assertEqual(schema[common.ID_TYPES][0], "float64")
+
+        df = pandas.DataFrame(
+            [[0.0] * (col_num + 1)], columns=["id"] + features, dtype="float64"
+        )
+        output_schema = data_pb2.TableSchema()
+        common.append_table_schema(output_schema, schema)
+        output_schema = common.gen_output_schema(df, output_schema)
+        self.assertListEqual(list(output_schema.ids), ["id"])
+        self.assertListEqual(list(output_schema.features), features)
+
+    def test_narrow_dtypes(self):
+        with open(TEST_NARROW_CSV_PATH, "w") as csv_f:
+            csv_f.write(TEST_NARROW_CSV)
+        task_input = {
+            common.DATA_PATH: TEST_NARROW_CSV_PATH,
+            common.SCHEMA: TEST_NARROW_SCHEMA,
+        }
+        for engine in [common.READ_ENGINE_ARROW, common.READ_ENGINE_PANDAS]:
+            df = common.gen_data_frame(task_input, engine=engine, narrow_dtypes=True)
+            self.assertListEqual(
+                [str(dtype) for dtype in df.dtypes], TEST_NARROW_DTYPES
+            )
+            self.assertTrue(df["age"].isna()[1])
+            self.assertEqual(df["age"][2], 200)
+            # round trip through output schema
+            output_schema = data_pb2.TableSchema()
+            common.append_table_schema(output_schema, TEST_NARROW_SCHEMA)
+            output_schema = common.gen_output_schema(df, output_schema)
+            self.assertListEqual(list(output_schema.id_types), ["str"])
+            self.assertListEqual(
+                list(output_schema.feature_types),
+                TEST_NARROW_SCHEMA[common.FEATURE_TYPES],
+            )
+            # int and bool columns which can be missing are declared readable
+            output_schema = common.gen_output_schema(
+                df, output_schema, ["age", "height", "married"]
+            )
+            self.assertListEqual(
+                list(output_schema.feature_types),
+                ["float64", "float32", "str", "int32"],
+            )
+        os.remove(TEST_NARROW_CSV_PATH)
+
+    def test_write_table(self):
+        task_input = json.loads(TEST_INPUT_JSON)
+        df = common.gen_data_frame(task_input)
+        schema = data_pb2.TableSchema()
+        common.append_table_schema(schema, task_input[common.SCHEMA])
+        task_output = {
+            common.DATA_PATH: TEST_OUTPUT_PATH,
+            common.DATA_SCHEMA_PATH: TEST_OUTPUT_SCHEMA_PATH,
+        }
+        # parts are chunked and concatenated in order, with a single header
+        output_schema = common.write_table(
+            [df.iloc[:300], df.iloc[300:300], df.iloc[300:]],
+            task_output,
+            schema,
+            chunksize=64,
+        )
+        with open(TEST_OUTPUT_PATH, "r") as data_f:
+            self.assertEqual(data_f.read(), df.to_csv(index=False))
+        with open(TEST_OUTPUT_SCHEMA_PATH, "r") as schema_f:
+            self.assertEqual(schema_f.read(), json_format.MessageToJson(output_schema))
+        self.assertListEqual(list(output_schema.id_types), ["int64"])
+        self.assertListEqual(list(output_schema.label_types), ["bool"])
+
+        # float precision is controllable
+        common.write_table(df, task_output, schema, float_format="%.2f")
+        with open(TEST_OUTPUT_PATH, "r") as data_f:
+            self.assertEqual(data_f.read(), df.to_csv(index=False, float_format="%.2f"))
+
+        # empty table keeps the header
+        common.write_table(df.iloc[:0], task_output, schema)
+        with open(TEST_OUTPUT_PATH, "r") as data_f:
+            self.assertEqual(data_f.read(), df.iloc[:0].to_csv(index=False))
+        os.remove(TEST_OUTPUT_PATH)
+        os.remove(TEST_OUTPUT_SCHEMA_PATH)
+
+    def test_plan_usecols(self):
+        task_input = json.loads(TEST_INPUT_JSON)
+        usecols = common.plan_usecols(
+            task_input, ["mean area", "target"], ["target"], ["id"]
+        )
+        self.assertListEqual(usecols, ["mean area", "target", "id"])
+        df = common.gen_data_frame(task_input, usecols=usecols)
+        self.assertListEqual(df.columns.to_list(), TEST_USECOLS_IN_FILE_ORDER)
+        with self.assertRaises(AssertionError):
+            common.plan_usecols(task_input, ["mean area", "unknown"])
+
+    def test_hash_join_keys(self):
+        df = pandas.DataFrame({"a": [1, 2, 0], "b": ["x", "y", "z"]})
+        other = pandas.DataFrame({"b": ["x", "y", "z"], "a": [1.0, 2.0, -0.0]})
+        hashes = common.hash_join_keys(df, ["a", "b"])
+        self.assertEqual(hashes.dtype, numpy.uint64)
+        # the same key of int and float columns, in any column order
+        numpy.testing.assert_array_equal(
+            hashes, common.hash_join_keys(other, ["a", "b"])
+        )
+        self.assertFalse(
+            numpy.array_equal(hashes, common.hash_join_keys(df, ["a", "b"], seed=1))
+        )
+
+    def test_split_bigfile_into_smallfiles(self):
+        task_input = json.loads(TEST_INPUT_JSON)
+        df = common.gen_data_frame(task_input)
+        for partition_format in [common.TABLE_FORMAT_CSV, common.TABLE_FORMAT_ARROW]:
+            file_names = common.split_bigfile_into_smallfiles(
+                task_input,
+                ["id"],
+                TEST_PARTITION_NUM,
+                partition_format=partition_format,
+                chunksize=100,
+            )
+            parts = [
+                common.gen_data_frame(task_input, file_name) for file_name in file_names
+            ]
+            for part in parts:
+                self.assertListEqual(part.columns.to_list(), df.columns.to_list())
+                self.assertGreater(len(part), 0)
+            pandas.testing.assert_frame_equal(
+                pandas.concat(parts).sort_values("id", ignore_index=True),
+                df.sort_values("id", ignore_index=True),
+            )
+            for file_name in file_names:
+                os.remove(file_name)
+
+    def test_bloom_filter(self):
+        df = pandas.DataFrame({"id": numpy.arange(1000), "name": ["x"] * 1000})
+        key_filter = common.BloomFilter(len(df), 0.01)
+        key_filter.add(df, ["id", "name"])
+        self.assertTrue(key_filter.contains(df, ["id", "name"]).all())
+        # keys of float columns are the same keys
+        df["id"] = df["id"].astype("float64")
+        self.assertTrue(key_filter.contains(df, ["id", "name"]).all())
+        other = pandas.DataFrame({"id": numpy.arange(1000, 11000), "name": "x"})
+        self.assertLess(key_filter.contains(other, ["id", "name"]).mean(), 0.02)
+
+    def test_split_bigfile_with_key_filter(self):
+        task_input = json.loads(TEST_INPUT_JSON)
+        df = common.gen_data_frame(task_input)
+        key_filter = common.BloomFilter(100, 1e-6)
+        key_filter.add(df[:100], ["id"])
+        for file_num in [1, TEST_PARTITION_NUM]:
+            file_names = common.split_bigfile_into_smallfiles(
+                task_input, ["id"], file_num, chunksize=100, key_filter=key_filter
+            )
+            self.assertNotIn(task_input["data_path"], file_names)
+            parts = [
+                common.gen_data_frame(task_input, file_name) for file_name in file_names
+            ]
+            pandas.testing.assert_frame_equal(
+                pandas.concat(parts).sort_values("id", ignore_index=True),
+                df[:100].sort_values("id", ignore_index=True),
+            )
+            for file_name in file_names:
+                os.remove(file_name)
+
+    def test_compression(self):
+        task_input = json.loads(TEST_INPUT_JSON)
+        df = common.gen_data_frame(task_input)
+        schema = data_pb2.TableSchema()
+        common.append_table_schema(schema, task_input[common.SCHEMA])
+        for compression in common.COMPRESSIONS:
+            for table_format in [
+                common.TABLE_FORMAT_CSV,
+                common.TABLE_FORMAT_ARROW,
+                common.TABLE_FORMAT_PARQUET,
+            ]:
+                task_output = {
+                    common.DATA_PATH: TEST_OUTPUT_PATH,
+                    common.TABLE_FORMAT: table_format,
+                    common.COMPRESSION: compression,
+                }
+                common.write_table(df, task_output, schema, chunksize=64)
+                self.assertEqual(
+                    common.get_table_format(TEST_OUTPUT_PATH), table_format
+                )
+                if table_format == common.TABLE_FORMAT_CSV:
+                    self.assertLess(
+                        os.path.getsize(TEST_OUTPUT_PATH),
+                        len(df.to_csv(index=False)),
+                    )
+                for engine in [common.READ_ENGINE_ARROW, common.READ_ENGINE_PANDAS]:
+                    pandas.testing.assert_frame_equal(
+                        common.gen_data_frame(
+                            task_input, TEST_OUTPUT_PATH, engine=engine
+                        ),
+                        df,
+                    )
+                chunks = common.iter_data_frame(
+                    task_input, TEST_OUTPUT_PATH, usecols=TEST_USECOLS, chunksize=100
+                )
+                pandas.testing.assert_frame_equal(
+                    pandas.concat(chunks, ignore_index=True),
+                    df[TEST_USECOLS_IN_FILE_ORDER],
+                )
+
+            # models are loaded by joblib as is
+            common.write_model(
+                df,
+                {common.DATA_PATH: TEST_OUTPUT_PATH, common.COMPRESSION: compression},
+            )
+            pandas.testing.assert_frame_equal(joblib.load(TEST_OUTPUT_PATH), df)
+        os.remove(TEST_OUTPUT_PATH)
+
+    def test_compression_packages(self):
+        df = pandas.DataFrame({"a": range(10)})
+        for compression in common.COMPRESSIONS:
+            # compressed tables need pyarrow
+            with mock.patch.object(common, "pyarrow", None):
+                with self.assertRaisesRegex(AssertionError, "pyarrow"):
+                    common.write_csv_table(
+                        [df], TEST_OUTPUT_PATH, compression=compression
+                    )
+                with self.assertRaisesRegex(AssertionError, "pyarrow"):
+                    common.open_output_stream(TEST_OUTPUT_PATH, compression)
+            # compressed models need the package of the compression
+            package = "zstandard" if compression == common.COMPRESSION_ZSTD else "lz4"
+            with mock.patch.object(common, package, None):
+                with self.assertRaisesRegex(AssertionError, package):
+                    common.write_model(
+                        df,
+                        {
+                            common.DATA_PATH: TEST_OUTPUT_PATH,
+                            common.COMPRESSION: compression,
+                        },
+                    )
+        with self.assertRaises(RuntimeError):
+            common.write_model(
+                df, {common.DATA_PATH: TEST_OUTPUT_PATH, common.COMPRESSION: "gzip"}
+            )
+        self.assertFalse(os.path.exists(TEST_OUTPUT_PATH))
+
+    def test_phase_timer(self):
+        timer = common.PhaseTimer()
+        clock = iter(range(0, 100, 10))
+        with mock.patch.object(common.time, "perf_counter", lambda: next(clock)):
+            with timer.phase("outer"):
+                # inner time is not counted in outer
+                with timer.phase("inner"):
+                    pass
+                items = list(timer.iter_phase("inner", [1, 2]))
+        self.assertListEqual(items, [1, 2])
+        self.assertDictEqual(timer.seconds, {"outer": 50.0, "inner": 40.0})
+        self.assertDictEqual(timer.counts, {"outer": 1, "inner": 4})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+# Copyright 2023 Ant Group Co., Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import tempfile
+import unittest
+
+import pandas
+
+from teeapps.biz.benchmarks import psi_benchmark
+from teeapps.biz.common import common
+from teeapps.biz.psi import psi
+
+
+class UnitTests(unittest.TestCase):
+    def test_gen_inputs(self):
+        spec = psi_benchmark.DataSpec(
+            parties=3,
+            rows=2000,
+            col_num=2,
+            key_type=psi_benchmark.KEY_TYPE_COMPOSITE,
+            overlap=0.5,
+            dup_rate=0.1,
+            sorted_keys=True,
+        )
+        with tempfile.TemporaryDirectory() as data_dir:
+            inputs = psi_benchmark.gen_inputs(spec, data_dir)
+            dfs = [common.gen_data_frame(task_input) for task_input in inputs]
+        self.assertEqual(len(dfs), 3)
+        for df, task_input in zip(dfs, inputs):
+            self.assertListEqual(task_input[psi.KEY], ["id1", "id2"])
+            self.assertEqual(len(df.columns), 4)
+            self.assertEqual(len(df), 2000)
+            self.assertEqual(len(df.drop_duplicates(["id1", "id2"])), 1800)
+            # sorted by composite keys
+            pandas.testing.assert_frame_equal(
+                df, df.sort_values(["id1", "id2"], ignore_index=True)
+            )
+        shared_keys = (
+            dfs[0].merge(dfs[1], on=["id1", "id2"]).merge(dfs[2], on=["id1", "id2"])
+        )
+        self.assertEqual(len(shared_keys.drop_duplicates(["id1", "id2"])), 900)
+
+    def test_run_benchmark(self):
+        spec = psi_benchmark.DataSpec(rows=2000, col_num=2, dup_rate=0.1)
+        cases = [
+            psi_benchmark.EngineCase(),
+            psi_benchmark.EngineCase(memory_budget=0, worker_num=1),
+        ]
+        report = psi_benchmark.run_benchmark([spec], cases)
+        self.assertIn("pandas", report["env"])
+        in_memory, partitioned = report["results"]
+        self.assertEqual(in_memory["case"]["memory_budget"], 2048)
+        self.assertNotIn(psi.PHASE_SPLIT, in_memory["phases"])
+        for phase in [psi.PHASE_SPLIT, psi.PHASE_JOIN, psi.PHASE_DUMP]:
+            self.assertIn(phase, partitioned["phases"])
+        self.assertIn(common.PHASE_SCHEMA, partitioned["phases"])
+        self.assertGreater(in_memory["output_rows"], 0)
+        self.assertEqual(in_memory["output_rows"], partitioned["output_rows"])
+        self.assertGreater(partitioned["peak_rss_mb"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
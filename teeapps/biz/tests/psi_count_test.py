@@ -0,0 +1,181 @@
+# Copyright 2023 Ant Group Co., Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import json
+import os
+import unittest
+
+import numpy
+import pandas
+from google.protobuf import json_format
+from secretflow.spec.v1.report_pb2 import Report
+
+from teeapps.biz.psi_count import psi_count
+from teeapps.biz.psi_count.psi_count import run_psi_count
+
+TEST_CONFIG_JSON = """
+{
+  "component_name": "psi_count",
+  "inputs":[
+    {
+      "data_path": "teeapps/biz/testdata/breast_cancer/alice.csv",
+      "schema": {
+        "ids": ["id"],
+        "features": [
+          "mean radius",
+          "mean texture",
+          "mean perimeter",
+          "mean area",
+          "mean smoothness"
+        ],
+        "labels": [],
+        "id_types": ["int"],
+        "feature_types": ["float", "float", "float", "float", "float"],
+        "label_types": []
+      },
+      "key": ["id"]
+    },
+    {
+      "data_path": "teeapps/biz/testdata/breast_cancer/bob.csv",
+      "schema": {
+        "ids": ["id"],
+        "features": [
+          "mean compactness",
+          "mean concavity",
+          "mean concave points",
+          "mean symmetry",
+          "mean fractal dimension"
+        ],
+        "labels": ["target"],
+        "id_types": ["int"],
+        "feature_types": ["float", "float", "float", "float", "float"],
+        "label_types": ["bool"]
+      },
+      "key": ["id"]
+    },
+    {
+      "data_path": "bob_subset.csv",
+      "schema": {
+        "ids": ["id"],
+        "features": [
+          "mean compactness",
+          "mean concavity",
+          "mean concave points",
+          "mean symmetry",
+          "mean fractal dimension"
+        ],
+        "labels": ["target"],
+        "id_types": ["int"],
+        "feature_types": ["float", "float", "float", "float", "float"],
+        "label_types": ["bool"]
+      },
+      "key": ["id"]
+    }
+  ],
+  "outputs":[
+    {
+      "data_path": "psi_count.report"
+    }
+  ]
+}
+"""
+
+TEST_REPORT_PATH = "psi_count.report"
+TEST_BOB_SUBSET_PATH = "bob_subset.csv"
+
+
+class UnitTests(unittest.TestCase):
+    def setUp(self):
+        bob_df = pandas.read_csv("teeapps/biz/testdata/breast_cancer/bob.csv")
+        # every tenth row, twice, so that rows and distinct keys differ
+        pandas.concat([bob_df[::10], bob_df[::10]]).to_csv(
+            TEST_BOB_SUBSET_PATH, index=False
+        )
+
+    def tearDown(self):
+        for path in [TEST_BOB_SUBSET_PATH, TEST_REPORT_PATH]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def run_report(self, task_config: dict) -> dict:
+        run_psi_count(task_config)
+        with open(TEST_REPORT_PATH, "r") as report_f:
+            report = json_format.Parse(report_f.read(), Report())
+        desc, table = report.tabs[0].divs[0].children
+        items = {
+            item.name: item.value.s or item.value.i64 or item.value.f
+            for item in desc.descriptions.items
+        }
+        items.update(
+            {row.name: row.items[0].i64 for row in table.table.rows},
+        )
+        return items
+
+    def test_psi_count_exact(self):
+        items = self.run_report(json.loads(TEST_CONFIG_JSON))
+        self.assertEqual(items["count_method"], psi_count.COUNT_METHOD_EXACT)
+        self.assertEqual(items["intersection"], 57)
+        self.assertEqual(items["input1_rows"], 569)
+        self.assertEqual(items["input1_keys"], 569)
+        self.assertEqual(items["input3_rows"], 114)
+        self.assertEqual(items["input3_keys"], 57)
+        self.assertAlmostEqual(items["input1_intersection_ratio"], 57 / 569)
+        self.assertEqual(items["input1-input2"], 569)
+        self.assertEqual(items["input1-input3"], 57)
+        self.assertEqual(items["input2-input3"], 57)
+
+    def test_psi_count_hll(self):
+        task_config = json.loads(TEST_CONFIG_JSON)
+        task_config[psi_count.COUNT_METHOD] = psi_count.COUNT_METHOD_HLL
+        items = self.run_report(task_config)
+        self.assertEqual(items["count_method"], psi_count.COUNT_METHOD_HLL)
+        # rows are always exact, keys are estimated within a few percent
+        self.assertEqual(items["input3_rows"], 114)
+        self.assertAlmostEqual(items["input1_keys"], 569, delta=569 * 0.03)
+        self.assertAlmostEqual(items["input3_keys"], 57, delta=57 * 0.03)
+        self.assertAlmostEqual(items["input1-input2"], 569, delta=569 * 0.03)
+        self.assertAlmostEqual(items["intersection"], 57, delta=569 * 0.03)
+
+    def test_hyper_log_log(self):
+        rng = numpy.random.default_rng(0)
+        hashes = rng.integers(0, 2**64, 200000, dtype=numpy.uint64)
+        for precision in [10, psi_count.DEFAULT_HLL_PRECISION]:
+            error = 1.04 / (1 << precision) ** 0.5
+            left = psi_count.HyperLogLog(precision)
+            left.add(hashes[:120000])
+            right = psi_count.HyperLogLog(precision)
+            right.add(hashes[80000:])
+            self.assertAlmostEqual(left.estimate(), 120000, delta=120000 * 3 * error)
+            self.assertAlmostEqual(
+                left.union(right).estimate(), 200000, delta=200000 * 3 * error
+            )
+        # few registers use the tabulated bias correction
+        for precision, alpha in [(4, 0.673), (5, 0.697), (6, 0.709)]:
+            sketch = psi_count.HyperLogLog(precision)
+            sketch.registers[:] = 10
+            self.assertAlmostEqual(sketch.estimate(), alpha * (1 << precision) * 1024)
+        estimates = []
+        for chunk in numpy.array_split(hashes, 100):
+            sketch = psi_count.HyperLogLog(psi_count.MIN_HLL_PRECISION)
+            sketch.add(chunk)
+            estimates.append(sketch.estimate())
+        self.assertAlmostEqual(numpy.mean(estimates) / 2000, 1, delta=0.05)
+        # bit length of 64-bit values
+        values = numpy.array([0, 1, 2**32 - 1, 2**32, 2**64 - 1], numpy.uint64)
+        self.assertListEqual(list(psi_count.get_bit_length(values)), [0, 1, 32, 33, 64])
+
+
+if __name__ == "__main__":
+    unittest.main()
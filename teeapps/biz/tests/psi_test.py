@@ -14,12 +14,22 @@
 
 
 import csv
+import functools
+import io
 import json
+import logging
 import os
+import tempfile
 import unittest
+from concurrent import futures
+from unittest import mock
 
+import numpy
+import pandas
 from google.protobuf import json_format
 from secretflow.spec.v1 import data_pb2
+from teeapps.biz.common import common
+from teeapps.biz.psi import psi
 from teeapps.biz.psi.psi import run_psi
 
 TEST_CONFIG_JSON = """
@@ -161,6 +171,11 @@ TEST_OUTPUT_LABEL_TYPES = ["bool"]
 
 TEST_OUTPUT_PATH = "output.csv"
 TEST_OUTPUT_SCHEMA_PATH = "output_schema.json"
+TEST_BOB_SUBSET_PATH = "bob_subset.csv"
+TEST_SORTED_PATHS = ["alice_sorted.csv", "bob_sorted.csv"]
+
+# split inputs into several partitions
+TEST_FILE_SIZE_LIMIT_IN_BYTES = 8 * 1024
 
 
 class UnitTests(unittest.TestCase):
@@ -192,6 +207,550 @@ class UnitTests(unittest.TestCase):
         self.assertListEqual(list(schema.feature_types), TEST_OUTPUT_FEATURE_TYPES)
         self.assertListEqual(list(schema.label_types), TEST_OUTPUT_LABEL_TYPES)
 
+    def test_psi_partitioned(self):
+        run_psi(json.loads(TEST_CONFIG_JSON))
+        expected_df = pandas.read_csv(TEST_OUTPUT_PATH)
+        with open(TEST_OUTPUT_SCHEMA_PATH, "r") as schema_f:
+            expected_schema = schema_f.read()
+        os.remove(TEST_OUTPUT_PATH)
+        os.remove(TEST_OUTPUT_SCHEMA_PATH)
+
+        for table_format, compression in [
+            ("csv", None),
+            ("csv", "zstd"),
+            ("arrow", None),
+        ]:
+            # memory budget 0 disables the in-memory join
+            task_config = json.loads(TEST_CONFIG_JSON)
+            task_config[psi.MEMORY_BUDGET] = 0
+            task_config[psi.WORKER_NUM] = 2
+            task_config["outputs"][0]["table_format"] = table_format
+            task_config["outputs"][0]["compression"] = compression
+            with mock.patch.object(
+                psi, "DEFAULT_FILE_SIZE_LIMIT_IN_BYTES", TEST_FILE_SIZE_LIMIT_IN_BYTES
+            ):
+                run_psi(task_config)
+            if table_format == "csv":
+                df = pandas.read_csv(TEST_OUTPUT_PATH, compression=compression)
+            else:
+                df = pandas.read_feather(TEST_OUTPUT_PATH)
+            # rows are ordered by partitions
+            pandas.testing.assert_frame_equal(
+                df.sort_values("id", ignore_index=True),
+                expected_df.sort_values("id", ignore_index=True),
+            )
+            with open(TEST_OUTPUT_SCHEMA_PATH, "r") as schema_f:
+                self.assertEqual(schema_f.read(), expected_schema)
+            os.remove(TEST_OUTPUT_PATH)
+            os.remove(TEST_OUTPUT_SCHEMA_PATH)
+        self.assertListEqual(
+            [name for name in os.listdir(".") if name.startswith(TEST_OUTPUT_PATH)],
+            [],
+        )
+
+    def test_psi_key_filter(self):
+        # only a few rows of bob can be joined
+        task_config = json.loads(TEST_CONFIG_JSON)
+        bob_df = pandas.read_csv(task_config["inputs"][1]["data_path"])
+        bob_df[::10].to_csv(TEST_BOB_SUBSET_PATH, index=False)
+        task_config["inputs"][1]["data_path"] = TEST_BOB_SUBSET_PATH
+        task_config[psi.MEMORY_BUDGET] = 0
+
+        dfs = []
+        for bloom_filter_fpr in [0, psi.DEFAULT_BLOOM_FILTER_FPR]:
+            task_config[psi.BLOOM_FILTER_FPR] = bloom_filter_fpr
+            with mock.patch.object(
+                psi, "DEFAULT_FILE_SIZE_LIMIT_IN_BYTES", TEST_FILE_SIZE_LIMIT_IN_BYTES
+            ):
+                run_psi(task_config)
+            dfs.append(pandas.read_csv(TEST_OUTPUT_PATH).sort_values("id"))
+            os.remove(TEST_OUTPUT_PATH)
+            os.remove(TEST_OUTPUT_SCHEMA_PATH)
+        self.assertEqual(len(dfs[0]), 57)
+        pandas.testing.assert_frame_equal(dfs[0], dfs[1])
+        os.remove(TEST_BOB_SUBSET_PATH)
+        self.assertListEqual(
+            [name for name in os.listdir(".") if name.startswith(TEST_BOB_SUBSET_PATH)],
+            [],
+        )
+
+    def test_join_order(self):
+        rng = numpy.random.default_rng(0)
+        # few keys of the last input are in the others
+        dfs = [
+            pandas.DataFrame({"id": rng.integers(0, 2000, 3000), "v": range(3000)}),
+            pandas.DataFrame({"ID": rng.integers(0, 2000, 3000), "v": range(3000)}),
+            pandas.DataFrame({"id": rng.integers(0, 2000, 3000) * 1.0, "w": 1}),
+            pandas.DataFrame({"id": rng.integers(1900, 4000, 500), "v": range(500)}),
+        ]
+        join_keys = [["id"], ["ID"], ["id"], ["id"]]
+        order = psi.plan_join_order(dfs, join_keys)
+        self.assertIn(3, order[:2])
+
+        expected_df = psi.merge_data_frames(dfs, join_keys, [0, 1, 2, 3])
+        self.assertListEqual(
+            expected_df.columns.to_list(), ["id", "v_x", "ID", "v_y", "w", "v"]
+        )
+        hashes = [
+            psi.common.hash_join_keys(df, join_key)
+            for df, join_key in zip(dfs, join_keys)
+        ]
+        for order in [order, [3, 2, 1, 0], [0, 1, 2, 3]]:
+            pandas.testing.assert_frame_equal(
+                psi.merge_data_frames(dfs, join_keys, order), expected_df
+            )
+            pandas.testing.assert_frame_equal(
+                psi.merge_data_frames(dfs, join_keys, order, hashes), expected_df
+            )
+
+    def test_psi_sort_merge(self):
+        # sorted inputs with duplicate keys on both sides
+        task_config = json.loads(TEST_CONFIG_JSON)
+        inputs = task_config["inputs"]
+        join_keys = [input["key"] for input in inputs]
+        for i, (task_input, path) in enumerate(zip(inputs, TEST_SORTED_PATHS)):
+            df = pandas.read_csv(task_input["data_path"])
+            df = pandas.concat([df, df[i::3]]).sort_values("id", kind="stable")
+            df.to_csv(path, index=False)
+            task_input["data_path"] = path
+
+        expected_df = psi.run_psi_in_memory(inputs, join_keys)
+        df = pandas.concat(
+            psi.iter_sort_merge_join(inputs, join_keys, chunksize=50),
+            ignore_index=True,
+        )
+        pandas.testing.assert_frame_equal(df, expected_df)
+
+        task_config[psi.MEMORY_BUDGET] = 0
+        run_psi(task_config)
+        pandas.testing.assert_frame_equal(
+            pandas.read_csv(TEST_OUTPUT_PATH), expected_df
+        )
+        os.remove(TEST_OUTPUT_PATH)
+        os.remove(TEST_OUTPUT_SCHEMA_PATH)
+
+        # unsorted inputs are refused if declared sorted
+        task_config = json.loads(TEST_CONFIG_JSON)
+        task_config[psi.JOIN_METHOD] = psi.JOIN_METHOD_SORT_MERGE
+        with self.assertRaises(psi.UnsortedInputError):
+            run_psi(task_config)
+        for path in TEST_SORTED_PATHS + [TEST_OUTPUT_PATH]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def test_psi_sort_merge_fallback(self):
+        with tempfile.TemporaryDirectory() as data_dir:
+            # sampled rows are sorted, a later row of alice is not
+            alice_ids = list(range(psi.SAMPLE_ROWS + 2000))
+            alice_ids.insert(psi.SAMPLE_ROWS + 1000, 0)
+            bob_ids = list(range(0, psi.SAMPLE_ROWS + 2000, 2))
+            task_config = {
+                "component_name": "psi",
+                psi.MEMORY_BUDGET: 0,
+                "inputs": [],
+                "outputs": [
+                    {
+                        common.DATA_PATH: os.path.join(data_dir, TEST_OUTPUT_PATH),
+                        common.DATA_SCHEMA_PATH: os.path.join(
+                            data_dir, TEST_OUTPUT_SCHEMA_PATH
+                        ),
+                    }
+                ],
+            }
+            for ids, path, feature in zip(
+                [alice_ids, bob_ids], TEST_SORTED_PATHS, ["a", "b"]
+            ):
+                path = os.path.join(data_dir, path)
+                pandas.DataFrame({"id": ids, feature: range(len(ids))}).to_csv(
+                    path, index=False
+                )
+                task_config["inputs"].append(
+                    {
+                        "data_path": path,
+                        "schema": {
+                            "ids": ["id"],
+                            "features": [feature],
+                            "id_types": ["int"],
+                            "feature_types": ["int"],
+                            "labels": [],
+                            "label_types": [],
+                        },
+                        "key": ["id"],
+                    }
+                )
+            output = task_config["outputs"][0]
+            inputs = task_config["inputs"]
+
+            # the merge join fails after some batches, and leaves no output
+            with mock.patch.object(
+                psi,
+                "iter_sort_merge_join",
+                functools.partial(psi.iter_sort_merge_join, chunksize=1000),
+            ), self.assertRaises(psi.UnsortedInputError):
+                psi.run_psi_sort_merge(
+                    inputs,
+                    [input["key"] for input in inputs],
+                    output,
+                    data_pb2.TableSchema(),
+                    common.PhaseTimer(),
+                )
+            self.assertListEqual(sorted(os.listdir(data_dir)), TEST_SORTED_PATHS)
+
+            for table_format in [common.TABLE_FORMAT_CSV, common.TABLE_FORMAT_ARROW]:
+                output[common.TABLE_FORMAT] = table_format
+                dfs = []
+                for join_method in [psi.JOIN_METHOD_HASH, psi.JOIN_METHOD_AUTO]:
+                    task_config[psi.JOIN_METHOD] = join_method
+                    # batches before the unsorted row are written
+                    with mock.patch.object(
+                        psi,
+                        "iter_sort_merge_join",
+                        functools.partial(psi.iter_sort_merge_join, chunksize=1000),
+                    ):
+                        run_psi(task_config)
+                    # no partial output of the merge join is left
+                    self.assertListEqual(
+                        sorted(os.listdir(data_dir)),
+                        sorted(
+                            TEST_SORTED_PATHS
+                            + [TEST_OUTPUT_PATH, TEST_OUTPUT_SCHEMA_PATH]
+                        ),
+                    )
+                    if table_format == common.TABLE_FORMAT_CSV:
+                        df = pandas.read_csv(output[common.DATA_PATH])
+                    else:
+                        df = pandas.read_feather(output[common.DATA_PATH])
+                    dfs.append(df.sort_values("id", ignore_index=True))
+                    os.remove(output[common.DATA_PATH])
+                pandas.testing.assert_frame_equal(dfs[1], dfs[0])
+                self.assertEqual(len(dfs[1]), len(bob_ids) + 1)
+
+    def test_psi_join_type(self):
+        task_config = json.loads(TEST_CONFIG_JSON)
+        inputs = task_config["inputs"]
+        # sorted subsets of both inputs, of which some keys are matched
+        for task_input, path, step in zip(inputs, TEST_SORTED_PATHS, [3, 10]):
+            df = pandas.read_csv(task_input["data_path"])
+            df[::step].sort_values("id").to_csv(path, index=False)
+            task_input["data_path"] = path
+        left_df, right_df = [common.gen_data_frame(task_input) for task_input in inputs]
+
+        for join_type in [psi.JOIN_TYPE_LEFT, psi.JOIN_TYPE_OUTER]:
+            task_config[psi.JOIN_TYPE] = join_type
+            # typed as the output csv is read
+            expected_df = pandas.read_csv(
+                io.StringIO(
+                    left_df.merge(right_df, on="id", how=join_type).to_csv(index=False)
+                )
+            )
+            for memory_budget, join_method in [
+                (psi.DEFAULT_MEMORY_BUDGET_IN_MB, psi.JOIN_METHOD_HASH),
+                (0, psi.JOIN_METHOD_HASH),
+                (0, psi.JOIN_METHOD_SORT_MERGE),
+            ]:
+                task_config[psi.MEMORY_BUDGET] = memory_budget
+                task_config[psi.JOIN_METHOD] = join_method
+                with mock.patch.object(
+                    psi,
+                    "DEFAULT_FILE_SIZE_LIMIT_IN_BYTES",
+                    TEST_FILE_SIZE_LIMIT_IN_BYTES,
+                ):
+                    run_psi(task_config)
+                df = pandas.read_csv(TEST_OUTPUT_PATH)
+                pandas.testing.assert_frame_equal(
+                    df.sort_values("id", ignore_index=True),
+                    expected_df.sort_values("id", ignore_index=True),
+                )
+                # int keys of unmatched rows are not written as floats
+                with open(TEST_OUTPUT_PATH) as output_f:
+                    for line in output_f:
+                        self.assertNotIn(".", line.split(",", 1)[0])
+                with open(TEST_OUTPUT_SCHEMA_PATH, "r") as schema_f:
+                    schema = json_format.Parse(schema_f.read(), data_pb2.TableSchema())
+                self.assertListEqual(list(schema.id_types), ["int64"])
+                # labels of unmatched rows are missing, bool can not hold them
+                self.assertEqual(schema.label_types[0], "str")
+                # the output is readable as declared
+                output_df = common.gen_data_frame(
+                    {
+                        common.DATA_PATH: TEST_OUTPUT_PATH,
+                        common.SCHEMA: json_format.MessageToDict(
+                            schema, preserving_proto_field_name=True
+                        ),
+                    }
+                )
+                self.assertEqual(len(output_df), len(expected_df))
+                self.assertEqual(
+                    output_df["target"].isna().sum(),
+                    expected_df["target"].isna().sum(),
+                )
+        self.assertEqual(len(expected_df), len(left_df) + len(right_df) - 19)
+        for path in TEST_SORTED_PATHS + [TEST_OUTPUT_PATH, TEST_OUTPUT_SCHEMA_PATH]:
+            os.remove(path)
+
+    def test_merge_outer_keys(self):
+        dfs = [
+            pandas.DataFrame({"id": [1, 2], "a": [True, False]}),
+            pandas.DataFrame({"ID": [2, 3], "b": [20, 30]}),
+            pandas.DataFrame({"key": [3, 4], "c": [0.3, 0.4]}),
+        ]
+        join_keys = [["id"], ["ID"], ["key"]]
+        df = psi.merge_data_frames(
+            dfs, join_keys, [0, 1, 2], join_type=psi.JOIN_TYPE_OUTER
+        )
+        # keys only in later inputs are in the key column of the first input
+        self.assertListEqual(list(df["id"]), [1, 2, 3, 4])
+        self.assertListEqual(list(df["key"].isna()), [True, True, False, False])
+        self.assertEqual(df["b"].dtype, "Int64")
+        self.assertEqual(df["a"].dtype, "boolean")
+        df = psi.merge_data_frames(
+            dfs, join_keys, [0, 1, 2], join_type=psi.JOIN_TYPE_LEFT
+        )
+        self.assertListEqual(list(df["id"]), [1, 2])
+        self.assertEqual(df["id"].dtype, "int64")
+        self.assertListEqual(list(df["b"].isna()), [True, False])
+
+    def test_merge_by_fingerprint(self):
+        left_df = pandas.DataFrame(
+            {
+                "phone": ["1", "2", "2", None, "3", "4"],
+                "name": ["a", "b", "b", "c", "d", "e"],
+                "v": range(6),
+            }
+        )
+        right_df = pandas.DataFrame(
+            {
+                "name": ["b", "c", "a", "b", "x"],
+                "PHONE": ["2", None, "1", "2", "3"],
+                "v": range(5),
+            }
+        )
+        left_key = ["phone", "name"]
+        right_key = ["PHONE", "name"]
+        expected_df = left_df.merge(right_df, left_on=left_key, right_on=right_key)
+        pandas.testing.assert_frame_equal(
+            psi.merge_by_fingerprint(left_df, right_df, left_key, right_key)[0],
+            expected_df,
+        )
+        # every key collides, matches are still exact
+        with mock.patch.object(
+            psi.common,
+            "hash_join_keys",
+            lambda df, join_key: numpy.zeros(len(df), dtype=numpy.uint64),
+        ):
+            pandas.testing.assert_frame_equal(
+                psi.merge_by_fingerprint(left_df, right_df, left_key, right_key)[0],
+                expected_df,
+            )
+
+    def test_psi_key_fingerprint(self):
+        # string keys are joined by fingerprints in memory
+        dfs = []
+        for fingerprint in [False, True]:
+            task_config = json.loads(TEST_CONFIG_JSON)
+            for task_input in task_config["inputs"]:
+                task_input["schema"]["id_types"] = ["str"]
+            task_config[psi.KEY_FINGERPRINT] = fingerprint
+            run_psi(task_config)
+            dfs.append(pandas.read_csv(TEST_OUTPUT_PATH))
+            os.remove(TEST_OUTPUT_PATH)
+            os.remove(TEST_OUTPUT_SCHEMA_PATH)
+        self.assertEqual(len(dfs[0]), 569)
+        pandas.testing.assert_frame_equal(dfs[1], dfs[0])
+
+    def test_psi_missing_str_keys(self):
+        # missing keys match each other, as in pandas.merge
+        left_df = pandas.DataFrame(
+            {"phone": ["1", "2", None, "3", None, "4"], "a": range(6)}
+        )
+        right_df = pandas.DataFrame({"phone": ["2", None, "5", "1"], "b": range(4)})
+        task_config = {"component_name": "psi", "inputs": []}
+        for df, path in zip([left_df, right_df], TEST_SORTED_PATHS):
+            df.to_csv(path, index=False)
+            feature = df.columns[1]
+            task_config["inputs"].append(
+                {
+                    "data_path": path,
+                    "schema": {
+                        "ids": ["phone"],
+                        "features": [feature],
+                        "id_types": ["str"],
+                        "feature_types": ["int"],
+                        "labels": [],
+                        "label_types": [],
+                    },
+                    "key": ["phone"],
+                }
+            )
+        expected_df = pandas.read_csv(
+            io.StringIO(left_df.merge(right_df, on="phone").to_csv(index=False))
+        )
+        self.assertEqual(len(expected_df), 4)
+
+        for memory_budget, fingerprint in [
+            (psi.DEFAULT_MEMORY_BUDGET_IN_MB, False),
+            (psi.DEFAULT_MEMORY_BUDGET_IN_MB, True),
+            (0, False),
+        ]:
+            task_config[psi.MEMORY_BUDGET] = memory_budget
+            task_config[psi.KEY_FINGERPRINT] = fingerprint
+            task_config["outputs"] = [
+                {
+                    "data_path": TEST_OUTPUT_PATH,
+                    common.DATA_SCHEMA_PATH: TEST_OUTPUT_SCHEMA_PATH,
+                }
+            ]
+            run_psi(task_config)
+            df = pandas.read_csv(TEST_OUTPUT_PATH)
+            pandas.testing.assert_frame_equal(
+                df.sort_values(["a", "b"], ignore_index=True),
+                expected_df.sort_values(["a", "b"], ignore_index=True),
+            )
+            os.remove(TEST_OUTPUT_PATH)
+            os.remove(TEST_OUTPUT_SCHEMA_PATH)
+        for path in TEST_SORTED_PATHS:
+            os.remove(path)
+
+    def test_part_executor(self):
+        with psi.gen_part_executor(1) as executor:
+            self.assertIsInstance(executor, futures.ProcessPoolExecutor)
+            # workers log as the app does
+            self.assertEqual(
+                executor.submit(logging.getLogger().getEffectiveLevel).result(),
+                logging.getLogger().getEffectiveLevel(),
+            )
+            self.assertTrue(executor.submit(logging.getLogger().hasHandlers).result())
+
+        # pools whose workers can not start fall back to threads
+        pool = mock.MagicMock()
+        pool.submit.return_value.result.side_effect = futures.process.BrokenProcessPool(
+            "spawn failed"
+        )
+        with mock.patch.object(psi.futures, "ProcessPoolExecutor", return_value=pool):
+            with psi.gen_part_executor(1) as executor:
+                self.assertIsInstance(executor, futures.ThreadPoolExecutor)
+        pool.shutdown.assert_called_once()
+
+    def test_plan_psi(self):
+        task_config = json.loads(TEST_CONFIG_JSON)
+        inputs = task_config["inputs"]
+        join_keys = [input["key"] for input in inputs]
+        plan = psi.plan_psi(inputs, join_keys, psi.DEFAULT_MEMORY_BUDGET_IN_MB << 20)
+        self.assertTrue(plan.in_memory)
+        self.assertEqual(plan.output_rows, 569)
+
+        # partitions grow when the budget shrinks
+        plan = psi.plan_psi(inputs, join_keys, plan.input_bytes)
+        self.assertFalse(plan.in_memory)
+        self.assertGreater(plan.file_num, 1)
+        self.assertLessEqual(plan.workers, plan.file_num)
+
+        # duplicate keys fan out the join
+        key_num = psi.estimate_key_num(pandas.DataFrame({"id": [1, 1, 2, 2]}), 4)
+        self.assertEqual(key_num, 2)
+
+    def test_join_explosion(self):
+        with tempfile.TemporaryDirectory() as data_dir:
+            # key -1 has 300 rows in alice and 200 rows in bob
+            alice_ids = list(range(1000)) + [-1] * 300
+            bob_ids = list(range(0, 1000, 2)) * 2 + [-1] * 200
+            output_path = os.path.join(data_dir, TEST_OUTPUT_PATH)
+            task_config = {
+                "component_name": "psi",
+                "inputs": [],
+                "outputs": [
+                    {
+                        common.DATA_PATH: output_path,
+                        common.DATA_SCHEMA_PATH: os.path.join(
+                            data_dir, TEST_OUTPUT_SCHEMA_PATH
+                        ),
+                    }
+                ],
+            }
+            for ids, path, feature in zip(
+                [alice_ids, bob_ids], TEST_SORTED_PATHS, ["a", "b"]
+            ):
+                path = os.path.join(data_dir, path)
+                pandas.DataFrame({"id": ids, feature: range(len(ids))}).to_csv(
+                    path, index=False
+                )
+                task_config["inputs"].append(
+                    {
+                        "data_path": path,
+                        "schema": {
+                            "ids": ["id"],
+                            "features": [feature],
+                            "id_types": ["int"],
+                            "feature_types": ["int"],
+                            "labels": [],
+                            "label_types": [],
+                        },
+                        "key": ["id"],
+                    }
+                )
+            inputs = task_config["inputs"]
+            join_keys = [["id"], ["id"]]
+
+            # small sketches estimate the light keys
+            with mock.patch.object(psi, "HEAVY_KEY_NUM", 8), mock.patch.object(
+                psi, "MULTIPLICITY_SAMPLE_SIZE", 64
+            ):
+                sketches = [
+                    psi.gen_multiplicity_sketch(*args)
+                    for args in zip(inputs, join_keys)
+                ]
+            self.assertEqual(sketches[0].rows, 1300)
+            self.assertFalse(sketches[0].complete)
+            for join_type, expected_rows in [
+                (psi.JOIN_TYPE_INNER, 1000 + 300 * 200),
+                (psi.JOIN_TYPE_LEFT, 1500 + 300 * 200),
+                (psi.JOIN_TYPE_OUTER, 1500 + 300 * 200),
+            ]:
+                rows, max_key_rows = psi.project_output_rows(sketches, join_type)
+                self.assertAlmostEqual(rows / expected_rows, 1, delta=0.05)
+                self.assertAlmostEqual(max_key_rows / (300 * 200), 1, delta=0.05)
+            # exact if sketches hold every key
+            sketches = [
+                psi.gen_multiplicity_sketch(*args) for args in zip(inputs, join_keys)
+            ]
+            self.assertEqual(psi.project_output_rows(sketches), (61000, 60000))
+
+            plan = psi.plan_psi(
+                inputs,
+                join_keys,
+                psi.DEFAULT_MEMORY_BUDGET_IN_MB << 20,
+                sketch_keys=True,
+            )
+            self.assertEqual(plan.output_rows, 61000)
+            self.assertEqual(plan.max_key_rows, 60000)
+            # keys are not scanned unless the output is bounded
+            with mock.patch.object(psi, "gen_multiplicity_sketch") as sketch_mock:
+                plan = psi.plan_psi(
+                    inputs, join_keys, psi.DEFAULT_MEMORY_BUDGET_IN_MB << 20
+                )
+                run_psi(task_config)
+            sketch_mock.assert_not_called()
+            self.assertEqual(plan.max_key_rows, 0)
+            os.remove(output_path)
+
+            # refused before any join
+            task_config[psi.MAX_OUTPUT_ROWS] = 10000
+            for join_method in psi.JOIN_METHODS:
+                task_config[psi.JOIN_METHOD] = join_method
+                with self.assertRaises(psi.JoinExplosionError):
+                    run_psi(task_config)
+                self.assertFalse(os.path.exists(output_path))
+            # rows of a single key can not be split into partitions
+            task_config[psi.MAX_OUTPUT_ROWS] = 10**9
+            task_config[psi.JOIN_METHOD] = psi.JOIN_METHOD_HASH
+            task_config[psi.MEMORY_BUDGET] = 1
+            with mock.patch.object(
+                psi, "project_output_rows", return_value=(61000, 10**6)
+            ):
+                with self.assertRaises(psi.JoinExplosionError):
+                    run_psi(task_config)
+            self.assertFalse(os.path.exists(output_path))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -17,7 +17,6 @@ import json
 import logging
 import sys
 
-from google.protobuf import json_format
 from secretflow.spec.v1 import data_pb2
 from sklearn.model_selection import train_test_split
 from teeapps.biz.common import common
@@ -59,21 +58,12 @@ def run_train_test_split(task_config: dict):
         shuffle=task_config[SHUFFLE],
     )
     # dump output
-    logging.info("Dumping output data...")
-    train_output_path = outputs[0][common.DATA_PATH]
-    test_output_path = outputs[1][common.DATA_PATH]
-    dataset_train.to_csv(train_output_path, index=False)
-    dataset_test.to_csv(test_output_path, index=False)
-    # dump output schema
-    output_schema = data_pb2.TableSchema()
-    common.append_table_schema(output_schema, inputs[0][common.SCHEMA])
-    output_schema = common.gen_output_schema(dataset_train, output_schema)
-    schema_json = json_format.MessageToJson(output_schema)
+    logging.info("Dumping output data and schema...")
+    schema = data_pb2.TableSchema()
+    common.append_table_schema(schema, inputs[0][common.SCHEMA])
     # two dataset is the same schema
-    with open(outputs[0][common.DATA_SCHEMA_PATH], "w") as schema_f:
-        schema_f.write(schema_json)
-    with open(outputs[1][common.DATA_SCHEMA_PATH], "w") as schema_f:
-        schema_f.write(schema_json)
+    common.write_table(dataset_train, outputs[0], schema)
+    common.write_table(dataset_test, outputs[1], schema)
 
 
 def main():
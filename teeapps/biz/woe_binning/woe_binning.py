@@ -150,14 +150,15 @@ def run_woe_binning(task_config: dict):
     assert (
         len(inputs[0][common.SCHEMA][common.FEATURES]) > 0
     ), "features should not be empty"
-    # deal input data
-    logging.info("Dealing input data...")
-    df = common.gen_data_frame(inputs[0])
-
     feature_selects = inputs[0][FEATURE_SELECTS]
     labels = inputs[0][common.SCHEMA][common.LABELS]
     assert len(labels) == 1, f"{COMPONENT_NAME} inputs should have only 1 label"
 
+    # deal input data
+    logging.info("Dealing input data...")
+    usecols = common.plan_usecols(inputs[0], feature_selects, labels)
+    df = common.gen_data_frame(inputs[0], usecols=usecols)
+
     binning_method = task_config[BINNING_METHOD]
     positive_label = task_config[POSITIVE_LABEL]
     bin_num = task_config[BIN_NUM]
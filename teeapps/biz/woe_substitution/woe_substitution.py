@@ -19,7 +19,6 @@ import sys
 
 import numpy as np
 import pandas as pd
-from google.protobuf import json_format
 from secretflow.spec.v1 import data_pb2
 from teeapps.biz.common import common
 
@@ -68,16 +67,10 @@ def run_woe_substitution(task_config: dict):
             df[rule[FEATURE]] = df[rule[FEATURE]].apply(func)
 
     # dump output
-    logging.info("Dumping output...")
-    df.to_csv(outputs[0][common.DATA_PATH], index=False)
-
-    logging.info("Dumping output schema...")
+    logging.info("Dumping output and schema...")
     schema = data_pb2.TableSchema()
     common.append_table_schema(schema, inputs[0][common.SCHEMA])
-    schema = common.gen_output_schema(df, schema)
-    schema_json = json_format.MessageToJson(schema)
-    with open(outputs[0][common.DATA_SCHEMA_PATH], "w") as schema_f:
-        schema_f.write(schema_json)
+    common.write_table(df, outputs[0], schema)
 
 
 def main():
@@ -30,6 +30,7 @@
 #include "ml/train/xgb_component.h"
 #include "preprocessing/feature_filter_component.h"
 #include "preprocessing/psi_component.h"
+#include "preprocessing/psi_count_component.h"
 #include "preprocessing/train_test_split_component.h"
 #include "stats/pearsonr_component.h"
 #include "stats/table_statistics_component.h"
@@ -53,6 +54,7 @@ struct ComponentDomain {
 // component name
 struct ComponentName {
   static constexpr char kPsiComp[] = "psi";
+  static constexpr char kPsiCountComp[] = "psi_count";
   static constexpr char kFeatureFilterComp[] = "feature_filter";
   static constexpr char kTrainTestSplitComp[] = "train_test_split";
   static constexpr char kPearsonrComp[] = "pearsonr";
@@ -76,6 +78,7 @@ constexpr char kCompVersion[] = "0.0.1";
 // python files of component implements
 struct ComponentPyFile {
   static constexpr char kPsiPy[] = "psi.py";
+  static constexpr char kPsiCountPy[] = "psi_count.py";
   static constexpr char kFeatureFilterPy[] = "feature_filter.py";
   static constexpr char kTrainTestSplitPy[] = "train_test_split.py";
   static constexpr char kPearsonrPy[] = "pearsonr.py";
@@ -93,6 +96,7 @@ struct ComponentPyFile {
 
 const std::unordered_map<std::string, std::string> comp_py_map = {
     {ComponentName::kPsiComp, ComponentPyFile::kPsiPy},
+    {ComponentName::kPsiCountComp, ComponentPyFile::kPsiCountPy},
     {ComponentName::kFeatureFilterComp, ComponentPyFile::kFeatureFilterPy},
     {ComponentName::kTrainTestSplitComp, ComponentPyFile::kTrainTestSplitPy},
     {ComponentName::kPearsonrComp, ComponentPyFile::kPearsonrPy},
@@ -121,6 +125,10 @@ const std::map<std::string, secretflow::spec::v1::ComponentDef> COMP_DEF_MAP = {
                      ComponentName::kPsiComp, kCompVersion),
      secretflow::spec::v1::ComponentDef(
          *teeapps::component::PsiComponent::GetInstance().Definition())},
+    {GenCompFullName(ComponentDomain::kPreProcessingDomain,
+                     ComponentName::kPsiCountComp, kCompVersion),
+     secretflow::spec::v1::ComponentDef(
+         *teeapps::component::PsiCountComponent::GetInstance().Definition())},
     {GenCompFullName(ComponentDomain::kPreProcessingDomain,
                      ComponentName::kFeatureFilterComp, kCompVersion),
      secretflow::spec::v1::ComponentDef(
@@ -18,6 +18,19 @@ namespace teeapps {
 namespace component {
 
 void WoeSubstitutionComponent::Init() {
+  AddAttr<std::string>(
+      "output_table_format",
+      "Format of output tables. \"csv\" is plain text, \"arrow\" and "
+      "\"parquet\" are typed columnar tables which are read faster.",
+      false, true, std::vector<std::string>{"csv"},
+      std::vector<std::string>{"csv", "arrow", "parquet"});
+  AddAttr<std::string>(
+      "output_compression",
+      "Compression of outputs. \"zstd\" and \"lz4\" make outputs smaller, "
+      "\"none\" leaves them uncompressed.",
+      false, true, std::vector<std::string>{"none"},
+      std::vector<std::string>{"none", "zstd", "lz4"});
+
   AddIo(IoType::INPUT, "input_data", "Dataset to be substituted.",
         {DistDataType::INDIVIDUAL_TABLE});
   AddIo(IoType::INPUT, "woe_rule", "WOE substitution rule.",
@@ -27,6 +27,21 @@ void BiclassificationComponent::Init() {
                    "require this parameter to be at least 2.",
                    false, true, std::vector<int64_t>{2}, std::nullopt, 2,
                    std::nullopt, true, std::nullopt);
+  AddAttr<float>("head_fpr_thresholds",
+                 "Target false positive rates of the head report. Every "
+                 "case reports the threshold on the roc curve whose false "
+                 "positive rate is the closest to its target.",
+                 true, true,
+                 std::vector<float>{0.001, 0.005, 0.01, 0.05, 0.1, 0.2},
+                 std::nullopt, 0.0, 1.0, true, true);
+  AddAttr<int64_t>(
+      "sketch_bin_num",
+      "0 loads all rows and evaluates exactly. Otherwise rows are read by "
+      "chunks into histograms of about so many equal-width score bins, in "
+      "memory independent of rows. Metrics are evaluated as if every bin is "
+      "a single score, and their error bounds are logged.",
+      false, true, std::vector<int64_t>{0}, std::nullopt, 0, std::nullopt,
+      true, std::nullopt);
 
   AddIo(IoType::INPUT, "predictions", "Input table with predictions",
         {DistDataType::INDIVIDUAL_TABLE},
@@ -35,6 +35,18 @@ void LrPredComponent::Init() {
                        std::vector<std::string>{"id"});
   AddAttr<std::string>("col_names", "Column names into output pred table.",
                        true, true);
+  AddAttr<std::string>(
+      "output_table_format",
+      "Format of output tables. \"csv\" is plain text, \"arrow\" and "
+      "\"parquet\" are typed columnar tables which are read faster.",
+      false, true, std::vector<std::string>{"csv"},
+      std::vector<std::string>{"csv", "arrow", "parquet"});
+  AddAttr<std::string>(
+      "output_compression",
+      "Compression of outputs. \"zstd\" and \"lz4\" make outputs smaller, "
+      "\"none\" leaves them uncompressed.",
+      false, true, std::vector<std::string>{"none"},
+      std::vector<std::string>{"none", "zstd", "lz4"});
 
   AddIo(IoType::INPUT, "feature_dataset", "Input feature dataset.",
         {DistDataType::INDIVIDUAL_TABLE},
@@ -32,6 +32,12 @@ void LgbmTrainComponent::Init() {
   AddAttr<int64_t>("num_leaves", "Max number of leaves in one tree.", false,
                    true, std::vector<int64_t>{31}, std::nullopt, 2, 1024, true,
                    true);
+  AddAttr<std::string>(
+      "output_compression",
+      "Compression of outputs. \"zstd\" and \"lz4\" make outputs smaller, "
+      "\"none\" leaves them uncompressed.",
+      false, true, std::vector<std::string>{"none"},
+      std::vector<std::string>{"none", "zstd", "lz4"});
 
   AddIo(IoType::INPUT, "train_dataset", "Input table.",
         {DistDataType::INDIVIDUAL_TABLE},
@@ -33,6 +33,12 @@ void LrTrainComponent::Init() {
       "penalty", "The penalty(aka regularization term) to be used.", false,
       true, std::vector<std::string>{"l2"},
       std::vector<std::string>{"l1", "l2", "elasticnet", "None"});
+  AddAttr<std::string>(
+      "output_compression",
+      "Compression of outputs. \"zstd\" and \"lz4\" make outputs smaller, "
+      "\"none\" leaves them uncompressed.",
+      false, true, std::vector<std::string>{"none"},
+      std::vector<std::string>{"none", "zstd", "lz4"});
 
   AddIo(IoType::INPUT, "train_dataset", "Input train dataset.",
         {DistDataType::INDIVIDUAL_TABLE},
@@ -83,6 +83,12 @@ void XgbTrainComponent::Init() {
   AddAttr<std::string>("booster", "Which booster to use", false, true,
                        std::vector<std::string>{"gbtree"},
                        std::vector<std::string>{"gbtree", "gblinear", "dart"});
+  AddAttr<std::string>(
+      "output_compression",
+      "Compression of outputs. \"zstd\" and \"lz4\" make outputs smaller, "
+      "\"none\" leaves them uncompressed.",
+      false, true, std::vector<std::string>{"none"},
+      std::vector<std::string>{"none", "zstd", "lz4"});
 
   AddIo(IoType::INPUT, "train_dataset", "Input table.",
         {DistDataType::INDIVIDUAL_TABLE},
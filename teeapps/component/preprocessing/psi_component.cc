@@ -18,6 +18,64 @@ namespace teeapps {
 namespace component {
 
 void PsiComponent::Init() {
+  AddAttr<int64_t>("memory_budget",
+                   "Memory budget in MB. Inputs are joined in memory if the "
+                   "estimated join fits in it, otherwise they are partitioned "
+                   "to files within it. 0 always partitions.",
+                   false, true, std::vector<int64_t>{2048}, std::nullopt, 0,
+                   std::nullopt, true, std::nullopt);
+  AddAttr<int64_t>("worker_num",
+                   "Number of processes joining partitions, bounded by the "
+                   "memory budget. 0 uses as many as the budget allows.",
+                   false, true, std::vector<int64_t>{0}, std::nullopt, 0,
+                   std::nullopt, true, std::nullopt);
+  AddAttr<float>("bloom_filter_fpr",
+                 "False positive rate of the Bloom filter built from the keys "
+                 "of the input with the least keys. Rows of other inputs "
+                 "missing in it are dropped before partitioning. 0 disables "
+                 "it.",
+                 false, true, std::vector<float>{0.01}, std::nullopt, 0.0,
+                 1.0, true, false);
+  AddAttr<std::string>(
+      "join_method",
+      "How to join inputs. \"sort_merge\" declares every input sorted by "
+      "join key in ascending order and joins them by streaming merge. "
+      "\"hash\" always hash joins. \"auto\" merges if sampled rows of "
+      "every input are sorted, and falls back to hash join otherwise.",
+      false, true, std::vector<std::string>{"auto"},
+      std::vector<std::string>{"auto", "hash", "sort_merge"});
+  AddAttr<bool>("key_fingerprint",
+                "Whether composite and non-numeric join keys are indexed and "
+                "joined in memory by their 64-bit fingerprints. Keys of "
+                "colliding fingerprints are compared exactly.",
+                false, true, std::vector<bool>{true});
+
+  AddAttr<std::string>(
+      "join_type",
+      "Which rows to output. \"inner\" outputs rows matched in every input. "
+      "\"left\" also outputs unmatched rows of input1, and \"outer\" "
+      "unmatched rows of every input, with null columns of missing inputs.",
+      false, true, std::vector<std::string>{"inner"},
+      std::vector<std::string>{"inner", "left", "outer"});
+  AddAttr<int64_t>(
+      "max_output_rows",
+      "Psi fails before joining if the output rows projected from sketches "
+      "of join key multiplicities exceed it. 0 disables it.",
+      false, true, std::vector<int64_t>{0}, std::nullopt, 0, std::nullopt,
+      true, std::nullopt);
+  AddAttr<std::string>(
+      "output_table_format",
+      "Format of output tables. \"csv\" is plain text, \"arrow\" and "
+      "\"parquet\" are typed columnar tables which are read faster.",
+      false, true, std::vector<std::string>{"csv"},
+      std::vector<std::string>{"csv", "arrow", "parquet"});
+  AddAttr<std::string>(
+      "output_compression",
+      "Compression of outputs. \"zstd\" and \"lz4\" make outputs smaller, "
+      "\"none\" leaves them uncompressed.",
+      false, true, std::vector<std::string>{"none"},
+      std::vector<std::string>{"none", "zstd", "lz4"});
+
   AddIo(IoType::INPUT, "input1", "Individual table for party 1",
         {DistDataType::INDIVIDUAL_TABLE},
         std::vector<TableColParam>{
@@ -0,0 +1,47 @@
+// Copyright 2023 Ant Group Co., Ltd.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//   http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include "psi_count_component.h"
+
+namespace teeapps {
+namespace component {
+
+void PsiCountComponent::Init() {
+  AddAttr<std::string>(
+      "count_method",
+      "How to count distinct keys. \"exact\" counts sets of 64-bit key "
+      "fingerprints. \"hll\" estimates them by HyperLogLog sketches in "
+      "bounded memory, and intersections by inclusion-exclusion.",
+      false, true, std::vector<std::string>{"exact"},
+      std::vector<std::string>{"exact", "hll"});
+  AddAttr<int64_t>("hll_precision",
+                   "HyperLogLog sketches have 2^hll_precision registers, and "
+                   "a relative standard error of 1.04/sqrt(2^hll_precision).",
+                   false, true, std::vector<int64_t>{14}, std::nullopt, 4, 18,
+                   true, true);
+
+  AddIo(IoType::INPUT, "input1", "Individual table for party 1",
+        {DistDataType::INDIVIDUAL_TABLE},
+        std::vector<TableColParam>{
+            TableColParam("key", "Column(s) used to join.", 1)});
+  AddIo(IoType::INPUT, "input2", "Individual table for party 2",
+        {DistDataType::INDIVIDUAL_TABLE},
+        std::vector<TableColParam>{
+            TableColParam("key", "Column(s) used to join.", 1)});
+  AddIo(IoType::OUTPUT, "report", "Output intersection counts report.",
+        {DistDataType::REPORT});
+}
+
+}  // namespace component
+}  // namespace teeapps
@@ -29,6 +29,18 @@ void TrainTestSplitComponent::Init() {
                    std::nullopt, false, std::nullopt);
   AddAttr<bool>("shuffle", "Whether to shuffle the data before splitting.",
                 false, true, std::vector<bool>{true});
+  AddAttr<std::string>(
+      "output_table_format",
+      "Format of output tables. \"csv\" is plain text, \"arrow\" and "
+      "\"parquet\" are typed columnar tables which are read faster.",
+      false, true, std::vector<std::string>{"csv"},
+      std::vector<std::string>{"csv", "arrow", "parquet"});
+  AddAttr<std::string>(
+      "output_compression",
+      "Compression of outputs. \"zstd\" and \"lz4\" make outputs smaller, "
+      "\"none\" leaves them uncompressed.",
+      false, true, std::vector<std::string>{"none"},
+      std::vector<std::string>{"none", "zstd", "lz4"});
 
   AddIo(IoType::INPUT, "input_data", "Input table.",
         {DistDataType::INDIVIDUAL_TABLE});
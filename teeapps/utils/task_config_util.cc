@@ -14,6 +14,8 @@
 
 #include "teeapps/utils/task_config_util.h"
 
+#include <utility>
+
 #include "rapidjson/document.h"
 #include "rapidjson/prettywriter.h"
 #include "rapidjson/stringbuffer.h"
@@ -38,10 +40,21 @@ constexpr char kDataPath[] = "data_path";
 constexpr char kDataSchemaPath[] = "data_schema_path";
 constexpr char kSchema[] = "schema";
 constexpr char kOutputs[] = "outputs";
+constexpr char kTableFormat[] = "table_format";
+constexpr char kCompression[] = "compression";
+// attr value meaning the output key is left unset
+constexpr char kNone[] = "none";
+
+// component attrs which are also written into every output, keyed by the
+// output key the python apps read
+constexpr std::pair<const char*, const char*> kOutputAttrs[] = {
+    {"output_table_format", kTableFormat},
+    {"output_compression", kCompression},
+};
 
 }  // namespace
 
-void GenAndDumpTaskConfig(
+std::string GenTaskConfig(
     const std::string& app_mode,
     const secretflow::spec::v1::ComponentDef& component_def,
     const teeapps::component::EvalParamReader& eval_param_reader) {
@@ -61,7 +74,7 @@ void GenAndDumpTaskConfig(
         writer.Double(attr_value.f());
         break;
       case secretflow::spec::v1::AttrType::AT_INT:
-        writer.Int(attr_value.i64());
+        writer.Int64(attr_value.i64());
         break;
       case secretflow::spec::v1::AttrType::AT_STRING:
         writer.String(attr_value.s().c_str());
@@ -182,6 +195,18 @@ void GenAndDumpTaskConfig(
     writer.String(GenDataPath(output_id).c_str());
     writer.String(kDataSchemaPath);
     writer.String(GenSchemaPath(output_id).c_str());
+    for (const auto& [attr_name, output_key] : kOutputAttrs) {
+      for (const auto& attr : component_def.attrs()) {
+        if (attr.name() != attr_name) {
+          continue;
+        }
+        const auto& value = eval_param_reader.GetAttr(attr.name()).s();
+        if (value != kNone) {
+          writer.String(output_key);
+          writer.String(value.c_str());
+        }
+      }
+    }
 
     // end of an output
     writer.EndObject();
@@ -191,11 +216,19 @@ void GenAndDumpTaskConfig(
 
   // end of inner task_config_json
   writer.EndObject();
+  return task_config_json.GetString();
+}
 
+void GenAndDumpTaskConfig(
+    const std::string& app_mode,
+    const secretflow::spec::v1::ComponentDef& component_def,
+    const teeapps::component::EvalParamReader& eval_param_reader) {
+  const auto task_config_json =
+      GenTaskConfig(app_mode, component_def, eval_param_reader);
   teeapps::utils::WriteFile(teeapps::framework::kTaskConfigPath,
-                            task_config_json.GetString());
+                            task_config_json);
   SPDLOG_INFO("Dumping task config json succeed...");
-  SPDLOG_DEBUG("Task config json: {}", task_config_json.GetString());
+  SPDLOG_DEBUG("Task config json: {}", task_config_json);
 }
 
 }  // namespace utils
@@ -40,6 +40,11 @@ inline std::string GenSchemaPath(const std::string& data_uri) {
                      data_uri);
 }
 
+std::string GenTaskConfig(
+    const std::string& app_mode,
+    const secretflow::spec::v1::ComponentDef& component_def,
+    const teeapps::component::EvalParamReader& eval_param_reader);
+
 void GenAndDumpTaskConfig(
     const std::string& app_mode,
     const secretflow::spec::v1::ComponentDef& component_def,
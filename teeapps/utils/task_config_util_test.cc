@@ -0,0 +1,63 @@
+// Copyright 2023 Ant Group Co., Ltd.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//   http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include "teeapps/utils/task_config_util.h"
+
+#include "gtest/gtest.h"
+#include "rapidjson/document.h"
+
+namespace teeapps {
+namespace utils {
+
+namespace {
+
+constexpr char kAttrName[] = "max_output_rows";
+constexpr char kOutputUri[] = "file://output/?id=output_uuid&&uri=output";
+// exceeds int32
+constexpr int64_t kLargeInt = (int64_t{1} << 31) + 1;
+
+}  // namespace
+
+TEST(TaskConfigUtilTest, GenTaskConfigLargeInt_shouldOk) {
+  secretflow::spec::v1::ComponentDef component_def;
+  component_def.set_domain("preprocessing");
+  component_def.set_name("psi");
+  component_def.set_version("0.0.1");
+  auto* attr = component_def.add_attrs();
+  attr->set_name(kAttrName);
+  attr->set_type(secretflow::spec::v1::AttrType::AT_INT);
+  attr->mutable_atomic()->set_is_optional(true);
+  component_def.add_outputs()->set_name("output");
+
+  secretflow::spec::v1::NodeEvalParam node_eval_param;
+  node_eval_param.set_domain(component_def.domain());
+  node_eval_param.set_name(component_def.name());
+  node_eval_param.set_version(component_def.version());
+  node_eval_param.add_attr_paths(kAttrName);
+  node_eval_param.add_attrs()->set_i64(kLargeInt);
+  node_eval_param.add_output_uris(kOutputUri);
+  teeapps::component::EvalParamReader eval_param_reader(&node_eval_param,
+                                                        &component_def);
+
+  const auto task_config_json = GenTaskConfig(
+      teeapps::framework::kAppModeLocal, component_def, eval_param_reader);
+  rapidjson::Document doc;
+  doc.Parse(task_config_json.c_str());
+  ASSERT_FALSE(doc.HasParseError());
+  ASSERT_TRUE(doc[kAttrName].IsInt64());
+  EXPECT_EQ(doc[kAttrName].GetInt64(), kLargeInt);
+}
+
+}  // namespace utils
+}  // namespace teeapps